@@ -0,0 +1,53 @@
+"""
+Database Migration: Add classification_responses table
+M-Code Pro - Per-response results index
+
+Creates the table behind "Browse Responses" / /api/results/<id>/responses and,
+on PostgreSQL, the GIN full-text index on the answer text. Jobs completed
+before this migration have no stored responses (only new jobs are indexed).
+Safe to re-run.
+Run with: python add_classification_responses.py
+"""
+
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app, db
+from app.models import ClassificationResponse
+from sqlalchemy import text
+
+def add_classification_responses():
+    """Create classification_responses and its indexes"""
+
+    app = create_app(create_tables=False)
+
+    with app.app_context():
+        print("="*80)
+        print("Database Migration: Add classification_responses Table")
+        print("="*80)
+
+        try:
+            ClassificationResponse.__table__.create(db.engine, checkfirst=True)
+            print("✓ Table 'classification_responses' ready")
+
+            # PostgreSQL: full-text index (also created by the table's after_create hook)
+            if 'postgresql' in str(db.engine.url):
+                db.session.execute(text(
+                    "CREATE INDEX IF NOT EXISTS ix_classification_responses_fts ON classification_responses "
+                    "USING gin (to_tsvector('simple', response))"
+                ))
+                db.session.commit()
+                print("✓ Full-text index 'ix_classification_responses_fts' ready")
+
+            print("\nMigration completed successfully!")
+
+        except Exception as e:
+            print(f"\n❌ Migration failed: {str(e)}")
+            db.session.rollback()
+            raise
+
+if __name__ == '__main__':
+    add_classification_responses()
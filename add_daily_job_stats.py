@@ -0,0 +1,47 @@
+"""
+Database Migration: Add daily_job_stats rollup table
+M-Code Pro - Dashboard statistics
+
+Creates the per-user daily rollup used by the dashboard and fills it from
+existing completed jobs. Safe to re-run (rebuilds the rollup from history).
+Run with: python add_daily_job_stats.py
+"""
+
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app, db
+from app.models import DailyJobStats
+from app.dashboard_stats import rebuild_daily_stats
+
+def add_daily_job_stats():
+    """Create daily_job_stats and backfill it"""
+
+    app = create_app(create_tables=False)
+
+    with app.app_context():
+        print("="*80)
+        print("Database Migration: Add daily_job_stats Table")
+        print("="*80)
+
+        try:
+            DailyJobStats.__table__.create(db.engine, checkfirst=True)
+            print("✓ Table 'daily_job_stats' ready")
+
+            print("Backfilling rollup from completed jobs...")
+            rows = rebuild_daily_stats()
+            db.session.commit()
+
+            print(f"✓ Wrote {rows} daily rollup rows")
+            print("\nMigration completed successfully!")
+
+        except Exception as e:
+            print(f"\n❌ Migration failed: {str(e)}")
+            db.session.rollback()
+            raise
+
+if __name__ == '__main__':
+    add_daily_job_stats()
@@ -0,0 +1,73 @@
+"""
+Database Migration: ON DELETE CASCADE for job children + expiry index
+M-Code Pro - Bulk job deletion / janitor sweep
+
+PostgreSQL: recreates the job_id foreign keys of classification_variables and
+classification_responses with ON DELETE CASCADE, so deleting jobs is a single
+DELETE statement (app/job_cleanup.py). SQLite does not enforce foreign keys;
+children are deleted explicitly there, only the index is added.
+Both: creates ix_classification_jobs_completed (janitor expiry sweep).
+Safe to re-run.
+Run with: python add_job_delete_cascade.py
+"""
+
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app, db
+from app.models import ClassificationJob
+from sqlalchemy import text
+
+CHILD_TABLES = ('classification_variables', 'classification_responses')
+
+def add_job_delete_cascade():
+    """Recreate child foreign keys with ON DELETE CASCADE and add the expiry index"""
+
+    app = create_app(create_tables=False)
+
+    with app.app_context():
+        print("="*80)
+        print("Database Migration: Job Delete Cascade")
+        print("="*80)
+
+        try:
+            inspector = db.inspect(db.engine)
+
+            if db.engine.dialect.name == 'postgresql':
+                for table in CHILD_TABLES:
+                    if table not in inspector.get_table_names():
+                        print(f"- Table '{table}' not found (skipped)")
+                        continue
+                    for fk in inspector.get_foreign_keys(table):
+                        if fk['referred_table'] != 'classification_jobs' or fk['constrained_columns'] != ['job_id']:
+                            continue
+                        if (fk.get('options') or {}).get('ondelete', '').upper() == 'CASCADE':
+                            print(f"✓ {table}.job_id already cascades")
+                            continue
+                        db.session.execute(text(f'ALTER TABLE {table} DROP CONSTRAINT "{fk["name"]}"'))
+                        db.session.execute(text(
+                            f'ALTER TABLE {table} ADD CONSTRAINT "{fk["name"]}" FOREIGN KEY (job_id) '
+                            f'REFERENCES classification_jobs (id) ON DELETE CASCADE'
+                        ))
+                        print(f"✓ {table}.job_id now ON DELETE CASCADE")
+                db.session.commit()
+            else:
+                print("- SQLite: foreign keys not enforced, children are deleted explicitly")
+
+            for index in ClassificationJob.__table__.indexes:
+                if index.name == 'ix_classification_jobs_completed':
+                    index.create(db.engine, checkfirst=True)
+                    print(f"✓ Index '{index.name}' ready")
+
+            print("\nMigration completed successfully!")
+
+        except Exception as e:
+            print(f"\n❌ Migration failed: {str(e)}")
+            db.session.rollback()
+            raise
+
+if __name__ == '__main__':
+    add_job_delete_cascade()
@@ -0,0 +1,46 @@
+"""
+Database Migration: Add job history indexes to classification_jobs table
+M-Code Pro - Keyset pagination
+
+Adds composite indexes used by the paginated job lists (/results, /jobs,
+/api/jobs, admin user jobs): (user_id, status, created_at),
+(user_id, created_at) and (user_id, status, completed_at). Safe to re-run.
+Run with: python add_job_list_indexes.py
+"""
+
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app, db
+from app.models import ClassificationJob
+
+INDEX_NAMES = ('ix_classification_jobs_user_status_created', 'ix_classification_jobs_user_created',
+               'ix_classification_jobs_user_status_completed')
+
+def add_job_list_indexes():
+    """Create the keyset pagination indexes if missing"""
+
+    app = create_app(create_tables=False)
+
+    with app.app_context():
+        print("="*80)
+        print("Database Migration: Add Job History Indexes")
+        print("="*80)
+
+        try:
+            for index in ClassificationJob.__table__.indexes:
+                if index.name in INDEX_NAMES:
+                    index.create(db.engine, checkfirst=True)
+                    print(f"✓ Index '{index.name}' ready")
+
+            print("\nMigration completed successfully!")
+
+        except Exception as e:
+            print(f"\n❌ Migration failed: {str(e)}")
+            raise
+
+if __name__ == '__main__':
+    add_job_list_indexes()
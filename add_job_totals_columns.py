@@ -0,0 +1,70 @@
+"""
+Database Migration: Add denormalized totals to classification_jobs table
+M-Code Pro - Admin analytics in SQL
+
+Adds total_variables, total_responses and total_categories columns (written by
+the tasks at completion) and backfills them from classification_variables.
+Safe to re-run (missing columns are added, totals are recomputed).
+Run with: python add_job_totals_columns.py
+"""
+
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app, db
+from sqlalchemy import text
+
+TOTAL_COLUMNS = ('total_variables', 'total_responses', 'total_categories')
+
+def add_job_totals_columns():
+    """Add job total columns and backfill them with one UPDATE"""
+
+    app = create_app(create_tables=False)
+
+    with app.app_context():
+        print("="*80)
+        print("Database Migration: Add Job Totals Columns")
+        print("="*80)
+
+        try:
+            inspector = db.inspect(db.engine)
+            columns = [col['name'] for col in inspector.get_columns('classification_jobs')]
+
+            # Same syntax for PostgreSQL and SQLite
+            for column in TOTAL_COLUMNS:
+                if column in columns:
+                    print(f"✓ Column '{column}' already exists")
+                    continue
+                db.session.execute(text(
+                    f"ALTER TABLE classification_jobs ADD COLUMN {column} INTEGER DEFAULT 0"
+                ))
+                print(f"✓ Added column '{column}'")
+
+            print("Backfilling totals from classification_variables...")
+            result = db.session.execute(text("""
+                UPDATE classification_jobs SET
+                    total_variables = (
+                        SELECT COUNT(*) FROM classification_variables v
+                        WHERE v.job_id = classification_jobs.id),
+                    total_responses = (
+                        SELECT COALESCE(SUM(v.total_responses), 0) FROM classification_variables v
+                        WHERE v.job_id = classification_jobs.id),
+                    total_categories = (
+                        SELECT COALESCE(SUM(v.categories_generated), 0) FROM classification_variables v
+                        WHERE v.job_id = classification_jobs.id)
+            """))
+            db.session.commit()
+
+            print(f"✓ Updated {result.rowcount} jobs")
+            print("\nMigration completed successfully!")
+
+        except Exception as e:
+            print(f"\n❌ Migration failed: {str(e)}")
+            db.session.rollback()
+            raise
+
+if __name__ == '__main__':
+    add_job_totals_columns()
@@ -14,12 +14,17 @@ migrate = Migrate()
 login_manager = LoginManager()
 csrf = CSRFProtect()
 
-def create_app(config_name='default'):
+# Process-wide app for background code (see get_app)
+_shared_app = None
+
+def create_app(config_name='default', register_blueprints=True, create_tables=True):
     """
     Application factory pattern
     
     Args:
         config_name: Configuration to use (development, production)
+        register_blueprints: Register web routes (not needed by Celery workers)
+        create_tables: Run db.create_all() (web app / setup scripts only)
     
     Returns:
         Flask application instance
@@ -39,14 +44,33 @@ def create_app(config_name='default'):
     login_manager.login_message_category = 'warning'
     
     # Register blueprints
-    from app.auth import auth_bp
-    from app.routes import main_bp
-    
-    app.register_blueprint(auth_bp)
-    app.register_blueprint(main_bp)
+    if register_blueprints:
+        from app.auth import auth_bp
+        from app.routes import main_bp
+        
+        app.register_blueprint(auth_bp)
+        app.register_blueprint(main_bp)
     
     # Create database tables
-    with app.app_context():
-        db.create_all()
+    if create_tables:
+        with app.app_context():
+            db.create_all()
     
     return app
+
+def get_app():
+    """
+    One Flask app (and DB engine) per process for background code
+    
+    Celery tasks and the classifiers only need models + db, so the app is
+    built once without blueprints or create_all and reused by every task.
+    Built on first use, or eagerly by the worker_process_init hook in
+    celery_app.py.
+    
+    Returns:
+        Flask application instance
+    """
+    global _shared_app
+    if _shared_app is None:
+        _shared_app = create_app(register_blueprints=False, create_tables=False)
+    return _shared_app
@@ -0,0 +1,295 @@
+"""
+Dashboard Statistics
+KPI dashboard dari rollup harian (DailyJobStats), bukan scan histori job.
+
+- record_job_completion(): dipanggil task saat job selesai, menambah counter
+  harian user (satu UPDATE, INSERT kalau baris hari itu belum ada)
+- record_job_deletions(): dipanggil app/job_cleanup.py delete_jobs, mengurangi
+  counter hari-hari job completed yang dihapus (satu UPDATE per hari)
+- dashboard_snapshot(): 2 query kecil ke rollup (totals + trend, chart 30 hari),
+  di-cache di Redis selama DASHBOARD_CACHE_SECONDS
+- rebuild_daily_stats(): isi ulang rollup dari histori (migrasi / perbaikan)
+
+Hari = tanggal UTC dari completed_at.
+"""
+import os
+import json
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+import redis
+
+from app import db
+
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379')
+redis_client = redis.from_url(REDIS_URL + '/2', decode_responses=True)  # DB 2 (same as progress)
+
+CACHE_SECONDS = int(os.getenv('DASHBOARD_CACHE_SECONDS', '30'))
+CHART_DAYS = 30
+
+COUNTERS = ('jobs_completed', 'pure_jobs', 'semi_jobs', 'variables_completed', 'responses_classified')
+
+
+def _cache_key(user_id=None, company_id=None) -> str:
+    return f"dashboard:user:{user_id}" if user_id is not None else f"dashboard:company:{company_id}"
+
+
+def invalidate_dashboard(user_id=None, company_id=None):
+    """Drop cached snapshots so the next dashboard load recomputes"""
+    keys = []
+    if user_id is not None:
+        keys.append(_cache_key(user_id=user_id))
+    if company_id is not None:
+        keys.append(_cache_key(company_id=company_id))
+    try:
+        if keys:
+            redis_client.delete(*keys)
+    except redis.RedisError as e:
+        print(f"[DASHBOARD WARNING] Cache invalidation failed: {e}", flush=True)
+
+
+def record_job_completion(job):
+    """
+    Add a completed job to its user's daily rollup
+
+    Call inside the completion transaction, after job.update_totals()
+    (the caller commits). Runs in a savepoint: a rollup failure is logged
+    and never fails the job.
+
+    Args:
+        job: ClassificationJob (status 'completed', completed_at set)
+    """
+    from sqlalchemy.exc import IntegrityError
+    from app.models import DailyJobStats, User
+
+    try:
+        with db.session.begin_nested():
+            increments = _increments(job)
+            day = (job.completed_at or datetime.utcnow()).date()
+            company_id = db.session.query(User.company_id).filter(User.id == job.user_id).scalar()
+
+            values = {getattr(DailyJobStats, name): getattr(DailyJobStats, name) + amount
+                      for name, amount in increments.items()}
+            values[DailyJobStats.updated_at] = datetime.utcnow()
+            row_filter = DailyJobStats.query.filter_by(day=day, user_id=job.user_id)
+
+            if not row_filter.update(values, synchronize_session=False):
+                try:
+                    with db.session.begin_nested():
+                        db.session.add(DailyJobStats(day=day, user_id=job.user_id, company_id=company_id, **increments))
+                except IntegrityError:
+                    # Another worker created today's row first
+                    row_filter.update(values, synchronize_session=False)
+    except Exception as e:
+        print(f"[DASHBOARD WARNING] Rollup update failed for job {job.job_id}: {e}", flush=True)
+        return
+
+    invalidate_dashboard(user_id=job.user_id, company_id=company_id)
+
+
+def _increments(job) -> Dict[str, int]:
+    """Rollup counters one completed job contributes"""
+    is_semi = job.job_type == 'semi_open'
+    return {
+        'jobs_completed': 1,
+        'pure_jobs': 0 if is_semi else 1,
+        'semi_jobs': 1 if is_semi else 0,
+        'variables_completed': job.total_variables or 0,
+        'responses_classified': job.total_responses or 0
+    }
+
+
+def record_job_deletions(user_id: int, jobs):
+    """
+    Subtract deleted jobs from their user's daily rollup
+
+    Call in the delete transaction (the caller commits), so the totals keep
+    counting live jobs only. Jobs that never completed are not in the rollup
+    and are ignored. Runs in a savepoint: a rollup failure is logged and
+    never fails the delete.
+
+    Args:
+        user_id: Owner of the deleted jobs
+        jobs: Deleted rows (status, completed_at, job_type, total_variables, total_responses)
+    """
+    from app.models import DailyJobStats, User
+
+    per_day: Dict = {}
+    for job in jobs:
+        if job.status != 'completed' or job.completed_at is None:
+            continue
+        day_totals = per_day.setdefault(job.completed_at.date(), dict.fromkeys(COUNTERS, 0))
+        for name, amount in _increments(job).items():
+            day_totals[name] += amount
+    if not per_day:
+        return
+
+    try:
+        with db.session.begin_nested():
+            for day, decrements in per_day.items():
+                values = {getattr(DailyJobStats, name): getattr(DailyJobStats, name) - amount
+                          for name, amount in decrements.items()}
+                values[DailyJobStats.updated_at] = datetime.utcnow()
+                DailyJobStats.query.filter_by(day=day, user_id=user_id).update(values, synchronize_session=False)
+            company_id = db.session.query(User.company_id).filter(User.id == user_id).scalar()
+    except Exception as e:
+        print(f"[DASHBOARD WARNING] Rollup update failed for deleted jobs of user {user_id}: {e}", flush=True)
+        return
+
+    invalidate_dashboard(user_id=user_id, company_id=company_id)
+
+
+def _trend(current, previous) -> float:
+    if previous > 0:
+        return ((current - previous) / previous) * 100
+    return 100 if current > 0 else 0
+
+
+def _compute_snapshot(user_id=None, company_id=None) -> Dict:
+    from sqlalchemy import and_, case, func
+    from app.models import DailyJobStats
+
+    if user_id is not None:
+        scope = DailyJobStats.user_id == user_id
+    else:
+        scope = DailyJobStats.company_id == company_id
+
+    today = datetime.utcnow().date()
+    last_7 = DailyJobStats.day > today - timedelta(days=7)
+    prev_7 = and_(DailyJobStats.day > today - timedelta(days=14), DailyJobStats.day <= today - timedelta(days=7))
+
+    def total(column, window=None):
+        if window is not None:
+            column = case((window, column), else_=0)
+        return func.coalesce(func.sum(column), 0)
+
+    totals = db.session.query(
+        total(DailyJobStats.jobs_completed),
+        total(DailyJobStats.responses_classified),
+        total(DailyJobStats.variables_completed),
+        total(DailyJobStats.pure_jobs),
+        total(DailyJobStats.semi_jobs),
+        total(DailyJobStats.jobs_completed, last_7),
+        total(DailyJobStats.jobs_completed, prev_7),
+        total(DailyJobStats.responses_classified, last_7),
+        total(DailyJobStats.responses_classified, prev_7)
+    ).filter(scope).one()
+    (jobs, responses, variables, pure, semi,
+     jobs_last_7, jobs_prev_7, responses_last_7, responses_prev_7) = [int(value) for value in totals]
+
+    chart_rows = db.session.query(
+        DailyJobStats.day,
+        func.sum(DailyJobStats.jobs_completed)
+    ).filter(
+        scope,
+        DailyJobStats.day >= today - timedelta(days=CHART_DAYS),
+        DailyJobStats.jobs_completed > 0
+    ).group_by(DailyJobStats.day).order_by(DailyJobStats.day).all()
+
+    return {
+        'total_classifications': jobs,
+        'total_responses': responses,
+        'total_variables': variables,
+        'classifications_trend': round(_trend(jobs_last_7, jobs_prev_7), 1),
+        'responses_trend': round(_trend(responses_last_7, responses_prev_7), 1),
+        'chart_labels': [day.strftime('%b %d') for day, _ in chart_rows],
+        'chart_data': [int(count) for _, count in chart_rows],
+        'pure_count': pure,
+        'semi_count': semi
+    }
+
+
+def dashboard_snapshot(user_id=None, company_id=None) -> Dict:
+    """
+    Dashboard KPIs for a user (or a whole company), cached briefly
+
+    Args:
+        user_id: User to summarize
+        company_id: Company to summarize (when user_id is None)
+
+    Returns:
+        dict: total_classifications, total_responses, total_variables,
+              classifications_trend, responses_trend, chart_labels,
+              chart_data, pure_count, semi_count
+    """
+    key = _cache_key(user_id, company_id)
+    try:
+        cached = redis_client.get(key)
+        if cached:
+            return json.loads(cached)
+    except redis.RedisError as e:
+        print(f"[DASHBOARD WARNING] Cache read failed: {e}", flush=True)
+
+    snapshot = _compute_snapshot(user_id, company_id)
+
+    try:
+        redis_client.setex(key, CACHE_SECONDS, json.dumps(snapshot))
+    except redis.RedisError as e:
+        print(f"[DASHBOARD WARNING] Cache write failed: {e}", flush=True)
+    return snapshot
+
+
+def rebuild_daily_stats(user_id: Optional[int] = None) -> int:
+    """
+    Recompute rollup rows from completed jobs (one GROUP BY over history)
+
+    Args:
+        user_id: Only this user (default: everyone)
+
+    Returns:
+        int: Number of rollup rows written (caller commits)
+    """
+    from sqlalchemy import case, func
+    from app.models import ClassificationJob, ClassificationVariable, DailyJobStats, User
+
+    day = func.date(ClassificationJob.completed_at)
+    per_job = db.session.query(
+        ClassificationVariable.job_id.label('job_id'),
+        func.count(ClassificationVariable.id).label('variables'),
+        func.coalesce(func.sum(ClassificationVariable.total_responses), 0).label('responses')
+    ).group_by(ClassificationVariable.job_id).subquery()
+
+    query = db.session.query(
+        day.label('day'),
+        ClassificationJob.user_id,
+        User.company_id,
+        func.count(ClassificationJob.id),
+        func.sum(case((ClassificationJob.job_type == 'semi_open', 0), else_=1)),
+        func.sum(case((ClassificationJob.job_type == 'semi_open', 1), else_=0)),
+        func.coalesce(func.sum(per_job.c.variables), 0),
+        func.coalesce(func.sum(per_job.c.responses), 0)
+    ).join(User, User.id == ClassificationJob.user_id).outerjoin(
+        per_job, per_job.c.job_id == ClassificationJob.id
+    ).filter(
+        ClassificationJob.status == 'completed',
+        ClassificationJob.completed_at.isnot(None)
+    )
+
+    delete_query = DailyJobStats.query
+    if user_id is not None:
+        query = query.filter(ClassificationJob.user_id == user_id)
+        delete_query = delete_query.filter_by(user_id=user_id)
+
+    delete_query.delete(synchronize_session=False)
+
+    rows = 0
+    for row_day, row_user_id, row_company_id, jobs, pure, semi, variables, responses in \
+            query.group_by(day, ClassificationJob.user_id, User.company_id).all():
+        if isinstance(row_day, str):
+            row_day = datetime.strptime(row_day, '%Y-%m-%d').date()  # SQLite returns text
+        db.session.add(DailyJobStats(
+            day=row_day,
+            user_id=row_user_id,
+            company_id=row_company_id,
+            jobs_completed=int(jobs),
+            pure_jobs=int(pure),
+            semi_jobs=int(semi),
+            variables_completed=int(variables),
+            responses_classified=int(responses)
+        ))
+        rows += 1
+
+    return rows
+
+
+__all__ = ['record_job_completion', 'record_job_deletions', 'dashboard_snapshot', 'invalidate_dashboard', 'rebuild_daily_stats']
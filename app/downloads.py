@@ -0,0 +1,146 @@
+"""
+Download Bundles
+ZIP hasil job (output kobo + output raw) dibuat SEKALI saat job selesai,
+disimpan di sebelah file output, lalu dikirim oleh nginx.
+
+- build_bundle(): ZIP_STORED (xlsx sudah terkompresi, deflate ulang cuma buang CPU),
+  ditulis atomik (.tmp -> rename), lalu di-publish ke storage.py
+- send_bundle(): storage local + DOWNLOAD_ACCEL_PREFIX di-set -> response kosong
+  dengan header X-Accel-Redirect (nginx yang baca file dari disk, lihat nginx.conf
+  location /protected-output/); storage local tanpa prefix -> send_file() dari disk;
+  storage s3 -> stream object per chunk (tidak ditampung di memori / disk web host)
+
+Layout: output/output_raw_<ts>.xlsx -> output/output_raw_<ts>.zip (key storage;
+path *_path job = reference storage, bundle_path_for() berlaku untuk keduanya)
+"""
+import os
+import re
+import zipfile
+from typing import Optional
+
+from storage import get_storage, TRANSFER_CHUNK_SIZE
+
+
+def bundle_path_for(output_raw_path: str) -> str:
+    """Where the download bundle of a job lives (next to its outputs; path or storage ref)"""
+    return os.path.splitext(output_raw_path)[0] + '.zip'
+
+
+def bundle_name(job) -> str:
+    """Download filename: original name + completion timestamp"""
+    original_base = re.sub(r'\d+\.xlsx$', '', job.original_raw_filename or 'results')
+    completed = job.completed_at.strftime('%Y%m%d_%H%M%S') if job.completed_at else 'job'
+    return f"classified_{original_base}_{completed}.zip"
+
+
+def build_bundle(output_kobo_path: str, output_raw_path: str) -> str:
+    """
+    Write the ZIP of both output workbooks (no recompression) and publish it
+
+    Args:
+        output_kobo_path: Output kobo_system workbook (local file)
+        output_raw_path: Output raw data workbook (local file)
+
+    Returns:
+        str: Bundle storage ref
+    """
+    bundle_path = bundle_path_for(output_raw_path)
+    tmp_path = f'{bundle_path}.tmp'
+    with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_STORED) as zf:
+        zf.write(output_kobo_path, arcname=os.path.basename(output_kobo_path))
+        zf.write(output_raw_path, arcname=os.path.basename(output_raw_path))
+    os.replace(tmp_path, bundle_path)
+    # Served from storage (stream / nginx), never read locally again
+    return get_storage().publish(bundle_path, keep_local=False)
+
+
+def build_bundle_quietly(output_kobo_path: str, output_raw_path: str) -> Optional[str]:
+    """build_bundle() for task completion: a failure is logged, the download route rebuilds"""
+    try:
+        bundle_path = build_bundle(output_kobo_path, output_raw_path)
+        print(f"[DOWNLOAD] Bundle ready: {os.path.basename(bundle_path)}", flush=True)
+        return bundle_path
+    except Exception as e:
+        print(f"[DOWNLOAD WARNING] Bundle build failed for {output_raw_path}: {e}", flush=True)
+        return None
+
+
+def ensure_bundle(job) -> str:
+    """Bundle ref of a job, building it if missing (jobs finished before bundles existed)"""
+    storage = get_storage()
+    bundle_ref = bundle_path_for(job.output_raw_path)
+    if not storage.exists(bundle_ref):
+        bundle_ref = build_bundle(storage.fetch(job.output_kobo_path), storage.fetch(job.output_raw_path))
+        # Web host: drop the outputs fetched just for the bundle
+        storage.evict(job.output_kobo_path)
+        storage.evict(job.output_raw_path)
+    return bundle_ref
+
+
+def _stream_response(storage, bundle_ref: str, download_name: str):
+    """Stream a stored object in chunks (remote storage)"""
+    from flask import Response, stream_with_context
+
+    body = storage.open(bundle_ref)
+
+    def generate():
+        try:
+            for chunk in iter(lambda: body.read(TRANSFER_CHUNK_SIZE), b''):
+                yield chunk
+        finally:
+            body.close()
+
+    response = Response(stream_with_context(generate()), mimetype='application/zip')
+    response.headers['Content-Length'] = str(storage.size(bundle_ref))
+    response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def send_bundle(job):
+    """
+    Response for downloading a job's bundle
+
+    Returns:
+        flask.Response: X-Accel-Redirect handoff, or a streamed file / object
+    """
+    from flask import current_app, send_file, Response
+
+    storage = get_storage()
+    bundle_path = ensure_bundle(job)
+    download_name = bundle_name(job)
+    if not storage.is_local(bundle_path):
+        return _stream_response(storage, bundle_path, download_name)
+
+    accel_prefix = current_app.config.get('DOWNLOAD_ACCEL_PREFIX')
+    output_folder = current_app.config.get('OUTPUT_FOLDER')
+
+    if accel_prefix and output_folder:
+        relative = os.path.relpath(bundle_path, output_folder)
+        if not relative.startswith('..'):
+            response = Response(mimetype='application/zip')
+            response.headers['X-Accel-Redirect'] = f"{accel_prefix.rstrip('/')}/{relative.replace(os.sep, '/')}"
+            response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+
+    # Fallback: stream from disk (werkzeug file wrapper, never loaded whole)
+    response = send_file(bundle_path, mimetype='application/zip', as_attachment=True,
+                         download_name=download_name, conditional=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def remove_bundle(output_raw_path: Optional[str]):
+    """Delete a job's bundle if present (when its outputs are deleted)"""
+    if not output_raw_path:
+        return
+    bundle_path = bundle_path_for(output_raw_path)
+    try:
+        get_storage().delete(bundle_path)
+    except Exception as e:
+        print(f"[DOWNLOAD WARNING] Failed to delete {bundle_path}: {e}", flush=True)
+
+
+__all__ = ['build_bundle', 'build_bundle_quietly', 'ensure_bundle', 'send_bundle', 'remove_bundle',
+           'bundle_path_for', 'bundle_name']
@@ -6,6 +6,21 @@ import sib_api_v3_sdk
 from sib_api_v3_sdk.rest import ApiException
 from app.models import SystemSettings
 
+# (connect, read) seconds: a slow Brevo API must not hold a worker/greenlet indefinitely
+BREVO_TIMEOUT = (float(os.getenv('BREVO_CONNECT_TIMEOUT', '5')), float(os.getenv('BREVO_READ_TIMEOUT', '15')))
+
+# One API client (urllib3 connection pool) per API key and process, reused by every request
+_api_clients = {}
+
+def _api_client(api_key):
+    """Shared Brevo API client for api_key (keeps TLS connections alive between emails)"""
+    client = _api_clients.get(api_key)
+    if client is None:
+        configuration = sib_api_v3_sdk.Configuration()
+        configuration.api_key['api-key'] = api_key
+        client = _api_clients[api_key] = sib_api_v3_sdk.ApiClient(configuration)
+    return client
+
 class EmailService:
     """Email service for sending OTP and notifications via Brevo"""
     
@@ -18,7 +33,7 @@ class EmailService:
         
         if self.api_key:
             self.configuration.api_key['api-key'] = self.api_key
-            self.api_instance = sib_api_v3_sdk.TransactionalEmailsApi(sib_api_v3_sdk.ApiClient(self.configuration))
+            self.api_instance = sib_api_v3_sdk.TransactionalEmailsApi(_api_client(self.api_key))
         else:
             self.api_instance = None
     
@@ -110,7 +125,7 @@ class EmailService:
             )
             
             # Send email
-            api_response = self.api_instance.send_transac_email(send_smtp_email)
+            api_response = self.api_instance.send_transac_email(send_smtp_email, _request_timeout=BREVO_TIMEOUT)
             return True, f"OTP sent successfully to {recipient_email}"
             
         except ApiException as e:
@@ -209,7 +224,7 @@ class EmailService:
             )
             
             # Send email
-            api_response = self.api_instance.send_transac_email(send_smtp_email)
+            api_response = self.api_instance.send_transac_email(send_smtp_email, _request_timeout=BREVO_TIMEOUT)
             return True, f"Verification code sent successfully to {recipient_email}"
             
         except ApiException as e:
@@ -289,7 +304,7 @@ class EmailService:
                 html_content=html_content
             )
             
-            api_response = self.api_instance.send_transac_email(send_smtp_email)
+            api_response = self.api_instance.send_transac_email(send_smtp_email, _request_timeout=BREVO_TIMEOUT)
             return True, "Notification sent successfully"
             
         except Exception as e:
@@ -308,8 +323,8 @@ class EmailService:
         
         try:
             # Try to get account info
-            api_instance = sib_api_v3_sdk.AccountApi(sib_api_v3_sdk.ApiClient(self.configuration))
-            account_info = api_instance.get_account()
+            api_instance = sib_api_v3_sdk.AccountApi(_api_client(self.api_key))
+            account_info = api_instance.get_account(_request_timeout=BREVO_TIMEOUT)
             return True, f"Connected successfully. Account: {account_info.email}"
         except ApiException as e:
             return False, f"Connection failed: {str(e)}"
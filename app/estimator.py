@@ -0,0 +1,363 @@
+"""
+Job Estimator
+Prediksi tokens, API calls, wall time, dan queue wait SEBELUM job dijalankan.
+
+- Throughput (detik per variable) di-fit dari histori ClassificationVariable
+  (durasi vs jumlah jawaban terisi) per job_type; default dipakai kalau histori belum cukup
+- Tokens & API calls dihitung dari profil upload (jumlah jawaban, jawaban unik,
+  panjang rata-rata, jumlah kategori) mengikuti cara classifier memanggil OpenAI
+- Wall time: variables/pairs jalan paralel (chord) di slot worker lane-nya
+- Queue wait: simulasi scheduler seolah job di-submit sekarang
+"""
+import os
+import math
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+def _env_int(name, default):
+    return int(os.getenv(name, str(default)))
+
+
+def _env_float(name, default):
+    return float(os.getenv(name, str(default)))
+
+
+# Mirrors classifier behaviour (excel_classifier / semi_open_processor)
+CLASSIFY_BATCH_SIZE = 10
+OUTLIER_MIN_COUNT = 10
+CHARS_PER_TOKEN = 4
+
+
+class JobEstimator:
+    """Estimate job cost + duration from history and upload profile"""
+
+    def __init__(self):
+        # Prompt size model (tokens)
+        self.classify_prompt_tokens = _env_int('EST_CLASSIFY_PROMPT_TOKENS', 700)
+        self.category_prompt_tokens = _env_int('EST_CATEGORY_PROMPT_TOKENS', 500)
+        self.tokens_per_category = _env_int('EST_TOKENS_PER_CATEGORY', 12)
+        self.completion_tokens_per_response = _env_int('EST_COMPLETION_TOKENS_PER_RESPONSE', 20)
+        self.max_sample_size = _env_int('MAX_SAMPLE_SIZE', 500)
+        self.outlier_rate = _env_float('EST_OUTLIER_RATE', 0.10)
+
+        # Pricing (USD per 1M tokens, default gpt-4o-mini)
+        self.price_input = _env_float('EST_PRICE_INPUT_PER_1M', 0.15)
+        self.price_output = _env_float('EST_PRICE_OUTPUT_PER_1M', 0.60)
+
+        # Throughput fallback (no history yet)
+        self.default_seconds_per_variable = _env_float('SCHED_SECONDS_PER_VARIABLE', 30)
+        self.default_seconds_per_response = _env_float('SCHED_SECONDS_PER_RESPONSE', 0.05)
+        self.default_job_overhead = _env_float('EST_JOB_OVERHEAD_SECONDS', 20)
+
+        # History window
+        self.history_limit = _env_int('EST_HISTORY_LIMIT', 500)
+        self.min_samples = _env_int('EST_MIN_SAMPLES', 5)
+        self.cache_seconds = _env_int('EST_CACHE_SECONDS', 300)
+
+        self._model_cache = {}  # job_type -> (expires_at, model)
+
+    # ------------------------------------------------------------------
+    # Throughput model (history)
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _fit_line(samples: List[Tuple[float, float]]) -> Optional[Tuple[float, float]]:
+        """Least squares seconds = intercept + slope * responses (None if degenerate)"""
+        n = len(samples)
+        if n < 2:
+            return None
+
+        mean_x = sum(x for x, _ in samples) / n
+        mean_y = sum(y for _, y in samples) / n
+        var_x = sum((x - mean_x) ** 2 for x, _ in samples)
+        if var_x == 0:
+            return None
+
+        slope = sum((x - mean_x) * (y - mean_y) for x, y in samples) / var_x
+        if slope <= 0:
+            return None
+        return max(mean_y - slope * mean_x, 0.0), slope
+
+    @staticmethod
+    def _median(values: List[float]) -> Optional[float]:
+        if not values:
+            return None
+        values = sorted(values)
+        mid = len(values) // 2
+        return values[mid] if len(values) % 2 else (values[mid - 1] + values[mid]) / 2
+
+    def _load_model(self, job_type: str) -> Dict:
+        """
+        Fit throughput for one job type from recent completed variables
+
+        Returns:
+            dict: {'intercept', 'slope', 'overhead', 'avg_categories', 'samples', 'basis'}
+        """
+        model = {
+            'intercept': self.default_seconds_per_variable,
+            'slope': self.default_seconds_per_response,
+            'overhead': self.default_job_overhead,
+            'avg_categories': None,
+            'samples': 0,
+            'basis': 'default'
+        }
+
+        try:
+            from app import db
+            from app.models import ClassificationJob, ClassificationVariable
+
+            rows = db.session.query(
+                ClassificationVariable.job_id,
+                ClassificationVariable.total_responses,
+                ClassificationVariable.valid_classified,
+                ClassificationVariable.invalid_count,
+                ClassificationVariable.categories_generated,
+                ClassificationVariable.started_at,
+                ClassificationVariable.completed_at,
+                ClassificationJob.started_at,
+                ClassificationJob.completed_at
+            ).join(
+                ClassificationJob, ClassificationVariable.job_id == ClassificationJob.id
+            ).filter(
+                ClassificationJob.job_type == job_type,
+                ClassificationJob.status == 'completed',
+                ClassificationVariable.status == 'completed',
+                ClassificationVariable.total_responses > 0,
+                ClassificationVariable.started_at.isnot(None),
+                ClassificationVariable.completed_at.isnot(None)
+            ).order_by(
+                ClassificationVariable.id.desc()
+            ).limit(self.history_limit).all()
+        except Exception as e:
+            print(f"[ESTIMATOR WARNING] History query failed: {e}", flush=True)
+            return model
+
+        samples = []
+        categories = []
+        longest_by_job = {}
+        job_duration = {}
+        for job_db_id, total, valid, invalid, cats, var_start, var_end, job_start, job_end in rows:
+            seconds = (var_end - var_start).total_seconds()
+            if seconds < 1:
+                # Legacy rows (start == end) carry no timing
+                continue
+            # Non-empty responses processed (total_responses also counts empty rows)
+            responses = (valid or 0) + (invalid or 0) or total
+            samples.append((float(responses), seconds))
+            if cats:
+                categories.append(cats)
+            longest_by_job[job_db_id] = max(longest_by_job.get(job_db_id, 0.0), seconds)
+            if job_start and job_end:
+                job_duration[job_db_id] = (job_end - job_start).total_seconds()
+
+        fit = self._fit_line(samples) if len(samples) >= self.min_samples else None
+        if fit:
+            model['intercept'], model['slope'] = fit
+            model['samples'] = len(samples)
+            model['basis'] = 'history'
+
+            # Job overhead = read/cache + merge/write around the longest variable
+            overhead = self._median([
+                job_duration[job] - longest for job, longest in longest_by_job.items()
+                if job in job_duration and job_duration[job] >= longest
+            ])
+            if overhead is not None:
+                model['overhead'] = overhead
+
+        if categories:
+            model['avg_categories'] = sum(categories) / len(categories)
+
+        return model
+
+    def throughput_model(self, job_type: str) -> Dict:
+        """Cached throughput model (refit every EST_CACHE_SECONDS)"""
+        cached = self._model_cache.get(job_type)
+        if cached and cached[0] > time.time():
+            return cached[1]
+
+        model = self._load_model(job_type)
+        self._model_cache[job_type] = (time.time() + self.cache_seconds, model)
+        return model
+
+    # ------------------------------------------------------------------
+    # Token / API call model (profile)
+    # ------------------------------------------------------------------
+    def _unit_usage(self, classify_count: int, sample_pool: int, avg_length: float,
+                    categories: float, outlier_pass: bool) -> Dict:
+        """
+        API usage for one variable/pair
+
+        Args:
+            classify_count: Responses sent to classification
+            sample_pool: Responses available for category generation
+            avg_length: Average response length (chars)
+            categories: Expected number of categories in the prompt
+            outlier_pass: Whether the outlier re-analysis pass can run
+
+        Returns:
+            dict: {'api_calls', 'prompt_tokens', 'completion_tokens'}
+        """
+        response_tokens = avg_length / CHARS_PER_TOKEN + 4
+        category_tokens = categories * self.tokens_per_category
+
+        # Category generation (one call on a sample)
+        sample = min(sample_pool, self.max_sample_size)
+        api_calls = 1
+        prompt_tokens = self.category_prompt_tokens + sample * response_tokens
+        completion_tokens = 40 + category_tokens
+
+        # Batched classification
+        batches = math.ceil(classify_count / CLASSIFY_BATCH_SIZE)
+        api_calls += batches
+        prompt_tokens += batches * (self.classify_prompt_tokens + category_tokens) + classify_count * response_tokens
+        completion_tokens += classify_count * self.completion_tokens_per_response
+
+        # Outlier re-analysis + re-classification (open-ended only)
+        outliers = int(classify_count * self.outlier_rate) if outlier_pass else 0
+        if outliers >= OUTLIER_MIN_COUNT:
+            outlier_batches = math.ceil(outliers / CLASSIFY_BATCH_SIZE)
+            api_calls += 1 + outlier_batches
+            prompt_tokens += self.category_prompt_tokens + outliers * response_tokens
+            prompt_tokens += outlier_batches * (self.classify_prompt_tokens + category_tokens) + outliers * response_tokens
+            completion_tokens += 40 + category_tokens + outliers * self.completion_tokens_per_response
+
+        return {
+            'api_calls': int(api_calls),
+            'prompt_tokens': int(prompt_tokens),
+            'completion_tokens': int(completion_tokens)
+        }
+
+    @staticmethod
+    def _makespan(durations: List[float], slots: int) -> float:
+        """Largest-first assignment to the least loaded worker slot"""
+        loads = [0.0] * max(slots, 1)
+        for seconds in sorted(durations, reverse=True):
+            loads[loads.index(min(loads))] += seconds
+        return max(loads) if durations else 0.0
+
+    def _build(self, job_type: str, units: List[Dict], max_categories: int, outlier_pass: bool) -> Dict:
+        """Combine per-unit usage, throughput model and parallelism into one estimate"""
+        from tasks.scheduler import scheduler
+
+        model = self.throughput_model(job_type)
+        categories = min(model['avg_categories'] or max_categories, max_categories)
+
+        totals = {'api_calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0}
+        durations = []
+        unit_estimates = []
+        for unit in units:
+            usage = self._unit_usage(unit['classify'], unit['sample_pool'], unit['avg_length'],
+                                     categories, outlier_pass)
+            seconds = model['intercept'] + model['slope'] * unit['responses']
+            durations.append(seconds)
+            for key in totals:
+                totals[key] += usage[key]
+            unit_estimates.append({
+                'name': unit['name'],
+                'responses': unit['classify'],
+                'api_calls': usage['api_calls'],
+                'tokens': usage['prompt_tokens'] + usage['completion_tokens'],
+                'seconds': int(round(seconds))
+            })
+
+        responses = sum(unit['classify'] for unit in units)
+        tokens = totals['prompt_tokens'] + totals['completion_tokens']
+        lane = scheduler.lane_for({'responses': responses, 'variables': len(units)})
+        slots = scheduler.fast_slots if lane == 'fast' else scheduler.max_running
+        wall_seconds = model['overhead'] + self._makespan(durations, slots) if units else 0.0
+
+        return {
+            'job_type': job_type,
+            'variables': len(units),
+            'responses': responses,
+            'api_calls': totals['api_calls'],
+            'prompt_tokens': totals['prompt_tokens'],
+            'completion_tokens': totals['completion_tokens'],
+            'tokens': tokens,
+            'cost_usd': round((totals['prompt_tokens'] * self.price_input +
+                               totals['completion_tokens'] * self.price_output) / 1e6, 4),
+            'seconds': int(round(wall_seconds)),
+            'lane': lane,
+            'basis': model['basis'],
+            'history_samples': model['samples'],
+            'units': unit_estimates
+        }
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def estimate_open_ended(self, variables: List[Dict], max_categories: int = 10,
+                            classification_mode: str = 'incremental') -> Dict:
+        """
+        Estimate a pure open-ended job
+
+        Args:
+            variables: Selected variables with upload stats
+                (response_count, unique_count, avg_length, classification_status, coded_empty_count)
+            max_categories: Max categories per variable
+            classification_mode: 'incremental' or 'rerun'
+
+        Returns:
+            dict: Estimate (tokens, api_calls, seconds, cost_usd, lane, units, ...)
+        """
+        units = []
+        for var in variables:
+            responses = int(var.get('response_count') or 0)
+            classify = responses
+            if classification_mode == 'incremental' and var.get('has_coded_column'):
+                classify = int(var.get('coded_empty_count') or 0)
+            units.append({
+                'name': var.get('name'),
+                'responses': classify,
+                'classify': classify,
+                'sample_pool': int(var.get('unique_count') or responses),
+                'avg_length': float(var.get('avg_length') or 0)
+            })
+        return self._build('open_ended', units, max_categories, outlier_pass=True)
+
+    def estimate_semi_open(self, pairs: List[Dict], max_categories: int = 10) -> Dict:
+        """
+        Estimate a semi open-ended job (only 'Lainnya' texts are classified, deduplicated)
+
+        Args:
+            pairs: Selected pairs with upload stats (text_filled_count, unique_text_count, avg_length)
+            max_categories: Max new categories per pair
+
+        Returns:
+            dict: Estimate (tokens, api_calls, seconds, cost_usd, lane, units, ...)
+        """
+        units = []
+        for pair in pairs:
+            filled = int(pair.get('text_filled_count') or 0)
+            unique = int(pair.get('unique_text_count') or filled)
+            units.append({
+                'name': pair.get('select_var'),
+                'responses': filled,
+                'classify': unique,
+                'sample_pool': unique,
+                'avg_length': float(pair.get('avg_length') or 0)
+            })
+        return self._build('semi_open', units, max_categories, outlier_pass=False)
+
+    def with_queue_wait(self, estimate: Dict, user_id: int, company_id: int) -> Dict:
+        """Add expected queue wait (scheduler simulation) to an estimate"""
+        from tasks.scheduler import scheduler
+
+        try:
+            queue = scheduler.estimate_wait(scheduler_estimate(estimate), user_id, company_id)
+        except Exception as e:
+            print(f"[ESTIMATOR WARNING] Queue simulation failed: {e}", flush=True)
+            queue = None
+
+        estimate['queue'] = queue
+        estimate['wait_seconds'] = queue['wait_seconds'] if queue else None
+        return estimate
+
+
+def scheduler_estimate(estimate: Dict) -> Dict:
+    """Compact estimate stored with the scheduler spec"""
+    return {key: estimate[key] for key in ('responses', 'variables', 'tokens', 'seconds')}
+
+
+# Global estimator instance
+job_estimator = JobEstimator()
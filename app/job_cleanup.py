@@ -0,0 +1,173 @@
+"""
+Job Cleanup
+Hapus job secara bulk tanpa loop per job, file-nya dihapus di background.
+
+- delete_jobs(): PostgreSQL -> satu DELETE ... RETURNING (variabel + response
+  ikut terhapus lewat ON DELETE CASCADE, lihat add_job_delete_cascade.py);
+  SQLite tidak enforce foreign key, jadi child dihapus eksplisit per tabel.
+  Job yang masih queued/running tidak ikut dihapus (harus di-cancel dulu,
+  supaya scheduler dan worker ikut berhenti); rollup dashboard (DailyJobStats)
+  ikut dikurangi di transaksi yang sama
+- queue_file_cleanup(): path file job yang terhapus dikirim ke task janitor
+  (tasks/janitor.py delete_files), request tidak menunggu filesystem/S3
+- expired_output_batch() / clear_outputs(): dipakai janitor untuk sweep output
+  yang sudah lewat masa download (ClassificationJob.DOWNLOAD_HOURS)
+"""
+from datetime import datetime, timedelta
+from typing import Iterable, List, Tuple
+
+from app import db
+
+PATH_COLUMNS = ('input_kobo_path', 'input_raw_path', 'output_kobo_path', 'output_raw_path')
+ROLLUP_COLUMNS = ('status', 'completed_at', 'job_type', 'total_variables', 'total_responses')
+ACTIVE_STATUSES = ('queued', 'pending', 'running', 'processing')
+
+
+def _parse_ids(job_ids: Iterable) -> List[int]:
+    ids = set()
+    for job_id in job_ids:
+        try:
+            ids.add(int(job_id))
+        except (TypeError, ValueError):
+            continue
+    return sorted(ids)
+
+
+def output_files(output_kobo_path, output_raw_path) -> List[str]:
+    """Storage refs of a job's outputs incl. the download bundle"""
+    from app.downloads import bundle_path_for
+
+    refs = [ref for ref in (output_kobo_path, output_raw_path) if ref]
+    if output_raw_path:
+        refs.append(bundle_path_for(output_raw_path))
+    return refs
+
+
+def delete_jobs(user_id: int, job_ids: Iterable) -> Tuple[int, List[str]]:
+    """
+    Delete a user's finished jobs (and their variables/responses) in bulk
+
+    Queued/running jobs (ACTIVE_STATUSES) are skipped: they still have a
+    scheduler entry or a running task, so they must be cancelled first.
+    Caller commits, then hands the returned refs to queue_file_cleanup().
+
+    Args:
+        user_id: Owner (other users' IDs are ignored)
+        job_ids: ClassificationJob.id values (strings from a form are fine)
+
+    Returns:
+        tuple: (jobs deleted, storage refs of their files)
+    """
+    from sqlalchemy import and_, delete, select
+    from app.dashboard_stats import record_job_deletions
+    from app.models import ClassificationJob, ClassificationVariable, ClassificationResponse
+
+    ids = _parse_ids(job_ids)
+    if not ids:
+        return 0, []
+
+    jobs = ClassificationJob.__table__
+    columns = [jobs.c.id] + [jobs.c[name] for name in PATH_COLUMNS + ROLLUP_COLUMNS]
+    owned = and_(jobs.c.user_id == user_id, jobs.c.id.in_(ids), jobs.c.status.notin_(ACTIVE_STATUSES))
+
+    if db.engine.dialect.name == 'postgresql':
+        rows = db.session.execute(delete(jobs).where(owned).returning(*columns)).all()
+    else:
+        rows = db.session.execute(select(*columns).where(owned)).all()
+        deleted_ids = [row.id for row in rows]
+        if deleted_ids:
+            for child in (ClassificationVariable.__table__, ClassificationResponse.__table__):
+                db.session.execute(delete(child).where(child.c.job_id.in_(deleted_ids)))
+            db.session.execute(delete(jobs).where(jobs.c.id.in_(deleted_ids)))
+
+    # Dashboard totals count live jobs only
+    record_job_deletions(user_id, rows)
+
+    files = []
+    for row in rows:
+        files.extend(ref for ref in (row.input_kobo_path, row.input_raw_path) if ref)
+        files.extend(output_files(row.output_kobo_path, row.output_raw_path))
+    return len(rows), files
+
+
+def active_job_ids(user_id: int, job_ids: Iterable) -> List[int]:
+    """IDs among job_ids (owned by user_id) that are still queued/running"""
+    from sqlalchemy import select
+    from app.models import ClassificationJob
+
+    ids = _parse_ids(job_ids)
+    if not ids:
+        return []
+    jobs = ClassificationJob.__table__
+    return list(db.session.execute(select(jobs.c.id).where(
+        jobs.c.user_id == user_id, jobs.c.id.in_(ids), jobs.c.status.in_(ACTIVE_STATUSES)
+    )).scalars())
+
+
+def queue_file_cleanup(refs: List[str]):
+    """Hand file deletion to the janitor worker (orphans are swept later if this fails)"""
+    if not refs:
+        return
+    try:
+        from tasks.janitor import delete_files
+        delete_files.apply_async(args=[refs])
+    except Exception as e:
+        print(f"[CLEANUP WARNING] Could not queue deletion of {len(refs)} files: {e}", flush=True)
+
+
+def expired_output_batch(limit: int, now: datetime = None) -> List:
+    """
+    Jobs whose download window is over but whose outputs are still stored
+
+    Returns:
+        list: Rows (id, output_kobo_path, output_raw_path), oldest first
+    """
+    from sqlalchemy import select
+    from app.models import ClassificationJob
+
+    cutoff = (now or datetime.utcnow()) - timedelta(hours=ClassificationJob.DOWNLOAD_HOURS)
+    jobs = ClassificationJob.__table__
+    return db.session.execute(
+        select(jobs.c.id, jobs.c.output_kobo_path, jobs.c.output_raw_path).where(
+            jobs.c.completed_at < cutoff,
+            jobs.c.output_raw_path.isnot(None)
+        ).order_by(jobs.c.completed_at).limit(limit)
+    ).all()
+
+
+def clear_outputs(job_ids: List[int]):
+    """Forget output paths of swept jobs (one UPDATE; caller commits)"""
+    from sqlalchemy import update
+    from app.models import ClassificationJob
+
+    if job_ids:
+        jobs = ClassificationJob.__table__
+        db.session.execute(update(jobs).where(jobs.c.id.in_(job_ids)).values(
+            output_kobo_path=None, output_raw_path=None))
+
+
+def referenced_files() -> Tuple[set, set]:
+    """
+    Refs still owned by jobs: (inputs of active jobs, all stored outputs)
+
+    Used by the janitor to tell orphans apart from live files.
+    """
+    from sqlalchemy import or_, select
+    from app.models import ClassificationJob
+
+    jobs = ClassificationJob.__table__
+    active_inputs = set()
+    for kobo, raw in db.session.execute(
+            select(jobs.c.input_kobo_path, jobs.c.input_raw_path).where(jobs.c.status.in_(ACTIVE_STATUSES))):
+        active_inputs.update(ref for ref in (kobo, raw) if ref)
+
+    outputs = set()
+    for kobo, raw in db.session.execute(
+            select(jobs.c.output_kobo_path, jobs.c.output_raw_path).where(
+                or_(jobs.c.output_kobo_path.isnot(None), jobs.c.output_raw_path.isnot(None)))):
+        outputs.update(output_files(kobo, raw))
+    return active_inputs, outputs
+
+
+__all__ = ['delete_jobs', 'active_job_ids', 'queue_file_cleanup', 'output_files', 'expired_output_batch', 'clear_outputs',
+           'referenced_files']
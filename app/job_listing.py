@@ -0,0 +1,161 @@
+"""
+Job Listing
+Riwayat job dengan keyset pagination pada (created_at, id), atau
+(completed_at, id) untuk list job completed (/results, admin user jobs).
+
+Halaman berikutnya diambil dengan WHERE (created_at, id) < cursor ORDER BY
+created_at DESC, id DESC LIMIT n, dilayani index (user_id, status, created_at)
+/ (user_id, status, completed_at) - biaya per halaman konstan, tidak
+tergantung jumlah job user (beda dengan OFFSET yang membaca ulang semua baris
+sebelumnya).
+
+Cursor = base64 url-safe dari "<nilai kolom sort isoformat>|<id>", opaque untuk
+client. Total variabel/response dibaca dari kolom denormalisasi
+ClassificationJob, jadi list tidak memicu query per job; total semua job
+completed (job_totals) dari rollup DailyJobStats.
+"""
+import base64
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app import db
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+JOB_TYPES = ('open_ended', 'semi_open')
+SORT_COLUMNS = ('created_at', 'completed_at')
+
+
+def encode_cursor(job, order_by: str = 'created_at') -> str:
+    """Opaque cursor pointing just after job in (order_by, id) DESC order"""
+    raw = f"{getattr(job, order_by).isoformat()}|{job.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Parse a cursor from encode_cursor
+
+    Raises:
+        ValueError: Malformed cursor
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, job_id = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return datetime.fromisoformat(sort_value), int(job_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def parse_date(value: Optional[str]) -> Optional[datetime]:
+    """
+    Parse a YYYY-MM-DD (or ISO datetime) filter value
+
+    Raises:
+        ValueError: Not a date
+    """
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'Invalid date: {value}')
+
+
+def list_jobs(user_id: int,
+              statuses: Optional[Iterable[str]] = None,
+              job_type: Optional[str] = None,
+              date_from: Optional[datetime] = None,
+              date_to: Optional[datetime] = None,
+              cursor: Optional[str] = None,
+              limit: int = DEFAULT_PAGE_SIZE,
+              order_by: str = 'created_at') -> Tuple[List, Optional[str]]:
+    """
+    One page of a user's jobs, newest first
+
+    Args:
+        user_id: Owner of the jobs
+        statuses: Only these statuses (default: all)
+        job_type: 'open_ended' or 'semi_open' (default: both)
+        date_from: order_by column >= date_from
+        date_to: order_by column < end of date_to's day (inclusive date)
+        cursor: next_cursor of the previous page (same order_by)
+        limit: Page size (capped at MAX_PAGE_SIZE)
+        order_by: 'created_at' or 'completed_at' (jobs never completed are left out)
+
+    Returns:
+        (jobs, next_cursor): next_cursor is None on the last page
+
+    Raises:
+        ValueError: Invalid cursor, job_type or order_by
+    """
+    from sqlalchemy import and_, or_
+    from app.models import ClassificationJob
+
+    if order_by not in SORT_COLUMNS:
+        raise ValueError(f'Invalid sort: {order_by}')
+    sort_column = getattr(ClassificationJob, order_by)
+
+    limit = max(1, min(int(limit or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+    query = ClassificationJob.query.filter(ClassificationJob.user_id == user_id)
+    if order_by == 'completed_at':
+        query = query.filter(sort_column.isnot(None))
+
+    statuses = [s for s in (statuses or []) if s]
+    if len(statuses) == 1:
+        query = query.filter(ClassificationJob.status == statuses[0])
+    elif statuses:
+        query = query.filter(ClassificationJob.status.in_(statuses))
+
+    if job_type:
+        if job_type not in JOB_TYPES:
+            raise ValueError(f'Invalid type: {job_type}')
+        query = query.filter(ClassificationJob.job_type == job_type)
+
+    if date_from:
+        query = query.filter(sort_column >= date_from)
+    if date_to:
+        if date_to.time() == datetime.min.time():
+            date_to = date_to + timedelta(days=1)  # whole day
+        query = query.filter(sort_column < date_to)
+
+    if cursor:
+        sort_value, job_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            sort_column < sort_value,
+            and_(sort_column == sort_value, ClassificationJob.id < job_id)
+        ))
+
+    jobs = query.order_by(
+        sort_column.desc(),
+        ClassificationJob.id.desc()
+    ).limit(limit + 1).all()
+
+    next_cursor = encode_cursor(jobs[limit - 1], order_by) if len(jobs) > limit else None
+    return jobs[:limit], next_cursor
+
+
+def job_totals(user_id: int) -> Dict:
+    """
+    Totals over all of a user's completed jobs (summary cards above a paged list)
+
+    Read from the DailyJobStats rollup (one row per active day), not
+    aggregated over the job history on every page load.
+
+    Returns:
+        dict: {'jobs', 'variables', 'responses'}
+    """
+    from sqlalchemy import func
+    from app.models import DailyJobStats
+
+    jobs, variables, responses = db.session.query(
+        func.coalesce(func.sum(DailyJobStats.jobs_completed), 0),
+        func.coalesce(func.sum(DailyJobStats.variables_completed), 0),
+        func.coalesce(func.sum(DailyJobStats.responses_classified), 0)
+    ).filter(DailyJobStats.user_id == user_id).one()
+    return {'jobs': int(jobs), 'variables': int(variables), 'responses': int(responses)}
+
+
+__all__ = ['list_jobs', 'job_totals', 'encode_cursor', 'decode_cursor', 'parse_date',
+           'DEFAULT_PAGE_SIZE', 'MAX_PAGE_SIZE']
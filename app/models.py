@@ -4,6 +4,7 @@ Database Models
 import secrets
 from datetime import datetime, timedelta
 from flask_login import UserMixin
+from sqlalchemy import DDL, event
 from werkzeug.security import generate_password_hash, check_password_hash
 from app import db, login_manager
 
@@ -222,6 +223,18 @@ class ClassificationJob(db.Model):
     """Classification job tracking with database persistence"""
     
     __tablename__ = 'classification_jobs'
+    __table_args__ = (
+        # Keyset pagination of job history: WHERE user_id [AND status] ORDER BY created_at, id
+        db.Index('ix_classification_jobs_user_status_created', 'user_id', 'status', 'created_at'),
+        # Completed job lists (/results, admin user jobs): ORDER BY completed_at, id
+        db.Index('ix_classification_jobs_user_status_completed', 'user_id', 'status', 'completed_at'),
+        db.Index('ix_classification_jobs_user_created', 'user_id', 'created_at'),
+        # Janitor sweep of expired outputs: WHERE completed_at < cutoff
+        db.Index('ix_classification_jobs_completed', 'completed_at'),
+    )
+    
+    # Outputs are downloadable (and kept on disk) this long after completion
+    DOWNLOAD_HOURS = 24
     
     # Primary Key
     id = db.Column(db.Integer, primary_key=True)
@@ -261,9 +274,15 @@ class ClassificationJob(db.Model):
     results_summary = db.Column(db.Text)  # JSON: {total_variables, duration, etc}
     error_message = db.Column(db.Text)
     
+    # Denormalized totals over ClassificationVariable (written at completion, see update_totals)
+    total_variables = db.Column(db.Integer, default=0)
+    total_responses = db.Column(db.Integer, default=0)
+    total_categories = db.Column(db.Integer, default=0)
+    
     # Relationships
     user = db.relationship('User', backref=db.backref('classification_jobs', lazy='dynamic'))
-    variables = db.relationship('ClassificationVariable', backref='job', lazy='dynamic', cascade='all, delete-orphan')
+    variables = db.relationship('ClassificationVariable', backref='job', lazy='dynamic', cascade='all, delete-orphan', passive_deletes=True)
+    responses = db.relationship('ClassificationResponse', lazy='dynamic', cascade='all, delete-orphan', passive_deletes=True)
     
     @property
     def duration_seconds(self):
@@ -274,7 +293,7 @@ class ClassificationJob(db.Model):
     
     @property
     def is_download_available(self):
-        """Check if download is still available (24 hours from completion)"""
+        """Check if download is still available (DOWNLOAD_HOURS from completion)"""
         if not self.completed_at:
             return False
         
@@ -284,7 +303,7 @@ class ClassificationJob(db.Model):
         completed_wib = self.completed_at.replace(tzinfo=pytz.UTC).astimezone(wib)
         
         hours_elapsed = (now_wib - completed_wib).total_seconds() / 3600
-        return hours_elapsed < 24
+        return hours_elapsed < self.DOWNLOAD_HOURS
     
     @property
     def download_expires_at(self):
@@ -296,7 +315,7 @@ class ClassificationJob(db.Model):
         from datetime import timedelta
         wib = pytz.timezone('Asia/Jakarta')
         completed_wib = self.completed_at.replace(tzinfo=pytz.UTC).astimezone(wib)
-        return completed_wib + timedelta(hours=24)
+        return completed_wib + timedelta(hours=self.DOWNLOAD_HOURS)
     
     @property
     def hours_until_expiry(self):
@@ -310,29 +329,20 @@ class ClassificationJob(db.Model):
         completed_wib = self.completed_at.replace(tzinfo=pytz.UTC).astimezone(wib)
         
         hours_elapsed = (now_wib - completed_wib).total_seconds() / 3600
-        hours_remaining = 24 - hours_elapsed
+        hours_remaining = self.DOWNLOAD_HOURS - hours_elapsed
         return max(0, hours_remaining)  # Never negative
     
-    @property
-    def total_variables(self):
-        """Get total number of variables classified"""
-        return self.variables.count()
-    
-    @property
-    def total_responses(self):
-        """Get total number of responses processed across all variables"""
-        total = 0
-        for var in self.variables:
-            total += (var.total_responses or 0)
-        return total
-    
-    @property
-    def total_categories(self):
-        """Get total number of categories generated"""
-        total = 0
-        for var in self.variables:
-            total += (var.categories_generated or 0)
-        return total
+    def update_totals(self):
+        """Recompute total_variables/responses/categories from this job's variables (one query)"""
+        from sqlalchemy import func
+        variables, responses, categories = db.session.query(
+            func.count(ClassificationVariable.id),
+            func.coalesce(func.sum(ClassificationVariable.total_responses), 0),
+            func.coalesce(func.sum(ClassificationVariable.categories_generated), 0)
+        ).filter(ClassificationVariable.job_id == self.id).one()
+        self.total_variables = int(variables)
+        self.total_responses = int(responses)
+        self.total_categories = int(categories)
     
     @property
     def original_filename(self):
@@ -376,6 +386,26 @@ class ClassificationJob(db.Model):
             }
         }
     
+    def to_summary_dict(self):
+        """Convert to a list row for JSON (no variables, no extra queries)"""
+        return {
+            'id': self.id,
+            'job_id': self.job_id,
+            'job_type': self.job_type,
+            'status': self.status,
+            'filename': self.original_filename,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None,
+            'duration': self.duration_seconds,
+            'progress': self.progress,
+            'total_variables': self.total_variables or 0,
+            'total_responses': self.total_responses or 0,
+            'total_categories': self.total_categories or 0,
+            'download_available': self.is_download_available,
+            'hours_until_expiry': self.hours_until_expiry,
+            'error_message': self.error_message
+        }
+    
     def __repr__(self):
         return f'<ClassificationJob {self.job_id} - {self.status}>'
 
@@ -387,7 +417,7 @@ class ClassificationVariable(db.Model):
     
     # Primary Key
     id = db.Column(db.Integer, primary_key=True)
-    job_id = db.Column(db.Integer, db.ForeignKey('classification_jobs.id'), nullable=False, index=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('classification_jobs.id', ondelete='CASCADE'), nullable=False, index=True)
     
     # Variable Info
     variable_name = db.Column(db.String(100), nullable=False)
@@ -438,6 +468,77 @@ class ClassificationVariable(db.Model):
         return f'<ClassificationVariable {self.variable_name}>'
 
 
+class ClassificationResponse(db.Model):
+    """One classified answer (row of raw data x variable), bulk-loaded when a job completes"""
+    
+    __tablename__ = 'classification_responses'
+    __table_args__ = (
+        db.Index('ix_classification_responses_job_var_conf', 'job_id', 'variable', 'confidence'),
+        db.Index('ix_classification_responses_job_category', 'job_id', 'category'),
+    )
+    
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('classification_jobs.id', ondelete='CASCADE'), nullable=False)
+    
+    variable = db.Column(db.String(100), nullable=False)
+    row_index = db.Column(db.Integer, nullable=False)  # Row position in raw data (0-based)
+    response = db.Column(db.Text)
+    category = db.Column(db.String(255))  # Primary category (all labels are in codes)
+    codes = db.Column(db.String(100))  # Kobo code(s), multi-label "1 4"
+    confidence = db.Column(db.Float)
+    source = db.Column(db.String(20))  # existing, invalid, ai, reclassified, fallback
+    
+    def to_dict(self):
+        """Convert to dictionary for JSON serialization"""
+        return {
+            'id': self.id,
+            'variable': self.variable,
+            'row': self.row_index + 1,
+            'response': self.response,
+            'category': self.category,
+            'codes': self.codes,
+            'confidence': self.confidence,
+            'source': self.source
+        }
+    
+    def __repr__(self):
+        return f'<ClassificationResponse job={self.job_id} {self.variable}[{self.row_index}]>'
+
+
+# Full-text index for the response search (PostgreSQL only, see app/response_store.py)
+event.listen(ClassificationResponse.__table__, 'after_create', DDL(
+    "CREATE INDEX IF NOT EXISTS ix_classification_responses_fts ON classification_responses "
+    "USING gin (to_tsvector('simple', response))"
+).execute_if(dialect='postgresql'))
+
+
+class DailyJobStats(db.Model):
+    """Per-user daily rollup of completed jobs (dashboard KPIs without scanning job history)"""
+    
+    __tablename__ = 'daily_job_stats'
+    __table_args__ = (
+        db.UniqueConstraint('day', 'user_id', name='uq_daily_job_stats_day_user'),
+        db.Index('ix_daily_job_stats_company_day', 'company_id', 'day'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)  # UTC date of completed_at
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    company_id = db.Column(db.Integer, db.ForeignKey('companies.id'), index=True)
+    
+    # Counters (incremented when a job completes, see app/dashboard_stats.py)
+    jobs_completed = db.Column(db.Integer, nullable=False, default=0)
+    pure_jobs = db.Column(db.Integer, nullable=False, default=0)
+    semi_jobs = db.Column(db.Integer, nullable=False, default=0)
+    variables_completed = db.Column(db.Integer, nullable=False, default=0)
+    responses_classified = db.Column(db.BigInteger, nullable=False, default=0)
+    
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<DailyJobStats user={self.user_id} day={self.day} jobs={self.jobs_completed}>'
+
+
 @login_manager.user_loader
 def load_user(user_id):
     """Load user by ID for Flask-Login"""
@@ -0,0 +1,183 @@
+"""
+Response Store
+Hasil klasifikasi per jawaban (baris raw data x variabel) di tabel
+classification_responses, supaya analis bisa cek/cari jawaban tanpa download xlsx.
+
+- store_responses(): dipanggil task saat job selesai; PostgreSQL pakai COPY
+  (satu stream CSV), database lain bulk INSERT per chunk
+- search_responses(): halaman hasil dengan filter teks (full-text di PostgreSQL,
+  ILIKE di database lain), filter kategori/variabel, sort confidence
+- response_categories(): jumlah jawaban per kategori (isi dropdown filter)
+
+Index: (job_id, variable, confidence), (job_id, category), dan di PostgreSQL
+GIN to_tsvector('simple', response) (lihat add_classification_responses.py).
+"""
+import io
+import csv
+from typing import Dict, Iterable, List, Optional
+
+from app import db
+
+COLUMNS = ('job_id', 'variable', 'row_index', 'response', 'category', 'codes', 'confidence', 'source')
+INSERT_CHUNK = 5000
+COPY_NULL = r'\N'
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+TEXT_SEARCH_CONFIG = 'simple'  # no stemming: answers are mostly Indonesian
+
+
+def _is_postgres() -> bool:
+    return db.engine.dialect.name == 'postgresql'
+
+
+def _copy_rows(rows: List[Dict]):
+    """COPY rows through the session's connection (same transaction as the job update)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        # Explicit NULL marker: with FORMAT csv an unquoted empty field would load '' answers as NULL
+        writer.writerow([COPY_NULL if row.get(column) is None else row[column] for column in COLUMNS])
+    buffer.seek(0)
+
+    dbapi_connection = db.session.connection().connection
+    with dbapi_connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY classification_responses ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')",
+            buffer
+        )
+
+
+def store_responses(job_id: int, rows: Iterable[Dict]) -> int:
+    """
+    Replace the stored responses of a job
+
+    Call inside the completion transaction (the caller commits). Runs in a
+    savepoint: a failure is logged and never fails the job.
+
+    Args:
+        job_id: ClassificationJob.id
+        rows: Dicts with variable, row_index, response, category, codes, confidence, source
+
+    Returns:
+        int: Rows written (0 on failure)
+    """
+    from app.models import ClassificationResponse
+
+    rows = [dict(row, job_id=job_id) for row in rows]
+    try:
+        with db.session.begin_nested():
+            ClassificationResponse.query.filter_by(job_id=job_id).delete(synchronize_session=False)
+            if rows and _is_postgres():
+                _copy_rows(rows)
+            else:
+                table = ClassificationResponse.__table__
+                for start in range(0, len(rows), INSERT_CHUNK):
+                    db.session.execute(table.insert(), rows[start:start + INSERT_CHUNK])
+    except Exception as e:
+        print(f"[RESPONSES WARNING] Storing responses failed for job {job_id}: {e}", flush=True)
+        return 0
+
+    print(f"[RESPONSES] Stored {len(rows)} responses for job {job_id}", flush=True)
+    return len(rows)
+
+
+def delete_responses(job_id: int):
+    """Delete a job's responses in one statement (DB cascade is not enforced on SQLite)"""
+    from app.models import ClassificationResponse
+    ClassificationResponse.query.filter_by(job_id=job_id).delete(synchronize_session=False)
+
+
+def search_responses(job_id: int,
+                     variable: Optional[str] = None,
+                     q: Optional[str] = None,
+                     category: Optional[str] = None,
+                     max_confidence: Optional[float] = None,
+                     sort: str = 'confidence',
+                     order: str = 'asc',
+                     page: int = 1,
+                     per_page: int = DEFAULT_PAGE_SIZE) -> Dict:
+    """
+    One page of a job's responses
+
+    Args:
+        job_id: ClassificationJob.id
+        variable: Only this variable
+        q: Text filter on the answer
+        category: Only this (primary) category
+        max_confidence: confidence <= max_confidence (review low-confidence rows)
+        sort: 'confidence' or 'row'
+        order: 'asc' or 'desc'
+        page: 1-based page number
+        per_page: Page size (capped at MAX_PAGE_SIZE)
+
+    Returns:
+        dict: {'responses', 'total', 'page', 'per_page', 'pages'}
+
+    Raises:
+        ValueError: Invalid sort/order
+    """
+    from sqlalchemy import func
+    from app.models import ClassificationResponse as Response
+
+    if sort not in ('confidence', 'row'):
+        raise ValueError(f'Invalid sort: {sort}')
+    if order not in ('asc', 'desc'):
+        raise ValueError(f'Invalid order: {order}')
+    page = max(1, int(page or 1))
+    per_page = max(1, min(int(per_page or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+
+    query = Response.query.filter(Response.job_id == job_id)
+    if variable:
+        query = query.filter(Response.variable == variable)
+    if category:
+        query = query.filter(Response.category == category)
+    if max_confidence is not None:
+        query = query.filter(Response.confidence <= max_confidence)
+    if q:
+        if _is_postgres():
+            query = query.filter(
+                func.to_tsvector(TEXT_SEARCH_CONFIG, Response.response).op('@@')(
+                    func.plainto_tsquery(TEXT_SEARCH_CONFIG, q))
+            )
+        else:
+            query = query.filter(Response.response.ilike(f'%{q}%'))
+
+    total = query.count()
+
+    if sort == 'confidence':
+        key = Response.confidence.asc() if order == 'asc' else Response.confidence.desc()
+        ordering = [key.nulls_last(), Response.variable, Response.row_index]
+    else:
+        ordering = [Response.variable, Response.row_index.asc() if order == 'asc' else Response.row_index.desc()]
+
+    responses = query.order_by(*ordering).offset((page - 1) * per_page).limit(per_page).all()
+    return {
+        'responses': [response.to_dict() for response in responses],
+        'total': total,
+        'page': page,
+        'per_page': per_page,
+        'pages': (total + per_page - 1) // per_page
+    }
+
+
+def response_categories(job_id: int, variable: Optional[str] = None) -> List[Dict]:
+    """
+    Answer count per category (most frequent first)
+
+    Returns:
+        list: [{'category', 'count'}]
+    """
+    from sqlalchemy import func
+    from app.models import ClassificationResponse as Response
+
+    count = func.count(Response.id)
+    query = db.session.query(Response.category, count).filter(Response.job_id == job_id)
+    if variable:
+        query = query.filter(Response.variable == variable)
+    rows = query.group_by(Response.category).order_by(count.desc()).all()
+    return [{'category': category, 'count': int(n)} for category, n in rows]
+
+
+__all__ = ['store_responses', 'delete_responses', 'search_responses', 'response_categories']
@@ -14,10 +14,17 @@ from app.utils import FileProcessor
 # Use Redis-based progress tracker instead of in-memory
 from tasks.progress import progress_tracker
 # Import Celery task for background processing
-from tasks.classification import classify_dataset
+# Fair scheduler decides when/where classification tasks start
+from tasks.scheduler import scheduler
+from tasks.cancellation import request_cancel
+from tasks.upload_analysis import (
+    analyze_upload, get_state as get_analysis_state, set_state as set_analysis_state,
+    public_state, get_upload, load_profile, reuse_profile
+)
+from storage import get_storage
+from app.estimator import job_estimator, scheduler_estimate
 from celery_app import celery_app  # Import Celery app for task control
 from config import Config
-from excel_classifier import ExcelClassifier
 
 main_bp = Blueprint('main', __name__)
 
@@ -63,143 +70,31 @@ def index():
 @main_bp.route('/dashboard')
 @login_required
 def dashboard():
-    """Main dashboard with real-time data"""
-    from app.models import ClassificationJob, ClassificationVariable
-    from sqlalchemy import func
-    from datetime import datetime, timedelta
+    """Main dashboard (KPIs from the daily rollup, cached briefly)"""
+    from app.models import ClassificationJob
+    from app.dashboard_stats import dashboard_snapshot
     
     # Get current user
     user_id = current_user.id
     
-    # === KPI METRICS ===
-    
-    # Total completed classifications (all time)
-    total_classifications = ClassificationJob.query.filter_by(
-        user_id=user_id,
-        status='completed'
-    ).count()
+    # === KPI METRICS, TRENDS, CHARTS (DailyJobStats rollup) ===
+    snapshot = dashboard_snapshot(user_id=user_id)
     
-    # Active jobs (processing)
+    # Active jobs (queued + processing) - live
     active_jobs_count = ClassificationJob.query.filter(
         ClassificationJob.user_id == user_id,
-        ClassificationJob.status.in_(['processing', 'pending'])
-    ).count()
-    
-    # Total responses classified (sum from ClassificationVariable table)
-    # Join with ClassificationJob to filter by user_id
-    total_responses_result = db.session.query(
-        func.sum(ClassificationVariable.total_responses)
-    ).join(ClassificationJob).filter(
-        ClassificationJob.user_id == user_id,
-        ClassificationJob.status == 'completed'
-    ).scalar()
-    total_responses = total_responses_result or 0
-    
-    # Total variables classified (count from ClassificationVariable table)
-    total_variables = db.session.query(
-        func.count(ClassificationVariable.id)
-    ).join(ClassificationJob).filter(
-        ClassificationJob.user_id == user_id,
-        ClassificationJob.status == 'completed'
-    ).scalar() or 0
-    
-    # === TRENDS (Last 7 days vs Previous 7 days) ===
-    seven_days_ago = datetime.now() - timedelta(days=7)
-    fourteen_days_ago = datetime.now() - timedelta(days=14)
-    
-    # Classifications trend
-    classifications_last_7 = ClassificationJob.query.filter(
-        ClassificationJob.user_id == user_id,
-        ClassificationJob.status == 'completed',
-        ClassificationJob.completed_at >= seven_days_ago
-    ).count()
-    
-    classifications_prev_7 = ClassificationJob.query.filter(
-        ClassificationJob.user_id == user_id,
-        ClassificationJob.status == 'completed',
-        ClassificationJob.completed_at >= fourteen_days_ago,
-        ClassificationJob.completed_at < seven_days_ago
+        ClassificationJob.status.in_(['queued', 'processing', 'pending'])
     ).count()
     
-    if classifications_prev_7 > 0:
-        classifications_trend = ((classifications_last_7 - classifications_prev_7) / classifications_prev_7) * 100
-    else:
-        classifications_trend = 100 if classifications_last_7 > 0 else 0
-    
-    # Responses trend (from ClassificationVariable table)
-    responses_last_7_result = db.session.query(
-        func.sum(ClassificationVariable.total_responses)
-    ).join(ClassificationJob).filter(
-        ClassificationJob.user_id == user_id,
-        ClassificationJob.status == 'completed',
-        ClassificationJob.completed_at >= seven_days_ago
-    ).scalar()
-    responses_last_7 = responses_last_7_result or 0
-    
-    responses_prev_7_result = db.session.query(
-        func.sum(ClassificationVariable.total_responses)
-    ).join(ClassificationJob).filter(
-        ClassificationJob.user_id == user_id,
-        ClassificationJob.status == 'completed',
-        ClassificationJob.completed_at >= fourteen_days_ago,
-        ClassificationJob.completed_at < seven_days_ago
-    ).scalar()
-    responses_prev_7 = responses_prev_7_result or 0
-    
-    if responses_prev_7 > 0:
-        responses_trend = ((responses_last_7 - responses_prev_7) / responses_prev_7) * 100
-    else:
-        responses_trend = 100 if responses_last_7 > 0 else 0
-    
     # === RECENT JOBS (Last 7) ===
     recent_jobs = ClassificationJob.query.filter_by(
         user_id=user_id
     ).order_by(ClassificationJob.created_at.desc()).limit(7).all()
     
-    # === CHART DATA: Jobs Over Time (Last 30 days) ===
-    thirty_days_ago = datetime.now() - timedelta(days=30)
-    
-    jobs_by_date = db.session.query(
-        func.date(ClassificationJob.completed_at).label('date'),
-        func.count(ClassificationJob.id).label('count')
-    ).filter(
-        ClassificationJob.user_id == user_id,
-        ClassificationJob.status == 'completed',
-        ClassificationJob.completed_at >= thirty_days_ago
-    ).group_by(func.date(ClassificationJob.completed_at)).all()
-    
-    # Format chart data
-    chart_labels = []
-    chart_data = []
-    for job_date, count in jobs_by_date:
-        chart_labels.append(job_date.strftime('%b %d'))
-        chart_data.append(count)
-    
-    # === CLASSIFICATION TYPES (Pure vs Semi) ===
-    pure_count = ClassificationJob.query.filter(
-        ClassificationJob.user_id == user_id,
-        ClassificationJob.classification_type == 'pure_open_ended',
-        ClassificationJob.status == 'completed'
-    ).count()
-    
-    semi_count = ClassificationJob.query.filter(
-        ClassificationJob.user_id == user_id,
-        ClassificationJob.classification_type == 'semi_open_ended',
-        ClassificationJob.status == 'completed'
-    ).count()
-    
     return render_template('dashboard.html',
-                         total_classifications=total_classifications,
                          active_jobs_count=active_jobs_count,
-                         total_responses=total_responses,
-                         total_variables=total_variables,
-                         classifications_trend=round(classifications_trend, 1),
-                         responses_trend=round(responses_trend, 1),
                          recent_jobs=recent_jobs,
-                         chart_labels=chart_labels,
-                         chart_data=chart_data,
-                         pure_count=pure_count,
-                         semi_count=semi_count)
+                         **snapshot)
 
 @main_bp.route('/responsive-test')
 def responsive_test():
@@ -237,71 +132,89 @@ def upload_files():
         if not file_processor.allowed_file(raw_file.filename):
             return jsonify({'success': False, 'error': 'Invalid raw data file format'}), 400
         
-        # Save files with original names (no timestamp)
-        kobo_path, kobo_original = file_processor.save_file(kobo_file, prefix='', add_timestamp=False)
-        raw_path, raw_original = file_processor.save_file(raw_file, prefix='', add_timestamp=False)
-        
-        # Validate structure
-        is_valid, error_msg = file_processor.validate_excel_structure(raw_path)
-        if not is_valid:
-            os.remove(kobo_path)
-            os.remove(raw_path)
-            return jsonify({'success': False, 'error': error_msg}), 400
-        
-        # Get file info
-        file_info = file_processor.get_file_info(raw_path)
-        
-        # Detect variables from kobo_system
-        detected_vars = file_processor.detect_open_ended_variables(kobo_path)
-        
-        # Detect semi open-ended pairs
-        semi_open_pairs = file_processor.detect_semi_open_pairs(kobo_path)
-        
-        if not detected_vars and not semi_open_pairs:
-            os.remove(kobo_path)
-            os.remove(raw_path)
-            return jsonify({'success': False, 'error': 'No open-ended or semi open-ended variables detected. Please check kobo_system file structure.'}), 400
-        
-        # Get statistics for each pure open-ended variable
-        for var in detected_vars:
-            stats = file_processor.get_variable_statistics(raw_path, var['name'])
-            var.update(stats)
-        
-        # Get statistics for each semi open-ended pair
-        for pair in semi_open_pairs:
-            stats = file_processor.get_semi_open_statistics(raw_path, pair)
-            pair.update(stats)
-        
-        # Store in session
-        session['raw_data_path'] = raw_path
-        session['kobo_system_path'] = kobo_path
-        session['kobo_original_filename'] = kobo_original
-        session['raw_original_filename'] = raw_original
-        session['file_info'] = file_info
-        session['detected_variables'] = detected_vars
-        session['semi_open_pairs'] = semi_open_pairs
+        # Store by content hash (hashed while streaming) - the only work done in this request
+        kobo_path, kobo_original, kobo_hash, _ = file_processor.store_file(kobo_file)
+        raw_path, raw_original, raw_hash, _ = file_processor.store_file(raw_file)
+        upload = {
+            'kobo_path': kobo_path,
+            'raw_path': raw_path,
+            'kobo_hash': kobo_hash,
+            'raw_hash': raw_hash,
+            'kobo_original_filename': kobo_original,
+            'raw_original_filename': raw_original
+        }
+        
+        # Same pair analyzed before: attach its profile; otherwise validation, variable
+        # detection and statistics run on a Celery worker (queue 'analysis')
+        analysis_id = str(uuid.uuid4())
+        reused = reuse_profile(analysis_id, upload, current_user.id)
+        if not reused:
+            set_analysis_state(
+                analysis_id,
+                status='queued',
+                progress=0,
+                step='Waiting for analysis worker...',
+                user_id=current_user.id,
+                upload=upload
+            )
+            analyze_upload.apply_async(args=[analysis_id, kobo_path, raw_path])
+        
+        # Upload state + profile live in Redis; the session cookie only carries the ID
+        for key in _LEGACY_UPLOAD_SESSION_KEYS:
+            session.pop(key, None)
+        session['upload_analysis_id'] = analysis_id
         
         return jsonify({
             'success': True,
-            'message': f'Files uploaded successfully. Detected {len(detected_vars)} open-ended and {len(semi_open_pairs)} semi open-ended variables.',
-            'file_info': file_info,
-            'detected_variables': detected_vars,
-            'semi_open_pairs': semi_open_pairs
-        })
+            'analysis_id': analysis_id,
+            'status': 'completed' if reused else 'queued',
+            'status_url': url_for('main.api_upload_analysis', analysis_id=analysis_id)
+        }), 200 if reused else 202
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@main_bp.route('/api/upload-analysis/<analysis_id>')
+@login_required
+def api_upload_analysis(analysis_id):
+    """API: Status of the post-upload analysis (polled by classify.html)"""
+    state = get_analysis_state(analysis_id)
+    if not state or state.get('user_id') != current_user.id:
+        return jsonify({'success': False, 'error': 'Analysis not found'}), 404
+    
+    return jsonify({'success': True, **public_state(state)})
+
+# Keys older versions stored in the session cookie (dropped on the next upload)
+_LEGACY_UPLOAD_SESSION_KEYS = (
+    'raw_data_path', 'kobo_system_path', 'kobo_original_filename', 'raw_original_filename',
+    'upload_profile_path', 'file_info', 'detected_variables', 'semi_open_pairs',
+    'classification_job_id', 'classification_results'
+)
+
+def _upload_profile():
+    """
+    Detected-variable profile of the current upload (written by analyze_upload)
+    
+    Returns:
+        tuple: (detected_vars, semi_open_pairs, file_info); empty until the analysis completes
+    """
+    profile = load_profile(get_upload(session.get('upload_analysis_id'), current_user.id))
+    if profile is None:
+        return [], [], {}
+    return profile['detected_variables'], profile['semi_open_pairs'], profile['file_info']
+
 @main_bp.route('/select-variables')
 @login_required
 def select_variables():
     """Step 2: Select variables to classify"""
-    detected_vars = session.get('detected_variables', [])
-    semi_open_pairs = session.get('semi_open_pairs', [])
-    file_info = session.get('file_info', {})
+    detected_vars, semi_open_pairs, file_info = _upload_profile()
     
     if not detected_vars and not semi_open_pairs:
-        flash('Please upload files first', 'warning')
+        state = get_analysis_state(session['upload_analysis_id']) if session.get('upload_analysis_id') else None
+        if state and state.get('status') in ('queued', 'processing'):
+            flash('Files are still being analyzed, please wait a moment', 'info')
+        else:
+            flash('Please upload files first', 'warning')
         return redirect(url_for('main.classify'))
     
     return render_template('select_variables.html', 
@@ -309,6 +222,50 @@ def select_variables():
                          semi_open_pairs=semi_open_pairs,
                          file_info=file_info)
 
+def _estimate_selection(form, detected_vars, semi_open_pairs):
+    """
+    Estimate the job a select_variables form would start
+    (semi open-ended takes precedence, same as start_classification)
+    
+    Returns:
+        dict: Estimate or None when nothing is selected
+    """
+    selected_semi_open = form.getlist('selected_semi_open')
+    if selected_semi_open:
+        pairs = [p for p in semi_open_pairs if p['select_var'] in selected_semi_open]
+        return job_estimator.estimate_semi_open(
+            pairs,
+            max_categories=int(form.get('semi_open_max_categories', 10))
+        )
+    
+    selected_var_names = form.getlist('selected_vars')
+    if selected_var_names:
+        variables = [v for v in detected_vars if v['name'] in selected_var_names]
+        return job_estimator.estimate_open_ended(
+            variables,
+            max_categories=int(form.get('max_categories', 10)),
+            classification_mode=form.get('classification_mode', 'incremental')
+        )
+    
+    return None
+
+@main_bp.route('/api/estimate')
+@login_required
+def api_estimate():
+    """Pre-run estimate (tokens, API calls, wall time, queue wait) for the current selection"""
+    try:
+        detected_vars, semi_open_pairs, _ = _upload_profile()
+        estimate = _estimate_selection(request.args, detected_vars, semi_open_pairs)
+        if estimate is None:
+            return jsonify({'success': True, 'estimate': None})
+        
+        estimate = job_estimator.with_queue_wait(estimate, current_user.id, current_user.company_id)
+        return jsonify({'success': True, 'estimate': estimate})
+        
+    except Exception as e:
+        print(f"[API_ESTIMATE] Error: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @main_bp.route('/start-classification', methods=['POST'])
 @login_required
 def start_classification():
@@ -320,11 +277,11 @@ def start_classification():
     print(f"{'='*80}\n", flush=True)
     
     try:
-        # Get data from session
-        raw_data_path = session.get('raw_data_path')
-        kobo_system_path = session.get('kobo_system_path')
-        detected_vars = session.get('detected_variables', [])
-        semi_open_pairs = session.get('semi_open_pairs', [])
+        # Get the current upload (server-side, keyed by the session's analysis ID)
+        upload = get_upload(session.get('upload_analysis_id'), current_user.id) or {}
+        raw_data_path = upload.get('raw_path')
+        kobo_system_path = upload.get('kobo_path')
+        detected_vars, semi_open_pairs, _ = _upload_profile()
         
         if not raw_data_path or not kobo_system_path:
             flash('Files not found. Please upload again.', 'error')
@@ -338,6 +295,27 @@ def start_classification():
             flash('Please select at least 1 variable or pair to process', 'warning')
             return redirect(url_for('main.select_variables'))
         
+        # Check concurrent jobs limit (3 queued/running for regular users, unlimited for Super Admin)
+        if not current_user.is_super_admin:
+            from app.models import ClassificationJob
+            active_jobs_count = ClassificationJob.query.filter_by(
+                user_id=current_user.id
+            ).filter(
+                ClassificationJob.status.in_(['queued', 'pending', 'running', 'processing'])
+            ).count()
+            
+            if active_jobs_count >= 3:
+                flash('You have reached the maximum of 3 concurrent jobs. Please wait for one to complete before starting a new one.', 'warning')
+                return redirect(url_for('main.jobs'))
+        
+        # Get data that needs request context (before submitting task)
+        user_id = current_user.id
+        kobo_original = upload.get('kobo_original_filename') or os.path.basename(kobo_system_path)
+        raw_original = upload.get('raw_original_filename') or os.path.basename(raw_data_path)
+        
+        # Generate job ID
+        job_id = str(uuid.uuid4())
+        
         # Determine processing type
         if selected_semi_open:
             # Semi open-ended processing
@@ -350,54 +328,33 @@ def start_classification():
             # Build pairs list
             pairs_to_process = []
             for select_var in selected_semi_open:
-                # Find the pair in session data
+                # Find the pair in the upload profile
                 pair = next((p for p in semi_open_pairs if p['select_var'] == select_var), None)
                 if pair:
                     pairs_to_process.append(pair)
             
-            # Generate job ID
-            job_id = str(uuid.uuid4())
-            session['classification_job_id'] = job_id
-            
             print(f"\n{'='*80}")
             print(f"[MAIN] Starting SEMI OPEN-ENDED job: {job_id}")
             print(f"[MAIN] Pairs to process: {len(pairs_to_process)}")
             print(f"[MAIN] Max categories: {semi_open_max_categories}")
-            print(f"[MAIN] NOTE: Semi open-ended still uses threading (Celery migration pending)")
             print(f"{'='*80}\n")
             
-            # Initialize progress tracker
-            # TODO: Migrate semi open-ended to Celery task (Phase 1.5)
-            import threading
-            from app.progress_tracker import progress_tracker as memory_tracker
-            memory_tracker.create_job(job_id, len(pairs_to_process))
-            
-            # Start semi open-ended processing
-            thread = threading.Thread(
-                target=run_semi_open_background,
-                args=(job_id, kobo_system_path, raw_data_path, pairs_to_process, 
-                      semi_open_max_categories, create_merged_column)
-            )
-            thread.daemon = True
-            thread.start()
+            # Semi open-ended task (pairs run as parallel subtasks)
+            task_name = 'tasks.semi_open.process_semi_open_job'
+            task_args = [job_id, kobo_system_path, raw_data_path, pairs_to_process,
+                         semi_open_max_categories, create_merged_column,
+                         user_id, kobo_original, raw_original]
+            job_settings = {
+                'max_categories': semi_open_max_categories,
+                'create_merged_column': create_merged_column
+            }
+            total_units = len(pairs_to_process)
+            total_responses = sum(int(p.get('text_filled_count') or 0) for p in pairs_to_process)
             
         else:
             # Pure open-ended processing (existing logic)
             processing_type = 'open_ended'
             
-            # Check concurrent jobs limit (3 for regular users, unlimited for Super Admin)
-            if not current_user.is_super_admin:
-                from app.models import ClassificationJob
-                active_jobs_count = ClassificationJob.query.filter_by(
-                    user_id=current_user.id
-                ).filter(
-                    ClassificationJob.status.in_(['pending', 'running', 'processing'])
-                ).count()
-                
-                if active_jobs_count >= 3:
-                    flash('You have reached the maximum of 3 concurrent jobs. Please wait for one to complete before starting a new one.', 'warning')
-                    return redirect(url_for('main.jobs'))
-            
             # Get settings
             max_categories = int(request.form.get('max_categories', 10))
             confidence_threshold = float(request.form.get('confidence_threshold', 0.50))
@@ -413,40 +370,71 @@ def start_classification():
                     'question': question_context
                 })
             
-            # Generate job ID
-            job_id = str(uuid.uuid4())
-            session['classification_job_id'] = job_id
-            
             print(f"\n{'='*80}")
             print(f"[MAIN] Starting PURE OPEN-ENDED job: {job_id}")
             print(f"[MAIN] Variables to process: {len(variables_to_process)}")
             print(f"[MAIN] Classification mode: {classification_mode}")
             print(f"{'='*80}\n")
             
-            # Initialize progress tracker in Redis
-            progress_tracker.set_progress(job_id, {
-                'status': 'pending',
-                'progress': 0,
-                'current_step': 'Initializing...',
-                'total_variables': len(variables_to_process),
-                'variables': {}
-            })
-            
-            # Get data that needs request context (before submitting task)
-            user_id = current_user.id
-            kobo_original = session.get('kobo_original_filename', os.path.basename(kobo_system_path))
-            raw_original = session.get('raw_original_filename', os.path.basename(raw_data_path))
-            
-            # Submit classification task to Celery (runs in background worker)
-            task = classify_dataset.apply_async(
-                args=(job_id, kobo_system_path, raw_data_path, variables_to_process,
-                      max_categories, confidence_threshold, auto_upload, classification_mode,
-                      user_id, kobo_original, raw_original),
-                queue='classification'  # Use dedicated classification queue
-            )
-            
-            print(f"[MAIN] Celery task submitted: {task.id}")
-            print(f"[MAIN] Task state: {task.state}")
+            # Multi-variable jobs: chord (prepare -> one task per variable -> merge)
+            # so variables spread across all workers; single variable: one task
+            task_name = ('tasks.classification.prepare_dataset' if len(variables_to_process) > 1
+                         else 'tasks.classification.classify_dataset')
+            task_args = [job_id, kobo_system_path, raw_data_path, variables_to_process,
+                         max_categories, confidence_threshold, auto_upload, classification_mode,
+                         user_id, kobo_original, raw_original]
+            job_settings = {
+                'max_categories': max_categories,
+                'confidence_threshold': confidence_threshold,
+                'auto_upload': auto_upload,
+                'classification_mode': classification_mode
+            }
+            response_counts = {v['name']: int(v.get('response_count') or 0) for v in detected_vars}
+            total_units = len(variables_to_process)
+            total_responses = sum(response_counts.get(v['name'], 0) for v in variables_to_process)
+        
+        # Job row exists from the start (status 'queued') so it shows up in active jobs
+        from app.models import ClassificationJob
+        db.session.add(ClassificationJob(
+            job_id=job_id,
+            user_id=user_id,
+            job_type=processing_type,
+            status='queued',
+            original_kobo_filename=kobo_original,
+            original_raw_filename=raw_original,
+            input_kobo_path=kobo_system_path,
+            input_raw_path=raw_data_path,
+            settings=json.dumps(job_settings),
+            current_step='Queued'
+        ))
+        db.session.commit()
+        
+        # Initialize progress tracker in Redis
+        progress_tracker.set_progress(job_id, {
+            'status': 'queued',
+            'progress': 0,
+            'current_step': 'Queued',
+            'processing_type': 'semi_open_ended' if processing_type == 'semi_open' else 'open_ended',
+            'total_variables': total_units,
+            'variables': {}
+        }, user_id=user_id, company_id=current_user.company_id)
+        
+        # Hand over to the fair scheduler (caps per company/user, fast lane for small jobs)
+        try:
+            job_estimate = _estimate_selection(request.form, detected_vars, semi_open_pairs)
+            estimate = scheduler_estimate(job_estimate)
+            print(f"[MAIN] Estimate: {job_estimate['tokens']} tokens, {job_estimate['api_calls']} API calls, "
+                  f"~{job_estimate['seconds']}s ({job_estimate['basis']})")
+        except Exception as estimate_error:
+            print(f"[MAIN] Estimator failed, using rough cost: {estimate_error}")
+            estimate = scheduler.estimate_cost(total_responses, total_units)
+        queue_info = scheduler.submit(
+            job_id, task_name, task_args,
+            user_id=user_id,
+            company_id=current_user.company_id,
+            estimate=estimate
+        )
+        print(f"[MAIN] Job submitted to scheduler: {task_name} (queue: {queue_info or 'started'})")
         
         # Redirect to progress page with job_id
         return redirect(url_for('main.classification_progress', job_id=job_id))
@@ -459,119 +447,8 @@ def start_classification():
 # Legacy threading-based function removed - replaced by Celery task in tasks/classification.py
 # See tasks.classification.classify_dataset for current implementation
 
-def run_semi_open_background(job_id, kobo_system_path, raw_data_path, pairs_to_process, 
-                              max_categories, create_merged_column):
-    """Background function to run semi open-ended processing"""
-    import time
-    from semi_open_processor import SemiOpenProcessor
-    
-    try:
-        print(f"\n[SEMI_OPEN] Starting semi open-ended job: {job_id}", flush=True)
-        print(f"[SEMI_OPEN] Processing {len(pairs_to_process)} pairs", flush=True)
-        
-        time.sleep(0.5)
-        
-        # Get OpenAI API key
-        from app.models import SystemSettings
-        api_key = SystemSettings.get_setting('openai_api_key', os.getenv('OPENAI_API_KEY', ''))
-        
-        if not api_key or api_key == 'your_openai_api_key_here':
-            raise ValueError("OpenAI API key not configured. Please set it in Admin Settings.")
-        
-        # Initialize processor
-        print(f"[SEMI_OPEN] Initializing SemiOpenProcessor...", flush=True)
-        processor = SemiOpenProcessor(kobo_system_path, raw_data_path, api_key)
-        processor.load_data()
-        print(f"[SEMI_OPEN] Processor initialized successfully", flush=True)
-        
-        # Process each pair
-        all_results = []
-        start_time = datetime.now()
-        total_pairs = len(pairs_to_process)
-        
-        for idx, pair in enumerate(pairs_to_process, 1):
-            select_var = pair['select_var']
-            text_var = pair['text_var']
-            
-            print(f"[SEMI_OPEN] Processing pair {idx}/{total_pairs}: {select_var} + {text_var}", flush=True)
-            
-            # Update progress
-            progress_tracker.update_variable(job_id, f"{select_var} (semi open)", idx, total_pairs, 
-                                            f"Processing {select_var} with {text_var}")
-            
-            # Create progress callback
-            def update_progress(message, percentage):
-                print(f"[SEMI_OPEN CALLBACK] {message} ({percentage}%)", flush=True)
-                progress_tracker.update_step(job_id, f'[{select_var}] {message}', percentage)
-            
-            # Process the pair
-            update_progress("Extracting 'Lainnya' responses", 10)
-            result = processor.process_semi_open_pair(pair, max_categories=max_categories)
-            
-            if 'error' in result:
-                print(f"[SEMI_OPEN] Error processing {select_var}: {result['error']}", flush=True)
-                progress_tracker.complete_variable(job_id, select_var, {
-                    'variable': select_var,
-                    'status': 'error',
-                    'error': result['error']
-                })
-                continue
-            
-            update_progress("Classification complete", 90)
-            
-            # Save results (update raw_data file in place)
-            output_path = raw_data_path  # Overwrite existing file
-            processor.save_results(result, output_path)
-            
-            update_progress("Results saved", 100)
-            
-            # Prepare summary
-            summary = {
-                'variable': select_var,
-                'text_variable': text_var,
-                'type': 'semi_open_ended',
-                'lainnya_code': pair['lainnya_code'],
-                'lainnya_responses': result['lainnya_count'],
-                'new_categories_generated': len(result['new_categories']),
-                'merged_column': result['merged_column_name'],
-                'pre_coded_categories': len(result['pre_coded_labels']),
-                'total_categories': len(result['pre_coded_labels']) + len(result['new_categories']),
-                'status': 'success'
-            }
-            
-            progress_tracker.complete_variable(job_id, select_var, summary)
-            all_results.append(summary)
-            
-            print(f"[SEMI_OPEN] Pair {select_var} processed successfully", flush=True)
-        
-        end_time = datetime.now()
-        duration = (end_time - start_time).total_seconds()
-        
-        # Prepare final results
-        results = {
-            'summaries': all_results,
-            'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S'),
-            'end_time': end_time.strftime('%Y-%m-%d %H:%M:%S'),
-            'duration': duration,
-            'total_pairs': total_pairs,
-            'processing_type': 'semi_open_ended',
-            'settings': {
-                'max_categories': max_categories,
-                'create_merged_column': create_merged_column
-            }
-        }
-        
-        # Mark job as complete
-        progress_tracker.complete_job(job_id, results)
-        
-        print(f"[SEMI_OPEN] Job {job_id} completed successfully", flush=True)
-        
-    except Exception as e:
-        error_msg = str(e)
-        print(f"[SEMI_OPEN ERROR] Processing failed: {error_msg}", flush=True)
-        import traceback
-        traceback.print_exc()
-        progress_tracker.set_error(job_id, error_msg)
+# Legacy threaded semi open-ended runner removed - replaced by Celery tasks in tasks/semi_open.py
+# See tasks.semi_open.process_semi_open_job for current implementation
 
 @main_bp.route('/classification-progress/<job_id>')
 @login_required
@@ -590,19 +467,20 @@ def classification_progress(job_id):
 @main_bp.route('/api/progress/<job_id>')
 @login_required
 def api_progress(job_id):
-    """AJAX polling endpoint - return progress as JSON"""
+    """AJAX polling endpoint - return progress as JSON (fallback when SSE is unavailable)"""
     try:
         progress_data = progress_tracker.get_progress(job_id)
         
-        if not progress_data:
+        # Same owner check as the SSE stream: another user's job is "not found"
+        if not progress_data or progress_tracker.get_owner(job_id) != str(current_user.id):
             print(f"[API_PROGRESS] Job not found: {job_id}")
             return jsonify({
                 'error': 'Job not found',
                 'completed': True
             }), 404
         
-        print(f"[API_PROGRESS] Returning progress for {job_id}: {progress_data.get('progress', 0)}%")
-        response = jsonify(progress_data)
+        # Internal owner fields (_user_id, _company_id) stay server-side
+        response = jsonify({key: value for key, value in progress_data.items() if not key.startswith('_')})
         response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
         response.headers['Pragma'] = 'no-cache'
         response.headers['Expires'] = '0'
@@ -627,7 +505,6 @@ def classification_complete(job_id):
         return redirect(url_for('main.classification_progress'))
     
     if 'results' in progress_data:
-        session['classification_results'] = progress_data['results']
         flash(f'Classification complete! {progress_data["results"]["total_variables"]} variables successfully processed.', 'success')
     
     # Cleanup job data
@@ -639,19 +516,24 @@ def classification_complete(job_id):
 @login_required
 def results():
     """Results page - show classification job history (legacy)"""
-    from app.models import ClassificationJob
-    from sqlalchemy import desc
+    from app.job_listing import list_jobs
     
     try:
-        # Get all completed jobs for current user (most recent first)
-        jobs = ClassificationJob.query.filter_by(
-            user_id=current_user.id,
-            status='completed'
-        ).order_by(desc(ClassificationJob.completed_at)).limit(20).all()
+        # One keyset page of completed jobs (most recently completed first)
+        jobs, next_cursor = list_jobs(
+            current_user.id,
+            statuses=['completed'],
+            cursor=request.args.get('cursor'),
+            limit=20,
+            order_by='completed_at'
+        )
         
         # Pass objects directly to template (need for properties like is_download_available)
-        return render_template('results.html', jobs=jobs)
+        return render_template('results.html', jobs=jobs, next_cursor=next_cursor)
         
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('main.results'))
     except Exception as e:
         print(f"[ERROR] Results page error: {e}")
         import traceback
@@ -663,27 +545,32 @@ def results():
 @login_required
 def jobs():
     """Jobs & Activity page - Modern UI with real-time updates"""
-    from app.models import ClassificationJob
-    from sqlalchemy import desc
+    from app.job_listing import list_jobs
     
     try:
-        # Get all jobs for current user (all statuses: running, completed, failed)
-        all_jobs = ClassificationJob.query.filter_by(
-            user_id=current_user.id
-        ).order_by(desc(ClassificationJob.created_at)).limit(50).all()
-        
-        # Separate by status for tabs
-        running_jobs = [job for job in all_jobs if job.status in ['pending', 'running']]
-        completed_jobs = [job for job in all_jobs if job.status == 'completed']
-        failed_jobs = [job for job in all_jobs if job.status == 'failed']
+        # First keyset page per tab (each query served by the user/status/created_at index);
+        # further pages come from /api/jobs?status=...&cursor=...
+        all_jobs, all_cursor = list_jobs(current_user.id, cursor=request.args.get('cursor'), limit=50)
+        running_jobs, running_cursor = list_jobs(current_user.id, statuses=['pending', 'processing', 'running'])
+        completed_jobs, completed_cursor = list_jobs(current_user.id, statuses=['completed'])
+        failed_jobs, failed_cursor = list_jobs(current_user.id, statuses=['error', 'failed'])
         
         return render_template('jobs.html',
             all_jobs=all_jobs,
             running_jobs=running_jobs,
             completed_jobs=completed_jobs,
-            failed_jobs=failed_jobs
+            failed_jobs=failed_jobs,
+            next_cursors={
+                'all': all_cursor,
+                'running': running_cursor,
+                'completed': completed_cursor,
+                'failed': failed_cursor
+            }
         )
         
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('main.jobs'))
     except Exception as e:
         print(f"[ERROR] Jobs page error: {e}")
         import traceback
@@ -695,9 +582,8 @@ def jobs():
 @login_required
 def bulk_delete_jobs():
     """Bulk delete classification jobs"""
-    import os
-    from app.models import ClassificationJob
     from app import db
+    from app.job_cleanup import delete_jobs, active_job_ids, queue_file_cleanup
     
     try:
         job_ids = request.form.getlist('job_ids[]')
@@ -705,43 +591,22 @@ def bulk_delete_jobs():
             flash('No jobs selected for deletion.', 'warning')
             return redirect(url_for('main.results'))
         
-        deleted_count = 0
-        for job_id in job_ids:
-            job = ClassificationJob.query.filter_by(
-                id=job_id,
-                user_id=current_user.id  # Security: only delete own jobs
-            ).first()
-            
-            if job:
-                # Delete associated files
-                files_to_delete = []
-                if job.input_kobo_path and os.path.exists(job.input_kobo_path):
-                    files_to_delete.append(job.input_kobo_path)
-                if job.input_raw_path and os.path.exists(job.input_raw_path):
-                    files_to_delete.append(job.input_raw_path)
-                if job.output_kobo_path and os.path.exists(job.output_kobo_path):
-                    files_to_delete.append(job.output_kobo_path)
-                if job.output_raw_path and os.path.exists(job.output_raw_path):
-                    files_to_delete.append(job.output_raw_path)
-                
-                # Delete database record (cascade will delete variables)
-                db.session.delete(job)
-                deleted_count += 1
-                
-                # Delete files after successful db deletion
-                for file_path in files_to_delete:
-                    try:
-                        os.remove(file_path)
-                        print(f"[INFO] Deleted file: {file_path}")
-                    except Exception as e:
-                        print(f"[WARNING] Failed to delete file {file_path}: {e}")
-        
+        # One statement for all selected jobs (only own jobs: filtered by user_id)
+        deleted_count, files_to_delete = delete_jobs(current_user.id, job_ids)
         db.session.commit()
         
+        # Files are removed by the janitor worker after the commit
+        queue_file_cleanup(files_to_delete)
+        
         if deleted_count > 0:
             flash(f'Successfully deleted {deleted_count} job(s).', 'success')
         else:
             flash('No jobs were deleted.', 'warning')
+        
+        # Queued/running jobs are skipped by delete_jobs (scheduler + worker still own them)
+        still_active = active_job_ids(current_user.id, job_ids)
+        if still_active:
+            flash(f'{len(still_active)} job(s) still queued or running were not deleted. Cancel them first.', 'warning')
             
     except Exception as e:
         db.session.rollback()
@@ -756,6 +621,48 @@ def bulk_delete_jobs():
 # API ENDPOINTS FOR JOBS PAGE (AJAX)
 # ========================================
 
+@main_bp.route('/api/jobs')
+@login_required
+def api_jobs():
+    """
+    Keyset-paginated job history (JSON)
+    
+    Query params:
+        status: Comma-separated statuses (e.g. completed or error,failed)
+        type: open_ended | semi_open
+        from, to: Created date range (YYYY-MM-DD, inclusive)
+        cursor: next_cursor from the previous page
+        limit: Page size (max 100)
+        user_id: Another user's jobs (super admin only)
+    """
+    from app.job_listing import list_jobs, parse_date
+    
+    user_id = current_user.id
+    requested_user = request.args.get('user_id', type=int)
+    if requested_user is not None and requested_user != current_user.id:
+        if not current_user.is_super_admin:
+            return jsonify({'success': False, 'error': 'Access denied'}), 403
+        user_id = requested_user
+    
+    try:
+        jobs, next_cursor = list_jobs(
+            user_id,
+            statuses=(request.args.get('status') or '').split(','),
+            job_type=request.args.get('type') or None,
+            date_from=parse_date(request.args.get('from')),
+            date_to=parse_date(request.args.get('to')),
+            cursor=request.args.get('cursor'),
+            limit=request.args.get('limit', type=int)
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    return jsonify({
+        'success': True,
+        'jobs': [job.to_summary_dict() for job in jobs],
+        'next_cursor': next_cursor
+    })
+
 @main_bp.route('/api/active-jobs')
 @login_required
 def api_active_jobs():
@@ -765,14 +672,17 @@ def api_active_jobs():
     from tasks.progress import progress_tracker
     
     try:
-        # Fetch ALL progress data from Redis (real-time source)
-        all_redis_jobs = progress_tracker.get_all_jobs()
+        # This user's active jobs from the Redis index (real-time source, no keyspace scan)
+        all_redis_jobs = progress_tracker.get_active_jobs(user_id=current_user.id)
+        
+        # Queue position + expected start for jobs waiting in the scheduler
+        queue_snapshot = scheduler.queue_snapshot()
         
         # Get active jobs from database to filter by user
         db_jobs = ClassificationJob.query.filter_by(
             user_id=current_user.id
         ).filter(
-            ClassificationJob.status.in_(['pending', 'running', 'processing'])
+            ClassificationJob.status.in_(['queued', 'pending', 'running', 'processing'])
         ).order_by(desc(ClassificationJob.created_at)).all()
         
         # Map database jobs to Redis data
@@ -803,7 +713,11 @@ def api_active_jobs():
                 'task_id': db_job.task_id,
                 'total_variables': redis_progress.get('total_variables', db_job.total_variables or 0),
                 'current_variable': redis_progress.get('current_variable'),
-                'variables_completed': redis_progress.get('variables_completed', 0)
+                'variables_completed': redis_progress.get('variables_completed', 0),
+                'queue_position': queue_snapshot.get(job_uuid, {}).get('queue_position'),
+                'queue_lane': queue_snapshot.get(job_uuid, {}).get('lane'),
+                'expected_start': queue_snapshot.get(job_uuid, {}).get('expected_start'),
+                'wait_seconds': queue_snapshot.get(job_uuid, {}).get('wait_seconds')
             })
         
         return jsonify({'jobs': jobs_data})
@@ -829,22 +743,35 @@ def api_cancel_job(job_id):
         if not job:
             return jsonify({'error': 'Job not found'}), 404
         
-        if job.status not in ['pending', 'running', 'processing']:
+        if job.status not in ['queued', 'pending', 'running', 'processing']:
             return jsonify({'error': 'Job is not running'}), 400
         
-        # Revoke Celery task
+        # Cancel token: running tasks stop between batches and free their worker
+        request_cancel(job.job_id)
+        
+        # Remove from scheduler (waiting or running slot)
+        scheduler.release(job.job_id)
+        
+        # Revoke Celery task if it is still queued (running tasks stop cooperatively)
         if job.task_id:
-            celery_app.control.revoke(job.task_id, terminate=True, signal='SIGKILL')
+            celery_app.control.revoke(job.task_id)
             print(f"[CANCEL] Revoked Celery task {job.task_id} for job {job_id}")
         
         # Update job status in database
         job.status = 'cancelled'
         job.error_message = 'Cancelled by user'
+        job.completed_at = datetime.utcnow()
         db.session.commit()
         
-        # Delete progress from Redis
-        progress_tracker.delete_progress(str(job.id))
-        print(f"[CANCEL] Deleted Redis progress for job {job_id}")
+        # Mark progress as cancelled (progress page + scheduler see a terminal status)
+        progress_tracker.update_progress(
+            job.job_id,
+            status='cancelled',
+            current_step='Cancelled',
+            error='Job cancelled by user',
+            completed_at=datetime.utcnow().isoformat()
+        )
+        print(f"[CANCEL] Cancel requested for job {job.job_id}")
         
         return jsonify({
             'success': True,
@@ -860,41 +787,20 @@ def api_cancel_job(job_id):
 @login_required
 def api_delete_job(job_id):
     """API: Delete a classification job (AJAX endpoint)"""
-    import os
-    from app.models import ClassificationJob
     from app import db
+    from app.job_cleanup import delete_jobs, active_job_ids, queue_file_cleanup
     
     try:
-        job = ClassificationJob.query.filter_by(
-            id=job_id,
-            user_id=current_user.id  # Security: only delete own jobs
-        ).first()
-        
-        if not job:
+        # Security: only delete own jobs (filtered by user_id)
+        deleted_count, files_to_delete = delete_jobs(current_user.id, [job_id])
+        if not deleted_count:
+            if active_job_ids(current_user.id, [job_id]):
+                return jsonify({'error': 'Job is still queued or running. Cancel it first.'}), 409
             return jsonify({'error': 'Job not found'}), 404
-        
-        # Delete associated files
-        files_to_delete = []
-        if job.input_kobo_path and os.path.exists(job.input_kobo_path):
-            files_to_delete.append(job.input_kobo_path)
-        if job.input_raw_path and os.path.exists(job.input_raw_path):
-            files_to_delete.append(job.input_raw_path)
-        if job.output_kobo_path and os.path.exists(job.output_kobo_path):
-            files_to_delete.append(job.output_kobo_path)
-        if job.output_raw_path and os.path.exists(job.output_raw_path):
-            files_to_delete.append(job.output_raw_path)
-        
-        # Delete database record (cascade will delete variables)
-        db.session.delete(job)
         db.session.commit()
         
-        # Delete files after successful db deletion
-        for file_path in files_to_delete:
-            try:
-                os.remove(file_path)
-                print(f"[INFO] Deleted file: {file_path}")
-            except Exception as e:
-                print(f"[WARNING] Failed to delete file {file_path}: {e}")
+        # Files are removed by the janitor worker after the commit
+        queue_file_cleanup(files_to_delete)
         
         return jsonify({
             'success': True,
@@ -909,11 +815,27 @@ def api_delete_job(job_id):
         return jsonify({'error': str(e)}), 500
 
 
+@main_bp.route('/api/admin/janitor')
+@login_required
+def api_admin_janitor():
+    """API: File cleanup metrics (last sweep + reclaimed space) - Super Admin Only"""
+    from tasks.janitor import janitor_stats
+    
+    if not current_user.is_super_admin:
+        return jsonify({'error': 'Access denied'}), 403
+    
+    try:
+        return jsonify({'success': True, **janitor_stats()})
+    except Exception as e:
+        print(f"[ERROR] Janitor stats error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
 @main_bp.route('/admin/analytics')
 @login_required
 def admin_analytics():
     """Admin Analytics Dashboard - Super Admin Only"""
-    from app.models import ClassificationJob, ClassificationVariable, User
+    from app.models import ClassificationJob, User
     from sqlalchemy import func, desc
     
     # Check if user is super admin
@@ -922,60 +844,67 @@ def admin_analytics():
         return redirect(url_for('main.dashboard'))
     
     try:
-        # Get all completed jobs (all users)
-        all_jobs = ClassificationJob.query.filter_by(status='completed').all()
+        completed = ClassificationJob.status == 'completed'
         
-        # Calculate global statistics
-        total_jobs = len(all_jobs)
-        total_responses = sum(job.total_responses or 0 for job in all_jobs)
-        total_variables = sum(job.total_variables or 0 for job in all_jobs)
-        total_duration_seconds = sum(job.duration_seconds or 0 for job in all_jobs)
+        # Job duration in seconds, computed by the database
+        if db.engine.dialect.name == 'postgresql':
+            duration = func.extract('epoch', ClassificationJob.completed_at - ClassificationJob.started_at)
+        else:
+            duration = (func.julianday(ClassificationJob.completed_at) - func.julianday(ClassificationJob.started_at)) * 86400
+        
+        # Global statistics (one aggregate query over denormalized job totals)
+        total_jobs, total_responses, total_variables, total_duration_seconds = db.session.query(
+            func.count(ClassificationJob.id),
+            func.coalesce(func.sum(ClassificationJob.total_responses), 0),
+            func.coalesce(func.sum(ClassificationJob.total_variables), 0),
+            func.coalesce(func.sum(duration), 0)
+        ).filter(completed).one()
+        total_responses = int(total_responses)
+        total_variables = int(total_variables)
+        total_duration_seconds = float(total_duration_seconds)
         
         # Averages
         avg_variables_per_job = total_variables / total_jobs if total_jobs > 0 else 0
         avg_duration_per_job = total_duration_seconds / total_jobs if total_jobs > 0 else 0
         avg_responses_per_var = total_responses / total_variables if total_variables > 0 else 0
         
-        # Get unique active users
-        active_user_ids = set(job.user_id for job in all_jobs)
-        total_active_users = len(active_user_ids)
+        # Per-user statistics (GROUP BY user, sorted by job count)
+        job_count = func.count(ClassificationJob.id)
+        rows = db.session.query(
+            User.id,
+            User.full_name,
+            User.email,
+            job_count,
+            func.coalesce(func.sum(ClassificationJob.total_variables), 0),
+            func.coalesce(func.sum(ClassificationJob.total_responses), 0),
+            func.coalesce(func.sum(duration), 0),
+            func.max(ClassificationJob.completed_at)
+        ).join(ClassificationJob, ClassificationJob.user_id == User.id).filter(
+            completed
+        ).group_by(User.id, User.full_name, User.email).order_by(desc(job_count)).all()
         
-        # Calculate user statistics manually (can't use property in SQL)
         user_stats = []
-        for user_id in active_user_ids:
-            user = User.query.get(user_id)
-            if not user:
-                continue
-            
-            # Get jobs for this user
-            user_jobs = [job for job in all_jobs if job.user_id == user_id]
-            
-            # Calculate stats
-            job_count = len(user_jobs)
-            total_vars = sum(job.total_variables or 0 for job in user_jobs)
-            total_resp = sum(job.total_responses or 0 for job in user_jobs)
-            total_duration = sum(job.duration_seconds or 0 for job in user_jobs)
-            avg_duration = total_duration / job_count if job_count > 0 else 0
-            last_activity = max((job.completed_at for job in user_jobs if job.completed_at), default=None)
-            
+        for user_id, full_name, email, count, total_vars, total_resp, user_duration, last_activity in rows:
+            if isinstance(last_activity, str):
+                last_activity = datetime.fromisoformat(last_activity)  # SQLite returns text for max()
             user_stats.append({
-                'id': user.id,
-                'full_name': user.full_name,
-                'email': user.email,
-                'job_count': job_count,
-                'total_vars': total_vars,
-                'total_resp': total_resp,
-                'avg_duration': avg_duration,
+                'id': user_id,
+                'full_name': full_name,
+                'email': email,
+                'job_count': count,
+                'total_vars': int(total_vars),
+                'total_resp': int(total_resp),
+                'avg_duration': float(user_duration) / count if count > 0 else 0,
                 'last_activity': last_activity
             })
-        
-        # Sort by job count descending
-        user_stats.sort(key=lambda x: x['job_count'], reverse=True)
+        total_active_users = len(user_stats)
         
         # Find rankings
         most_active_user = user_stats[0] if user_stats else None
         fastest_user = min(user_stats, key=lambda x: x['avg_duration']) if user_stats else None
-        largest_project = max(all_jobs, key=lambda x: x.total_responses or 0) if all_jobs else None
+        largest_project = ClassificationJob.query.filter(completed).order_by(
+            desc(ClassificationJob.total_responses)
+        ).first()
         
         return render_template('admin_analytics.html',
             total_jobs=total_jobs,
@@ -1004,8 +933,8 @@ def admin_analytics():
 @login_required
 def admin_user_jobs(user_id):
     """View all jobs for a specific user - Super Admin Only"""
-    from app.models import ClassificationJob, User
-    from sqlalchemy import desc
+    from app.models import User
+    from app.job_listing import list_jobs, job_totals
     
     # Check if user is super admin
     if not current_user.is_super_admin:
@@ -1016,17 +945,26 @@ def admin_user_jobs(user_id):
         # Get user info
         user = User.query.get_or_404(user_id)
         
-        # Get all completed jobs for this user
-        jobs = ClassificationJob.query.filter_by(
-            user_id=user_id,
-            status='completed'
-        ).order_by(desc(ClassificationJob.completed_at)).all()
+        # One keyset page of completed jobs + totals over all of them (daily rollup)
+        jobs, next_cursor = list_jobs(
+            user_id,
+            statuses=['completed'],
+            cursor=request.args.get('cursor'),
+            limit=50,
+            order_by='completed_at'
+        )
+        totals = job_totals(user_id)
         
         return render_template('admin_user_jobs.html',
             user=user,
-            jobs=jobs
+            jobs=jobs,
+            totals=totals,
+            next_cursor=next_cursor
         )
         
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('main.admin_user_jobs', user_id=user_id))
     except Exception as e:
         print(f"[ERROR] Admin user jobs error: {e}")
         import traceback
@@ -1077,6 +1015,49 @@ def view_result(job_id):
         return redirect(url_for('main.results'))
 
 
+@main_bp.route('/api/results/<int:job_id>/responses')
+@login_required
+def api_job_responses(job_id):
+    """
+    Search classified answers of a job (JSON, paginated)
+    
+    Query params:
+        variable: Only this variable
+        q: Text filter on the answer
+        category: Only this category
+        max_confidence: Only answers with confidence <= value
+        sort: confidence (default) | row
+        order: asc (default, lowest confidence first) | desc
+        page, per_page: Pagination (per_page max 500)
+    """
+    from app.models import ClassificationJob
+    from app.response_store import search_responses, response_categories
+    
+    job = ClassificationJob.query.filter_by(id=job_id).first()
+    if not job or (job.user_id != current_user.id and not current_user.is_super_admin):
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    
+    variable = request.args.get('variable') or None
+    try:
+        page = search_responses(
+            job.id,
+            variable=variable,
+            q=(request.args.get('q') or '').strip() or None,
+            category=request.args.get('category') or None,
+            max_confidence=request.args.get('max_confidence', type=float),
+            sort=request.args.get('sort', 'confidence'),
+            order=request.args.get('order', 'asc'),
+            page=request.args.get('page', 1, type=int),
+            per_page=request.args.get('per_page', type=int)
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    page['success'] = True
+    page['categories'] = response_categories(job.id, variable=variable)
+    return jsonify(page)
+
+
 @main_bp.route('/download-file/<path:filename>')
 @login_required
 def download_file(filename):
@@ -1107,10 +1088,8 @@ def download_file(filename):
 def download_job(job_id):
     """Download classification job results as ZIP (2 files: kobo + raw)"""
     import os
-    import zipfile
-    from io import BytesIO
-    from flask import send_file
     from app.models import ClassificationJob
+    from app.downloads import send_bundle
     
     # Get job
     job = ClassificationJob.query.filter_by(id=job_id, user_id=current_user.id).first()
@@ -1129,39 +1108,18 @@ def download_job(job_id):
         flash('Output files not found', 'error')
         return redirect(url_for('main.results'))
     
-    if not os.path.exists(job.output_kobo_path) or not os.path.exists(job.output_raw_path):
+    storage = get_storage()
+    if not storage.exists(job.output_kobo_path) or not storage.exists(job.output_raw_path):
         flash('Output files not found on server', 'error')
         return redirect(url_for('main.results'))
     
-    # Create ZIP in memory
-    memory_file = BytesIO()
-    
-    with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zf:
-        # Add kobo file
-        zf.write(job.output_kobo_path, arcname=job.output_kobo_filename)
-        # Add raw file
-        zf.write(job.output_raw_path, arcname=job.output_raw_filename)
-    
-    memory_file.seek(0)
-    
-    # Generate ZIP filename with original name + timestamp
-    import re
-    original_base = re.sub(r'\d+\.xlsx$', '', job.original_raw_filename or 'results')
-    zip_filename = f"classified_{original_base}_{job.completed_at.strftime('%Y%m%d_%H%M%S')}.zip"
-    
-    response = send_file(
-        memory_file,
-        mimetype='application/zip',
-        as_attachment=True,
-        download_name=zip_filename
-    )
-    
-    # Add cache control headers to prevent caching
-    response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-    response.headers['Pragma'] = 'no-cache'
-    response.headers['Expires'] = '0'
-    
-    return response
+    # Pre-built bundle (built at completion), handed to nginx or streamed from disk
+    try:
+        return send_bundle(job)
+    except OSError as e:
+        print(f"[ERROR] Download bundle error for job {job.id}: {e}", flush=True)
+        flash('Output files could not be packaged', 'error')
+        return redirect(url_for('main.results'))
 
 @main_bp.route('/admin/settings')
 @login_required
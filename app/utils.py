@@ -4,8 +4,10 @@ File Upload and Processing Utilities
 import os
 import pandas as pd
 from werkzeug.utils import secure_filename
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 from semi_open_detector import SemiOpenDetector
+from form_schema import FormSchema
+from semi_open_processor import lainnya_mask
 
 class FileProcessor:
     """Process uploaded files for classification"""
@@ -51,6 +53,23 @@ class FileProcessor:
         file.save(filepath)
         return filepath, original_filename
     
+    def store_file(self, file) -> tuple:
+        """
+        Save uploaded file content-addressed in storage (hashed while streaming, deduplicated)
+        
+        Args:
+            file: FileStorage object
+        
+        Returns:
+            tuple: (storage_ref, original_filename, file_hash, reused)
+        """
+        from upload_store import save_stream
+        
+        original_filename = secure_filename(file.filename)
+        extension = os.path.splitext(original_filename)[1] or '.xlsx'
+        ref, file_hash, reused = save_stream(file.stream, extension)
+        return ref, original_filename, file_hash, reused
+    
     def detect_open_ended_variables(self, kobo_system_path: str) -> List[Dict]:
         """
         Auto-detect open-ended variables from Kobo System file
@@ -73,14 +92,13 @@ class FileProcessor:
             List of dicts with variable info: {name, label, type}
         """
         try:
-            with pd.ExcelFile(kobo_system_path) as xl:
-                if 'survey' not in xl.sheet_names:
-                    return []
-            
-            df_survey = pd.read_excel(kobo_system_path, sheet_name='survey')
+            # Compiled schema (parsed once per form, cached by file hash)
+            schema = FormSchema.load(kobo_system_path)
+            if not schema.has_survey:
+                return []
             
             # Required columns
-            if 'type' not in df_survey.columns or 'name' not in df_survey.columns:
+            if 'type' not in schema.survey_columns or 'name' not in schema.survey_columns:
                 return []
             
             # Field profil yang harus di-exclude (exact match)
@@ -107,10 +125,10 @@ class FileProcessor:
             detected_vars = []
             skipped_vars = []
             
-            for idx, row in df_survey.iterrows():
+            for row in schema.survey_rows:
                 var_type = str(row['type']).lower().strip()
                 var_name = str(row['name']).strip()
-                var_label = str(row.get('label', var_name))
+                var_label = str(row.get('label') or var_name)
                 
                 # Filter 1: Must be text type
                 if var_type != 'text':
@@ -183,19 +201,21 @@ class FileProcessor:
             print(f"Error detecting semi open-ended pairs: {e}")
             return []
     
-    def get_semi_open_statistics(self, raw_data_path: str, pair: Dict) -> Dict:
+    def get_semi_open_statistics(self, raw_data_path: str, pair: Dict, df: Optional[pd.DataFrame] = None) -> Dict:
         """
         Get statistics for semi open-ended pair
         
         Args:
             raw_data_path: Path to raw data Excel file
             pair: Semi open-ended pair info
+            df: Raw data already loaded (skips re-reading the file)
         
         Returns:
             Dict with statistics
         """
         try:
-            df = pd.read_excel(raw_data_path, sheet_name=0)
+            if df is None:
+                df = pd.read_excel(raw_data_path, sheet_name=0)
             
             select_var = pair['select_var']
             text_var = pair['text_var']
@@ -204,15 +224,16 @@ class FileProcessor:
             if select_var not in df.columns or text_var not in df.columns:
                 return {'error': 'Variables not found'}
             
-            # Count responses where 'Lainnya' was selected
-            lainnya_mask = df[select_var] == lainnya_code
-            lainnya_count = lainnya_mask.sum()
+            # Count responses where 'Lainnya' was selected (select_one or select_multiple)
+            selected_lainnya = lainnya_mask(df[select_var], lainnya_code)
+            lainnya_count = selected_lainnya.sum()
             
             # Count how many have text filled
-            text_filled = df.loc[lainnya_mask, text_var].notna().sum()
+            text_filled = df.loc[selected_lainnya, text_var].notna().sum()
+            filled_texts = df.loc[selected_lainnya, text_var].dropna().astype(str).str.strip()
             
             # Sample text
-            sample_texts = df.loc[lainnya_mask & df[text_var].notna(), text_var].head(3).tolist()
+            sample_texts = df.loc[selected_lainnya & df[text_var].notna(), text_var].head(3).tolist()
             
             # Check if merged column exists
             merged_col = f"{select_var}_merged"
@@ -221,6 +242,8 @@ class FileProcessor:
             stats = {
                 'lainnya_count': int(lainnya_count),
                 'text_filled_count': int(text_filled),
+                'unique_text_count': int(filled_texts.nunique()),
+                'avg_length': round(filled_texts.str.len().mean(), 1) if len(filled_texts) else 0,
                 'sample_texts': sample_texts,
                 'has_merged_column': has_merged,
                 'classification_status': 'completed' if has_merged else 'not_started'
@@ -231,19 +254,21 @@ class FileProcessor:
         except Exception as e:
             return {'error': str(e)}
     
-    def get_variable_statistics(self, raw_data_path: str, var_name: str) -> Dict:
+    def get_variable_statistics(self, raw_data_path: str, var_name: str, df: Optional[pd.DataFrame] = None) -> Dict:
         """
         Get statistics for a specific variable from raw data
         
         Args:
             raw_data_path: Path to raw data Excel file
             var_name: Variable name
+            df: Raw data already loaded (skips re-reading the file)
         
         Returns:
             Dict with statistics
         """
         try:
-            df = pd.read_excel(raw_data_path, sheet_name=0)
+            if df is None:
+                df = pd.read_excel(raw_data_path, sheet_name=0)
             
             if var_name not in df.columns:
                 return {'error': 'Variable not found'}
@@ -263,6 +288,7 @@ class FileProcessor:
             
             stats = {
                 'response_count': int(len(non_null_values)),
+                'unique_count': int(non_null_values.str.strip().nunique()),
                 'avg_length': round(avg_length, 1),
                 'sample_data': sample[:100] + '...' if len(str(sample)) > 100 else sample
             }
@@ -294,18 +320,20 @@ class FileProcessor:
         except Exception as e:
             return {'error': str(e)}
     
-    def validate_excel_structure(self, excel_path: str) -> Tuple[bool, str]:
+    def validate_excel_structure(self, excel_path: str, df: Optional[pd.DataFrame] = None) -> Tuple[bool, str]:
         """
         Validate Excel file structure
         
         Args:
             excel_path: Path to Excel file
+            df: Data already loaded (skips re-reading the file)
         
         Returns:
             Tuple of (is_valid, error_message)
         """
         try:
-            df = pd.read_excel(excel_path, sheet_name=0)
+            if df is None:
+                df = pd.read_excel(excel_path, sheet_name=0)
             
             if df.empty:
                 return False, "Excel file is empty"
@@ -318,18 +346,20 @@ class FileProcessor:
         except Exception as e:
             return False, f"Error reading Excel: {str(e)}"
     
-    def get_file_info(self, excel_path: str) -> Dict:
+    def get_file_info(self, excel_path: str, df: Optional[pd.DataFrame] = None) -> Dict:
         """
         Get basic information about Excel file
         
         Args:
             excel_path: Path to Excel file
+            df: Data already loaded (skips re-reading the file)
         
         Returns:
             Dict with file info
         """
         try:
-            df = pd.read_excel(excel_path, sheet_name=0)
+            if df is None:
+                df = pd.read_excel(excel_path, sheet_name=0)
             
             return {
                 'rows': len(df),
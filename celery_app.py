@@ -7,32 +7,51 @@ This module initializes Celery for asynchronous task processing:
 - Tasks survive browser close/logout
 - Redis as message broker and result backend
 - Multiple workers for concurrent processing
+- Results stored with compact_codec (msgpack + zstd); tasks return only a
+  small pointer, the full summary lives in ClassificationJob.results_summary
 """
 
 from celery import Celery
-from celery.signals import task_prerun, task_postrun, task_failure
+from celery.signals import task_prerun, task_postrun, task_failure, worker_process_init
+from kombu.serialization import register
 import os
+import time
 from dotenv import load_dotenv
 
+import compact_codec
+
 # Load environment variables
 load_dotenv()
 
+BOOT_STARTED = time.perf_counter()
+
 # Redis configuration from environment
 REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379')
 
+# Compact result serializer (also readable by every worker/web process)
+register(
+    'msgpack-zstd',
+    compact_codec.pack,
+    compact_codec.unpack,
+    content_type=compact_codec.CONTENT_TYPE,
+    content_encoding='binary'
+)
+
 # Initialize Celery app
 celery_app = Celery(
     'mcoder',
     broker=f'{REDIS_URL}/0',  # Redis DB 0 for message queue
-    backend=f'{REDIS_URL}/1'   # Redis DB 1 for result storage
+    backend=f'{REDIS_URL}/1',  # Redis DB 1 for result storage
+    include=['tasks.classification', 'tasks.semi_open', 'tasks.scheduler', 'tasks.upload_analysis', 'tasks.janitor']
 )
 
 # Celery configuration
 celery_app.conf.update(
     # Serialization
     task_serializer='json',
-    accept_content=['json'],
-    result_serializer='json',
+    accept_content=['json', 'msgpack-zstd'],
+    result_serializer='msgpack-zstd',
+    result_accept_content=['json', 'msgpack-zstd'],
     
     # Timezone
     timezone='Asia/Jakarta',
@@ -41,7 +60,23 @@ celery_app.conf.update(
     # Task routing
     task_routes={
         'tasks.classification.*': {'queue': 'classification'},
+        'tasks.semi_open.*': {'queue': 'classification'},
         'tasks.progress.*': {'queue': 'default'},
+        'tasks.scheduler.*': {'queue': 'default'},
+        'tasks.upload_analysis.*': {'queue': 'analysis'},
+        'tasks.janitor.*': {'queue': 'default'},
+    },
+    
+    # Periodic tasks (run `celery -A celery_app beat`)
+    beat_schedule={
+        'scheduler-dispatch': {
+            'task': 'tasks.scheduler.dispatch_pending',
+            'schedule': 15.0,  # seconds
+        },
+        'janitor-sweep': {
+            'task': 'tasks.janitor.sweep',
+            'schedule': float(os.getenv('JANITOR_INTERVAL', '3600')),  # seconds
+        },
     },
     
     # Worker settings
@@ -73,6 +108,22 @@ celery_app.conf.update(
 celery_app.autodiscover_tasks(['tasks'])
 
 
+# Worker lifecycle: one Flask app + DB engine per worker process
+@worker_process_init.connect
+def worker_process_init_handler(**extra):
+    """Build the process-wide app once (tasks reuse it via app.get_app)"""
+    started = time.perf_counter()
+    from app import get_app, db
+    
+    app = get_app()
+    with app.app_context():
+        db.engine.dispose()  # don't share pooled connections inherited from the parent
+    
+    print(f"[WORKER BOOT] pid {os.getpid()}: app ready in {(time.perf_counter() - started) * 1000:.0f} ms, "
+          f"{time.perf_counter() - BOOT_STARTED:.2f}s after celery_app import "
+          f"(import breakdown: python worker_boot_report.py)", flush=True)
+
+
 # Celery signals for logging
 @task_prerun.connect
 def task_prerun_handler(sender=None, task_id=None, task=None, args=None, kwargs=None, **extra):
@@ -8,7 +8,10 @@ Usage:
     python celery_worker.py
 
 Or with more options:
-    celery -A celery_app worker --loglevel=info --concurrency=4 -Q classification,default
+    celery -A celery_app worker --loglevel=info --concurrency=4 -Q classification,classification_fast,default,analysis
+
+Scheduler (fair queueing safety net):
+    celery -A celery_app beat --loglevel=info
 """
 
 import os
@@ -26,7 +29,7 @@ if __name__ == '__main__':
         'worker',
         '--loglevel=info',
         '--concurrency=4',  # 4 concurrent workers
-        '-Q', 'classification,default',  # Listen to both queues
+        '-Q', 'classification,classification_fast,default,analysis',  # Regular + fast lane + default + upload analysis
         '-n', 'worker@%h',  # Worker name
         '--logfile=/var/log/mcoder/celery.log',  # Log file
         '--pidfile=/tmp/celery-mcoder.pid',  # PID file
@@ -0,0 +1,144 @@
+"""
+Columnar Raw Data Cache
+Baca raw data Excel SEKALI per file, lalu simpan per kolom (pickle) supaya
+setiap subtask variable hanya load kolom yang dibutuhkan (tanpa parse Excel lagi).
+
+ensure_columnar_cache() menyimpan cache per hash isi raw data
+(<cache_root>/<sha256>/), jadi job berikutnya atas file yang sama langsung
+memakai cache yang sudah ada. Cache ini dipakai bersama: job tidak menghapusnya.
+
+Layout cache_dir:
+    manifest.pkl   -> {'columns': [...], 'files': {column: filename}, 'rows': N, 'profile': {...}}
+    col_00000.pkl  -> pd.Series (satu kolom, index = posisi baris di raw data)
+"""
+import os
+import shutil
+import uuid
+from typing import Dict, List, Optional, Tuple
+import pandas as pd
+
+
+MANIFEST_FILE = 'manifest.pkl'
+
+# Always node-local (not in storage.py): every worker node builds its own copy once per file hash
+CACHE_ROOT = os.getenv('COLUMNAR_CACHE_DIR', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'files', 'cache', 'columnar'))
+
+
+def _column_filename(position: int) -> str:
+    """Column file name by position (column names may not be filename-safe)"""
+    return f"col_{position:05d}.pkl"
+
+
+def profile_columns(df: pd.DataFrame, columns: List[str]) -> Dict[str, Dict]:
+    """
+    Lightweight profile for the columns that will be classified
+
+    Returns:
+        Dict column -> {'non_empty', 'unique', 'has_coded'}
+    """
+    profile = {}
+    for column in columns:
+        if column not in df.columns:
+            continue
+        values = df[column].dropna().astype(str).str.strip()
+        values = values[values != '']
+        profile[column] = {
+            'non_empty': int(len(values)),
+            'unique': int(values.nunique()),
+            'has_coded': f"{column}_coded" in df.columns
+        }
+    return profile
+
+
+def build_columnar_cache(raw_data_path: str, cache_dir: str, profile_for: Optional[List[str]] = None) -> Dict:
+    """
+    Read raw data once and write one pickle per column
+
+    Args:
+        raw_data_path: Path to raw data Excel (first sheet)
+        cache_dir: Target directory (created if missing)
+        profile_for: Column names to profile (e.g. selected variables)
+
+    Returns:
+        dict: Manifest
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+
+    df = pd.read_excel(raw_data_path, sheet_name=0)
+
+    files = {}
+    for position, column in enumerate(df.columns):
+        filename = _column_filename(position)
+        df[column].to_pickle(os.path.join(cache_dir, filename))
+        files[column] = filename
+
+    manifest = {
+        'columns': list(df.columns),
+        'files': files,
+        'rows': len(df),
+        'profile': profile_columns(df, profile_for or [])
+    }
+    pd.to_pickle(manifest, os.path.join(cache_dir, MANIFEST_FILE))
+
+    return manifest
+
+
+def ensure_columnar_cache(raw_data_path: str, cache_root: str, file_hash: str,
+                          profile_for: Optional[List[str]] = None) -> Tuple[str, Dict]:
+    """
+    Columnar cache of a raw data file, shared by every job on the same content
+
+    Built into a temporary directory and renamed into place, so concurrent
+    jobs never read a partial cache.
+
+    Args:
+        raw_data_path: Path to raw data Excel (first sheet)
+        cache_root: Directory holding one cache per file hash
+        file_hash: SHA-256 of the raw data file
+        profile_for: Column names to profile (e.g. selected variables)
+
+    Returns:
+        tuple: (cache_dir, manifest) - manifest['profile'] is for profile_for
+    """
+    cache_dir = os.path.join(cache_root, file_hash)
+
+    if os.path.exists(os.path.join(cache_dir, MANIFEST_FILE)):
+        os.utime(cache_dir)  # recently used (cache pruning goes by mtime)
+        manifest = load_manifest(cache_dir)
+        columns = profile_for or []
+        manifest['profile'] = profile_columns(load_columns(cache_dir, columns + [f"{c}_coded" for c in columns]), columns)
+        return cache_dir, manifest
+
+    tmp_dir = os.path.join(cache_root, f'.{file_hash}.{uuid.uuid4().hex}')
+    manifest = build_columnar_cache(raw_data_path, tmp_dir, profile_for=profile_for)
+    try:
+        os.rename(tmp_dir, cache_dir)
+    except OSError:
+        # Another job finished the same cache first
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return cache_dir, manifest
+
+
+def load_manifest(cache_dir: str) -> Dict:
+    """Load cache manifest"""
+    return pd.read_pickle(os.path.join(cache_dir, MANIFEST_FILE))
+
+
+def load_columns(cache_dir: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Load columns from the cache (all columns if None)
+
+    Columns missing from the raw data are skipped; the original column order is kept.
+
+    Returns:
+        DataFrame aligned to the raw data row positions
+    """
+    manifest = load_manifest(cache_dir)
+    wanted = manifest['columns'] if columns is None else [c for c in manifest['columns'] if c in set(columns)]
+
+    data = {
+        column: pd.read_pickle(os.path.join(cache_dir, manifest['files'][column]))
+        for column in wanted
+    }
+    return pd.DataFrame(data, index=pd.RangeIndex(manifest['rows']), columns=wanted)
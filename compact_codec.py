@@ -0,0 +1,100 @@
+"""
+Compact Payload Codec
+M-Code Pro - msgpack + zstd untuk payload di Redis
+
+Progress (DB 2) dan Celery results (DB 1) sebelumnya disimpan sebagai JSON
+mentah. Codec ini dipakai untuk payload besar:
+- pack():   msgpack, dikompres zstd kalau >= COMPRESS_MIN_BYTES
+- unpack(): kebalikannya; nilai JSON lama tetap bisa dibaca
+
+Format (prefix 0x00 tidak pernah muncul di awal teks JSON):
+    b'\\x00mz' + zstd(msgpack(obj))
+    b'\\x00mp' + msgpack(obj)
+
+Tipe yang tidak dikenal msgpack di-encode seperti json.dumps(default=str):
+datetime/date -> isoformat, lainnya -> str().
+"""
+
+import os
+import json
+import threading
+from datetime import date, datetime
+from typing import Any, Union
+
+import msgpack
+import zstandard
+
+ZSTD_MAGIC = b'\x00mz'
+MSGPACK_MAGIC = b'\x00mp'
+
+COMPRESS_MIN_BYTES = int(os.getenv('CODEC_COMPRESS_MIN_BYTES', '512'))
+ZSTD_LEVEL = int(os.getenv('CODEC_ZSTD_LEVEL', '3'))
+
+CONTENT_TYPE = 'application/x-msgpack-zstd'
+
+# zstd (de)compressor objects are not thread-safe: one per thread
+_local = threading.local()
+
+
+def _compressor() -> 'zstandard.ZstdCompressor':
+    if not hasattr(_local, 'compressor'):
+        _local.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+    return _local.compressor
+
+
+def _decompressor() -> 'zstandard.ZstdDecompressor':
+    if not hasattr(_local, 'decompressor'):
+        _local.decompressor = zstandard.ZstdDecompressor()
+    return _local.decompressor
+
+
+def _default(obj: Any) -> Any:
+    """Fallback for types msgpack can't encode (same result as json default=str)"""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    return str(obj)
+
+
+def is_packed(data: Union[bytes, str]) -> bool:
+    """True when data was produced by pack()"""
+    return isinstance(data, bytes) and data[:3] in (ZSTD_MAGIC, MSGPACK_MAGIC)
+
+
+def pack(obj: Any) -> bytes:
+    """
+    Serialize obj to compact bytes
+
+    Args:
+        obj: JSON-like value (dict/list/str/number/bool/None, datetimes allowed)
+
+    Returns:
+        bytes: prefixed msgpack, zstd-compressed when large enough
+    """
+    payload = msgpack.packb(obj, default=_default, use_bin_type=True)
+    if len(payload) >= COMPRESS_MIN_BYTES:
+        return ZSTD_MAGIC + _compressor().compress(payload)
+    return MSGPACK_MAGIC + payload
+
+
+def unpack(data: Union[bytes, str]) -> Any:
+    """
+    Deserialize pack() output (or a legacy JSON value)
+
+    Args:
+        data: bytes from pack(), or JSON text/bytes
+
+    Returns:
+        The original value
+    """
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    if isinstance(data, bytes):
+        prefix = data[:3]
+        if prefix == ZSTD_MAGIC:
+            return msgpack.unpackb(_decompressor().decompress(data[3:]), raw=False, strict_map_key=False)
+        if prefix == MSGPACK_MAGIC:
+            return msgpack.unpackb(data[3:], raw=False, strict_map_key=False)
+    return json.loads(data)
+
+
+__all__ = ['pack', 'unpack', 'is_packed', 'CONTENT_TYPE', 'COMPRESS_MIN_BYTES']
@@ -22,11 +22,12 @@ class Config:
     
     # Database Connection Pool (for concurrent Celery workers)
     SQLALCHEMY_ENGINE_OPTIONS = {
-        'pool_size': 20,           # Number of connections to maintain
-        'max_overflow': 40,        # Maximum additional connections during burst
+        # Per process: keep GUNICORN_WORKERS x (pool_size + max_overflow) under max_connections
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', '20')),        # Number of connections to maintain
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', '40')),  # Maximum additional connections during burst
         'pool_pre_ping': True,     # Verify connection before using
         'pool_recycle': 3600,      # Recycle connections after 1 hour
-        'pool_timeout': 30,        # Timeout for getting connection (seconds)
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', '30')),  # Timeout for getting connection (seconds)
         'echo': False              # Don't log SQL queries (set True for debugging)
     }
     
@@ -41,6 +42,14 @@ class Config:
     UPLOAD_FOLDER = os.path.join(BASE_DIR, 'files', 'uploads')
     MAX_CONTENT_LENGTH = 50 * 1024 * 1024  # 50MB max file size
     
+    # Job outputs + pre-built download bundles (app/downloads.py)
+    OUTPUT_FOLDER = os.path.join(BASE_DIR, 'files', 'output')
+    # nginx internal location for X-Accel-Redirect (e.g. /protected-output); empty = stream from Flask
+    DOWNLOAD_ACCEL_PREFIX = os.environ.get('DOWNLOAD_ACCEL_PREFIX', '')
+    
+    # Push-based progress (sse_app.py behind nginx /sse/); page falls back to polling
+    SSE_URL_PREFIX = os.environ.get('SSE_URL_PREFIX', '/sse')
+    
     # Application settings
     APP_NAME = 'InsightCoder Platform'
     APP_VERSION = '1.0.0'
@@ -8,7 +8,10 @@ import os
 import sys
 from datetime import datetime
 from openai_classifier import OpenAIClassifier
-from parallel_classifier import ParallelClassifier
+from parallel_classifier import ParallelClassifier, JobCancelled
+from kobo_form_patcher import KoboFormPatcher
+from form_schema import FormSchema
+from storage import get_storage
 from dotenv import load_dotenv
 
 # Set UTF-8 encoding for Windows console
@@ -20,6 +23,55 @@ if sys.platform == 'win32':
 # Load environment variables
 load_dotenv()
 
+
+def insert_coded_column(df_raw, variable_name, codes):
+    """
+    Insert `{variable_name}_coded` right after the original column (or update if exists)
+    
+    Args:
+        df_raw: Raw data DataFrame (modified in place)
+        variable_name: Original variable name
+        codes: Code per row (string or None), aligned to df_raw rows
+    """
+    coded_col_name = f"{variable_name}_coded"
+    if coded_col_name in df_raw.columns:
+        df_raw[coded_col_name] = codes
+        print(f"      Updated existing column: {coded_col_name}")
+    else:
+        df_raw.insert(df_raw.columns.get_loc(variable_name) + 1, coded_col_name, codes)
+        print(f"      Added new column: {coded_col_name}")
+
+
+def patch_kobo_variable(patcher, variable_name, choices):
+    """
+    Apply one variable's coding to kobo_system: choices list + coded survey field
+    
+    Args:
+        patcher: KoboFormPatcher
+        variable_name: Original variable name (e.g., 'E1')
+        choices: Choice rows for list `{variable_name}_codes`
+    """
+    list_name = f"{variable_name}_codes"
+    coded_col_name = f"{variable_name}_coded"
+    
+    if patcher.replace_choices(list_name, choices):
+        print(f"      Added {len(choices)} choices to list '{list_name}'")
+    
+    # Update survey sheet (optional - add the coded field definition)
+    if patcher.has_survey_field(coded_col_name):
+        print(f"      Field '{coded_col_name}' already exists in survey")
+    else:
+        original_label = patcher.get_survey_value(variable_name, 'label') or variable_name
+        inserted = patcher.insert_survey_field_after(variable_name, {
+            'type': f"select_one {list_name}",
+            'name': coded_col_name,
+            'label': f"{original_label} - Coded",
+            'required': False,
+            'relevant': patcher.get_survey_value(variable_name, 'relevant')  # Same relevance logic
+        })
+        if inserted:
+            print(f"      Added coded field '{coded_col_name}' to survey")
+
 class ExcelClassifier:
     """Excel-based classifier untuk Kobo survey data"""
     
@@ -28,11 +80,13 @@ class ExcelClassifier:
         Initialize classifier
         
         Args:
-            kobo_file_path: Path ke file kobo_system Excel
-            raw_data_file_path: Path ke file raw data Excel
+            kobo_file_path: Path / storage ref ke file kobo_system Excel
+            raw_data_file_path: Path / storage ref ke file raw data Excel
         """
-        self.kobo_file_path = kobo_file_path
-        self.raw_data_file_path = raw_data_file_path
+        # Storage refs -> local files (downloaded once per node)
+        storage = get_storage()
+        self.kobo_file_path = storage.fetch(kobo_file_path)
+        self.raw_data_file_path = storage.fetch(raw_data_file_path)
         self.classifier = OpenAIClassifier()
         
         # Initialize parallel processor
@@ -63,6 +117,29 @@ class ExcelClassifier:
         # Output paths (separate from input paths)
         self.output_kobo_path = None
         self.output_raw_path = None
+        
+        # Kobo system patcher (opened once, saved once per job when deferred)
+        self._kobo_patcher = None
+        self.defer_kobo_save = False
+        
+        # Preloaded raw data (e.g. from columnar cache) and write mode.
+        # write_files=False: only classify, caller merges get_variable_output() later
+        self.raw_df = None
+        self.write_files = True
+        
+        # Cooperative cancellation: callable -> True when the job was cancelled
+        self.cancel_check = None
+    
+    def set_cancel_check(self, cancel_check):
+        """Install a cancel check used between steps and before every API batch"""
+        self.cancel_check = cancel_check
+        if self.parallel_classifier:
+            self.parallel_classifier.cancel_check = cancel_check
+    
+    def _raise_if_cancelled(self):
+        """Raise JobCancelled if the job was cancelled"""
+        if self.cancel_check and self.cancel_check():
+            raise JobCancelled('Job cancelled')
     
     def set_output_paths(self, output_kobo_path, output_raw_path):
         """
@@ -90,11 +167,11 @@ class ExcelClassifier:
         try:
             # Try to import and query SystemSettings
             from app.models import SystemSettings
-            from app import db, create_app
+            from app import get_app
             
-            # Create app context if not exists
+            # Shared per-process app (built once, not per setting lookup)
             try:
-                app = create_app()
+                app = get_app()
                 with app.app_context():
                     value = SystemSettings.get_setting(key, None)
                     if value is not None:
@@ -238,6 +315,7 @@ class ExcelClassifier:
             for idx, cat in enumerate(self.categories, 1):
                 print(f"      {idx}. {cat}", flush=True)
         else:
+            self._raise_if_cancelled()
             update_progress(f"\n[4/9] Generating categories with AI...", 30)
             update_progress(f"   Analyzing {len(valid_responses)} responses with OpenAI", 32)
             self.categories = self.classifier.generate_categories(
@@ -265,6 +343,7 @@ class ExcelClassifier:
         else:
             update_progress(f"\n[6/9] Classifying {len(df_raw)} responses with AI...", 50)
         
+        self._raise_if_cancelled()
         self._classify_all_responses(
             df_raw, variable_name, question_text, progress_callback,
             classification_mode=classification_mode,
@@ -280,6 +359,7 @@ class ExcelClassifier:
         # Step 8: Re-analyze outliers and create new categories if needed
         new_categories_added = 0
         if len(outliers) >= 10:
+            self._raise_if_cancelled()
             print(f"\n[8/9] Re-analyzing outliers...")
             new_categories = self.classifier.analyze_outliers(outliers, question_text)
             
@@ -314,10 +394,14 @@ class ExcelClassifier:
         invalid_count = sum(1 for c in self.classifications if c['code'] == self.classifier.invalid_code)
         valid_classified = sum(1 for c in self.classifications if c['code'] is not None and c['code'] != self.classifier.invalid_code)
         
-        output_files = self._update_excel_files(df_raw, variable_name)
+        if self.write_files:
+            output_files = self._update_excel_files(df_raw, variable_name, progress_callback)
+            update_progress(f"   Files saved successfully", 95)
+        else:
+            output_files = []
+            update_progress(f"   Results ready for merge", 95)
         
         # Final progress update
-        update_progress(f"   Files saved successfully", 95)
         update_progress(f"Classification complete!", 100)
         
         # Calculate category distribution
@@ -381,7 +465,10 @@ class ExcelClassifier:
         return summary
     
     def _load_raw_data(self):
-        """Load raw data dari Excel file"""
+        """Load raw data dari Excel file (or preloaded raw_df)"""
+        if self.raw_df is not None:
+            return self.raw_df
+        
         # Assume first sheet is the data
         df = pd.read_excel(self.raw_data_file_path, sheet_name=0)
         return df
@@ -655,6 +742,7 @@ class ExcelClassifier:
                     progress_callback(f"   Classifying... {len(self.classifications)}/{total} ({int((len(self.classifications)/total)*100)}%)", progress)
                 
                 # BATCH API CALL (10x faster than individual calls!)
+                self._raise_if_cancelled()
                 results = self.classifier.classify_responses_batch(
                     valid_batch,
                     self.categories,
@@ -727,6 +815,7 @@ class ExcelClassifier:
                 progress = 50 + int((len(self.classifications) / total) * 45)
                 progress_callback(f"   Classifying... {len(self.classifications)}/{total} ({int((len(self.classifications)/total)*100)}%)", progress)
             
+            self._raise_if_cancelled()
             results = self.classifier.classify_responses_batch(
                 valid_batch,
                 self.categories,
@@ -799,6 +888,7 @@ class ExcelClassifier:
             # Process batch when full or at end
             if len(batch_responses) >= BATCH_SIZE or outlier_idx == outlier_indices[-1]:
                 # BATCH CLASSIFICATION with MULTI-LABEL support
+                self._raise_if_cancelled()
                 results = self.classifier.classify_responses_batch(
                     batch_responses,
                     self.categories,
@@ -832,6 +922,7 @@ class ExcelClassifier:
                                 c['code'] = code_str  # Space-separated codes
                                 c['codes'] = codes  # List of codes
                                 c['confidence'] = primary_confidence
+                                c['reclassified'] = True
                                 reclassified += 1
                                 
                                 # DEBUG: Log multi-label outlier reclassification
@@ -851,7 +942,7 @@ class ExcelClassifier:
         
         print(f"      Total re-classified: {reclassified} outliers")
     
-    def _update_excel_files(self, df_raw, variable_name):
+    def _update_excel_files(self, df_raw, variable_name, progress_callback=None):
         """
         Update Excel files:
         1. Add coded column to raw data (right next to original column)
@@ -870,25 +961,8 @@ class ExcelClassifier:
             print(f"      Reading existing output file to preserve previous variables...")
             df_raw = pd.read_excel(output_path)
         
-        # Find column position
-        col_idx = df_raw.columns.get_loc(variable_name)
-        
-        # Create coded column name
-        coded_col_name = f"{variable_name}_coded"
-        
-        # Extract codes from classifications
-        # IMPORTANT: Convert ALL codes to STRING for consistency
-        # Single-label: "1" (string)
-        # Multi-label: "1 4" (string with space)
-        codes = [str(c['code']) if c['code'] is not None else None for c in self.classifications]
-        
-        # Insert coded column right after original column (or update if exists)
-        if coded_col_name in df_raw.columns:
-            df_raw[coded_col_name] = codes
-            print(f"      Updated existing column: {coded_col_name}")
-        else:
-            df_raw.insert(col_idx + 1, coded_col_name, codes)
-            print(f"      Added new column: {coded_col_name}")
+        variable_output = self.get_variable_output(variable_name)
+        insert_coded_column(df_raw, variable_name, variable_output['codes'])
         
         max_retries = 3
         for attempt in range(max_retries):
@@ -909,117 +983,117 @@ class ExcelClassifier:
                         progress_callback(error_msg, None)
                     raise PermissionError(error_msg)
         
-        # 2. Update kobo system file - add choices
+        # 2. Update kobo system file - add choices (surgical patch, saved once per job)
         print(f"\n   [2/2] Updating kobo system file...")
         
-        # Determine kobo source path - use output if exists, otherwise original
+        patcher = self._get_kobo_patcher()
+        
+        patch_kobo_variable(patcher, variable_name, variable_output['choices'])
+        
         output_kobo_path = self.output_kobo_path if self.output_kobo_path else self.kobo_file_path
-        kobo_source_path = output_kobo_path if os.path.exists(output_kobo_path) and output_kobo_path != self.kobo_file_path else self.kobo_file_path
+        if not self.defer_kobo_save:
+            self.save_kobo_file(progress_callback)
+        else:
+            print(f"      Kobo patch queued (saved once at end of job)")
+        output_files.append(output_kobo_path)
         
-        if kobo_source_path == output_kobo_path:
-            print(f"      Reading existing output kobo file to preserve previous variables...")
+        return output_files
+    
+    def get_variable_output(self, variable_name):
+        """
+        Coded values + kobo choices for the last processed variable
         
-        # Load kobo system file and get sheet names
-        with pd.ExcelFile(kobo_source_path) as xl_kobo:
-            sheet_names = xl_kobo.sheet_names
+        Returns:
+            dict: {'variable', 'codes', 'choices'}
+                codes: code per raw row as STRING ("1", multi-label "1 4") or None
+                choices: rows for list `{variable_name}_codes` (categories + invalid code)
+        """
+        list_name = f"{variable_name}_codes"
         
-        # Read all sheets
-        sheets = {}
-        for sheet_name in sheet_names:
-            sheets[sheet_name] = pd.read_excel(kobo_source_path, sheet_name=sheet_name)
+        # IMPORTANT: Convert ALL codes to STRING for consistency
+        codes = [str(c['code']) if c['code'] is not None else None for c in self.classifications]
         
-        # Update choices sheet
-        if 'choices' in sheets:
-            df_choices = sheets['choices']
-            
-            # Create list_name for this variable
-            list_name = f"{variable_name}_codes"
-            
-            # Remove existing entries for this list_name (if any)
-            df_choices = df_choices[df_choices['list_name'] != list_name]
-            
-            # Add new choices (including invalid category)
-            new_choices = []
-            
-            # Add regular categories
-            for category, code in self.category_codes.items():
-                new_choices.append({
-                    'list_name': list_name,
-                    'name': str(code),
-                    'label': category,
-                    'S1': None  # Keep other columns as None
-                })
-            
-            # Add invalid category with special code
-            invalid_category = self.classifier.invalid_category
-            invalid_code = self.classifier.invalid_code
-            new_choices.append({
-                'list_name': list_name,
-                'name': str(invalid_code),
-                'label': invalid_category,
-                'S1': None
+        # Regular categories + invalid category with special code
+        choices = [
+            {'list_name': list_name, 'name': str(code), 'label': category}
+            for category, code in self.category_codes.items()
+        ]
+        choices.append({
+            'list_name': list_name,
+            'name': str(self.classifier.invalid_code),
+            'label': self.classifier.invalid_category
+        })
+        
+        return {'variable': variable_name, 'codes': codes, 'choices': choices}
+    
+    def get_response_rows(self, variable_name):
+        """
+        Per-response results of the last processed variable (for the response index)
+        
+        Returns:
+            list: One dict per non-empty raw row:
+                {'variable', 'row_index', 'response', 'category', 'codes', 'confidence', 'source'}
+                source: existing | invalid | ai | reclassified | fallback
+        """
+        rows = []
+        for c in self.classifications:
+            if c['response'] is None or pd.isna(c['response']):
+                continue
+            if c.get('existing'):
+                source = 'existing'
+            elif c['category'] == self.classifier.invalid_category:
+                source = 'invalid'
+            elif c.get('reclassified'):
+                source = 'reclassified'
+            elif 'categories' in c:
+                source = 'ai'
+            else:
+                source = 'fallback'
+            rows.append({
+                'variable': variable_name,
+                'row_index': int(c['index']),
+                'response': str(c['response']),
+                'category': c['category'],
+                'codes': str(c['code']) if c['code'] is not None else None,
+                'confidence': float(c['confidence']) if c['confidence'] is not None else None,
+                'source': source
             })
-            
-            # Append new choices
-            df_new_choices = pd.DataFrame(new_choices)
-            df_choices = pd.concat([df_choices, df_new_choices], ignore_index=True)
-            
-            # Update the sheet
-            sheets['choices'] = df_choices
-            print(f"      Added {len(new_choices)} choices to list '{list_name}'")
+        return rows
+    
+    def _get_kobo_patcher(self):
+        """
+        Get (or open once) the kobo_system patcher for this job
         
-        # Update survey sheet (optional - add the coded field definition)
-        if 'survey' in sheets:
-            df_survey = sheets['survey']
-            
-            # Check if coded field already exists
-            if coded_col_name not in df_survey['name'].values:
-                # Find the original E1 question row
-                e1_row_idx = df_survey[df_survey['name'] == variable_name].index
-                
-                if len(e1_row_idx) > 0:
-                    # Get original E1 row
-                    original_row = df_survey.loc[e1_row_idx[0]]
-                    
-                    # Create new row for coded field
-                    new_row = {
-                        'type': f"select_one {variable_name}_codes",
-                        'name': coded_col_name,
-                        'label': f"{original_row.get('label', variable_name)} - Coded",
-                        'required': False,
-                        'appearance': None,
-                        'constraint': None,
-                        'constraint_message': None,
-                        'relevant': original_row.get('relevant'),  # Same relevance logic
-                        'choice_filter': None
-                    }
-                    
-                    # Insert after the original row
-                    insert_idx = e1_row_idx[0] + 1
-                    df_survey = pd.concat([
-                        df_survey.iloc[:insert_idx],
-                        pd.DataFrame([new_row]),
-                        df_survey.iloc[insert_idx:]
-                    ], ignore_index=True)
-                    
-                    sheets['survey'] = df_survey
-                    print(f"      Added coded field '{coded_col_name}' to survey")
-                else:
-                    print(f"      Field '{coded_col_name}' already exists in survey")
+        Source: existing output kobo file (from previous run) or original kobo file
+        """
+        if self._kobo_patcher is None:
+            output_kobo_path = self.output_kobo_path if self.output_kobo_path else self.kobo_file_path
+            if os.path.exists(output_kobo_path) and output_kobo_path != self.kobo_file_path:
+                print(f"      Reading existing output kobo file to preserve previous variables...")
+                kobo_source_path = output_kobo_path
+            else:
+                kobo_source_path = self.kobo_file_path
+            self._kobo_patcher = KoboFormPatcher(kobo_source_path)
+        return self._kobo_patcher
+    
+    def save_kobo_file(self, progress_callback=None):
+        """
+        Write pending kobo_system patches to output path (single save per job)
+        
+        Returns:
+            str: Saved path, or None if nothing to save
+        """
+        if self._kobo_patcher is None or not self._kobo_patcher.pending_changes:
+            return None
         
-        # Save to output kobo file (or overwrite if output path not set)
         output_kobo_path = self.output_kobo_path if self.output_kobo_path else self.kobo_file_path
         
         max_retries = 3
         for attempt in range(max_retries):
             try:
-                with pd.ExcelWriter(output_kobo_path, engine='openpyxl') as writer:
-                    for sheet_name, df_sheet in sheets.items():
-                        df_sheet.to_excel(writer, sheet_name=sheet_name, index=False)
-                
-                output_files.append(output_kobo_path)
+                self._kobo_patcher.save(output_kobo_path)
                 print(f"      Saved: {output_kobo_path}")
-                break
+                return output_kobo_path
             except PermissionError:
                 if attempt < max_retries - 1:
                     if progress_callback:
@@ -1031,8 +1105,6 @@ class ExcelClassifier:
                     if progress_callback:
                         progress_callback(error_msg, None)
                     raise PermissionError(error_msg)
-        
-        return output_files
     
     def _load_existing_categories_from_kobo(self, variable_name):
         """
@@ -1045,21 +1117,18 @@ class ExcelClassifier:
             List of category names, or empty list if not found
         """
         try:
-            # Read choices sheet
-            df_choices = pd.read_excel(self.kobo_file_path, sheet_name='choices')
+            # Compiled schema (shared with detectors, cached by file hash)
+            schema = FormSchema.load(self.kobo_file_path)
             
             # Find categories for this variable
             list_name = f"{variable_name}_codes"
-            var_choices = df_choices[df_choices['list_name'] == list_name]
-            
-            if len(var_choices) == 0:
-                return []
+            var_choices = schema.choices_by_list.get(list_name, [])
             
             # Extract category labels (exclude invalid category)
             categories = []
-            for _, row in var_choices.iterrows():
-                label = str(row['label'])
-                code = str(row['name'])
+            for choice in var_choices:
+                label = str(choice.get('label'))
+                code = str(choice.get('name'))
                 
                 # Skip invalid category
                 if code == str(self.classifier.invalid_code) or label == self.classifier.invalid_category:
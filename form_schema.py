@@ -0,0 +1,266 @@
+"""
+Compiled XLSForm Schema
+Parse survey + choices sheets dari kobo_system SEKALI per uploaded form,
+lalu sediakan indexed lookups untuk semua detector dan writer.
+
+Schema di-cache per file hash (SHA-256), jadi upload ulang form yang sama
+atau beberapa consumer dalam satu proses tidak membaca Excel lagi.
+Semua DataFrame/dict di schema bersifat READ-ONLY (shared antar consumer).
+"""
+import os
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import pandas as pd
+
+
+SELECT_TYPES = ('select_one', 'select_multiple')
+
+# Common suffixes for "lainnya" text fields (S10_L, S10_lainnya, S10_other)
+TEXT_PAIR_SUFFIXES = ['_L', '_l', '_lainnya', '_Lainnya', '_other', '_Other']
+
+# Text field usually comes right after the select question
+TEXT_PAIR_WINDOW = 4
+
+LAINNYA_PATTERN = re.compile(r'lainnya', re.IGNORECASE)
+
+# Uploads stored by upload_store.py are named <sha256><ext>
+CONTENT_ADDRESSED_NAME = re.compile(r'^[0-9a-f]{64}$')
+
+
+def compute_file_hash(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """
+    Compute SHA-256 hash of a file (streamed, constant memory)
+
+    Args:
+        path: Path to file
+        chunk_size: Read chunk size in bytes
+
+    Returns:
+        str: Hex digest
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _clean(value):
+    """Convert pandas NaN to None"""
+    if value is None:
+        return None
+    try:
+        if pd.isna(value):
+            return None
+    except (TypeError, ValueError):
+        pass
+    return value
+
+
+def _normalize_code(value):
+    """Choice code as int when possible (96.0 -> 96), else original value"""
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return value
+
+
+class FormSchema:
+    """Indexed, cached view of an XLSForm (kobo_system) file"""
+
+    CACHE_SIZE = 32
+
+    _cache = OrderedDict()          # file_hash -> FormSchema
+    _hash_memo = {}                 # (path, mtime, size) -> file_hash
+    _cache_lock = threading.Lock()
+
+    def __init__(self, survey_df: pd.DataFrame, choices_df: pd.DataFrame, file_hash: Optional[str] = None):
+        """
+        Compile schema from already-loaded sheets
+
+        Args:
+            survey_df: survey sheet (may be empty)
+            choices_df: choices sheet (may be empty)
+            file_hash: Source file hash (cache key)
+        """
+        self.file_hash = file_hash
+        self.survey_df = survey_df
+        self.choices_df = choices_df
+
+        self.survey_columns = [str(c) for c in survey_df.columns]
+        self.choices_columns = [str(c) for c in choices_df.columns]
+
+        # survey: ordered rows + name -> row / position
+        self.survey_rows: List[Dict] = [
+            {k: _clean(v) for k, v in row.items()}
+            for row in survey_df.to_dict('records')
+        ]
+        self.rows_by_name: Dict[str, Dict] = {}
+        self.position_by_name: Dict[str, int] = {}
+        for pos, row in enumerate(self.survey_rows):
+            name = row.get('name')
+            if name is None:
+                continue
+            name = str(name).strip()
+            if name not in self.rows_by_name:
+                self.rows_by_name[name] = row
+                self.position_by_name[name] = pos
+
+        # choices: list_name -> choice rows, list_name -> lainnya code
+        self.choices_by_list: Dict[str, List[Dict]] = {}
+        self.lainnya_codes: Dict[str, object] = {}
+        for row in choices_df.to_dict('records'):
+            row = {k: _clean(v) for k, v in row.items()}
+            list_name = row.get('list_name')
+            if list_name is None:
+                continue
+            list_name = str(list_name).strip()
+            self.choices_by_list.setdefault(list_name, []).append(row)
+
+            if LAINNYA_PATTERN.search(str(row.get('label') or '')):
+                self.lainnya_codes[list_name] = _normalize_code(row.get('name'))
+
+        # select questions + precomputed "Lainnya" text-pair candidates
+        self.select_questions: List[Dict] = []
+        self.text_pairs: Dict[str, Dict] = {}
+        for pos, row in enumerate(self.survey_rows):
+            type_parts = str(row.get('type') or '').split()
+            if not type_parts or type_parts[0] not in SELECT_TYPES:
+                continue
+
+            name = str(row.get('name') or '').strip()
+            if not name:
+                continue
+
+            # "select_one S10" -> "S10" (fallback: variable name)
+            list_name = type_parts[1] if len(type_parts) > 1 else name
+            self.select_questions.append({
+                'name': name,
+                'type': row.get('type'),
+                'select_type': type_parts[0],
+                'list_name': list_name,
+                'label': row.get('label') or '',
+                'position': pos
+            })
+
+            text_pair = self._find_text_pair(name, pos)
+            if text_pair:
+                self.text_pairs[name] = text_pair
+
+    def _find_text_pair(self, select_var: str, select_pos: int) -> Optional[Dict]:
+        """Find corresponding text field within the next few survey rows"""
+        end = min(select_pos + 1 + TEXT_PAIR_WINDOW, len(self.survey_rows))
+
+        for pos in range(select_pos + 1, end):
+            row = self.survey_rows[pos]
+            if row.get('type') != 'text':
+                continue
+
+            var_name = str(row.get('name') or '')
+            label = str(row.get('label') or '').lower()
+
+            # Name matches a known suffix, or label mentions "lainnya"/"sebutkan"
+            if var_name in (f"{select_var}{suffix}" for suffix in TEXT_PAIR_SUFFIXES) or \
+               (('lainnya' in label or 'sebutkan' in label) and var_name.startswith(select_var)):
+                return {
+                    'name': var_name,
+                    'label': row.get('label') or '',
+                    'type': row.get('type')
+                }
+
+        return None
+
+    @property
+    def has_survey(self) -> bool:
+        return not self.survey_df.empty or bool(self.survey_columns)
+
+    def choice_labels(self, list_name: str) -> Dict:
+        """
+        Get choice labels for a select list
+
+        Returns:
+            Dict mapping code to label, e.g. {1: 'Suami / istri', 96: 'Lainnya'}
+        """
+        return {
+            _normalize_code(choice.get('name')): choice.get('label')
+            for choice in self.choices_by_list.get(list_name, [])
+        }
+
+    def semi_open_pairs(self) -> List[Dict]:
+        """
+        Semi open-ended pairs: select question whose list has "Lainnya" + its text field
+
+        Returns:
+            List of pair dicts (same shape as SemiOpenDetector.detect_semi_open_pairs)
+        """
+        pairs = []
+        for question in self.select_questions:
+            list_name = question['list_name']
+            text_pair = self.text_pairs.get(question['name'])
+            if list_name not in self.lainnya_codes or not text_pair:
+                continue
+            pairs.append({
+                'select_var': question['name'],
+                'text_var': text_pair['name'],
+                'lainnya_code': self.lainnya_codes[list_name],
+                'select_label': question['label'],
+                'text_label': text_pair['label'],
+                'list_name': list_name,
+                'select_type': question['type']
+            })
+        return pairs
+
+    @classmethod
+    def from_file(cls, kobo_system_path: str, file_hash: Optional[str] = None) -> 'FormSchema':
+        """Parse survey + choices sheets with a single workbook open (no cache)"""
+        with pd.ExcelFile(kobo_system_path) as xl:
+            survey_df = xl.parse('survey') if 'survey' in xl.sheet_names else pd.DataFrame()
+            choices_df = xl.parse('choices') if 'choices' in xl.sheet_names else pd.DataFrame()
+        return cls(survey_df, choices_df, file_hash=file_hash)
+
+    @classmethod
+    def file_hash_for(cls, kobo_system_path: str) -> str:
+        """File hash, memoized on (path, mtime, size) to skip re-hashing unchanged files"""
+        stem = os.path.splitext(os.path.basename(kobo_system_path))[0]
+        if CONTENT_ADDRESSED_NAME.match(stem):
+            return stem  # content-addressed upload (upload_store.py): name is the hash
+        stat = os.stat(kobo_system_path)
+        memo_key = (os.path.abspath(kobo_system_path), stat.st_mtime_ns, stat.st_size)
+        file_hash = cls._hash_memo.get(memo_key)
+        if file_hash is None:
+            file_hash = compute_file_hash(kobo_system_path)
+            cls._hash_memo[memo_key] = file_hash
+        return file_hash
+
+    @classmethod
+    def load(cls, kobo_system_path: str, file_hash: Optional[str] = None) -> 'FormSchema':
+        """
+        Get compiled schema for a kobo_system file (cached by file hash)
+
+        Args:
+            kobo_system_path: Path to kobo_system Excel file
+            file_hash: Known file hash (skip hashing)
+
+        Returns:
+            FormSchema (shared, read-only)
+        """
+        file_hash = file_hash or cls.file_hash_for(kobo_system_path)
+
+        with cls._cache_lock:
+            schema = cls._cache.get(file_hash)
+            if schema is not None:
+                cls._cache.move_to_end(file_hash)
+                return schema
+
+        schema = cls.from_file(kobo_system_path, file_hash=file_hash)
+
+        with cls._cache_lock:
+            cls._cache[file_hash] = schema
+            cls._cache.move_to_end(file_hash)
+            while len(cls._cache) > cls.CACHE_SIZE:
+                cls._cache.popitem(last=False)
+
+        return schema
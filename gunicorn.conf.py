@@ -1,7 +1,37 @@
 """
 Gunicorn Configuration for M-Coder Platform
 Production WSGI server configuration
+
+Worker class (env GUNICORN_WORKER_CLASS):
+- sync (default): one request per worker process. A slow client (long
+  download, Brevo call) holds a whole worker, so GUNICORN_WORKERS slow
+  requests stall the UI for everyone.
+- gevent: one greenlet per request, GUNICORN_WORKER_CONNECTIONS per worker.
+  The stdlib is monkey-patched below, before preload_app imports the app,
+  so Redis (redis-py), S3 (botocore), Brevo (urllib3) and OpenAI (httpx)
+  sockets yield while waiting. psycopg2 is a C driver: install psycogreen
+  or every DB query still blocks the whole worker.
+- gthread: GUNICORN_THREADS threads per worker, no patching needed.
+
+The DB pool is per worker process (config.py DB_POOL_SIZE / DB_MAX_OVERFLOW):
+with async workers keep workers * (pool_size + max_overflow) under the
+PostgreSQL max_connections; requests beyond it wait DB_POOL_TIMEOUT.
+
+Capacity before/after: python load_test.py (see its docstring).
 """
+import os
+
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'sync')
+
+if worker_class == 'gevent':
+    # Must run before the app (and ssl, redis, psycopg2) is imported
+    from gevent import monkey
+    monkey.patch_all()
+    try:
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+    except ImportError:
+        print("[GUNICORN WARNING] psycogreen not installed: database queries block the gevent worker", flush=True)
 
 # Server Socket
 bind = "127.0.0.1:8000"  # Local only, nginx akan proxy
@@ -11,9 +41,9 @@ backlog = 2048
 # UPDATED: Now using 4 workers with Celery for background tasks
 # Redis-based progress tracking allows multiple workers safely
 # Celery handles classification tasks, workers only serve HTTP requests
-workers = 4  # Increased from 1 - safe with Celery + Redis
-worker_class = "sync"
-worker_connections = 1000
+workers = int(os.getenv('GUNICORN_WORKERS', '4'))  # Increased from 1 - safe with Celery + Redis
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '1000'))  # gevent: concurrent requests per worker
+threads = int(os.getenv('GUNICORN_THREADS', '8' if worker_class == 'gthread' else '1'))  # gthread only
 max_requests = 2000  # Restart worker after 2000 requests (increased)
 max_requests_jitter = 100  # Random jitter for staggered restarts
 timeout = 120  # 2 minutes - reduced (async tasks via Celery)
@@ -57,6 +87,8 @@ def on_reload(server):
 def when_ready(server):
     """Called just after the server is started"""
     print("✅ M-Coder Platform ready to serve requests!")
+    print(f"[GUNICORN] {workers} x {worker_class} workers "
+          f"({worker_connections} connections / {threads} threads per worker)", flush=True)
 
 def pre_fork(server, worker):
     """Called just before a worker is forked"""
@@ -65,6 +97,13 @@ def pre_fork(server, worker):
 def post_fork(server, worker):
     """Called just after a worker has been forked"""
     print(f"👷 Worker spawned (pid: {worker.pid})")
+    if preload_app:
+        # Connections opened by the master (db.create_all) must not be shared
+        # between workers: drop them without closing the master's sockets
+        from run_app import app
+        from app import db
+        with app.app_context():
+            db.engine.dispose(close=False)
 
 def worker_exit(server, worker):
     """Called just after a worker has been exited"""
@@ -0,0 +1,209 @@
+"""
+Kobo Form Patcher
+Surgical in-place update untuk kobo_system workbook (survey + choices sheets)
+
+Workbook dibuka SEKALI, semua patch diterapkan di memory, lalu disimpan sekali per job.
+Sheet lain, formatting, dan kolom XLSForm yang tidak dikenal tetap utuh
+(tidak ada full pandas round-trip).
+"""
+from typing import Dict, List, Optional
+from openpyxl import load_workbook
+
+
+class KoboFormPatcher:
+    """Patch kobo_system workbook: append choices dan insert coded field ke survey"""
+
+    def __init__(self, source_path: str):
+        """
+        Open kobo_system workbook once
+
+        Args:
+            source_path: Path ke kobo_system Excel yang akan di-patch
+        """
+        self.source_path = source_path
+        self.workbook = load_workbook(source_path)
+        self.survey_ws = self.workbook['survey'] if 'survey' in self.workbook.sheetnames else None
+        self.choices_ws = self.workbook['choices'] if 'choices' in self.workbook.sheetnames else None
+
+        self._survey_columns = self._read_header(self.survey_ws)
+        self._choices_columns = self._read_header(self.choices_ws)
+
+        # name -> row number (1-based, openpyxl) untuk lookup O(1)
+        self._survey_rows = self._index_column(self.survey_ws, self._survey_columns.get('name'))
+
+        self.pending_changes = 0
+
+    @staticmethod
+    def _read_header(ws) -> Dict[str, int]:
+        """Map header name -> column number dari baris pertama"""
+        if ws is None:
+            return {}
+
+        columns = {}
+        for cell in ws[1]:
+            if cell.value is not None and str(cell.value).strip():
+                columns.setdefault(str(cell.value).strip(), cell.column)
+        return columns
+
+    @staticmethod
+    def _index_column(ws, col_idx: Optional[int]) -> Dict[str, int]:
+        """Map value -> row number untuk satu kolom (first occurrence wins)"""
+        index = {}
+        if ws is None or col_idx is None:
+            return index
+
+        for row_num, (value,) in enumerate(
+            ws.iter_rows(min_row=2, min_col=col_idx, max_col=col_idx, values_only=True), start=2
+        ):
+            if value is not None:
+                index.setdefault(str(value).strip(), row_num)
+        return index
+
+    @staticmethod
+    def _ensure_column(ws, columns: Dict[str, int], name: str) -> int:
+        """Return column number for header, appending the header if missing"""
+        if name not in columns:
+            col_idx = max(columns.values(), default=0) + 1
+            ws.cell(row=1, column=col_idx, value=name)
+            columns[name] = col_idx
+        return columns[name]
+
+    def has_survey_field(self, name: str) -> bool:
+        """Check if a field already exists in survey sheet"""
+        return name in self._survey_rows
+
+    def get_survey_value(self, name: str, column: str):
+        """Get a cell value from survey row `name` (None if missing)"""
+        row_num = self._survey_rows.get(name)
+        col_idx = self._survey_columns.get(column)
+        if row_num is None or col_idx is None:
+            return None
+        return self.survey_ws.cell(row=row_num, column=col_idx).value
+
+    def replace_choices(self, list_name: str, choices: List[Dict]) -> int:
+        """
+        Replace all choices of `list_name` with new rows appended at the end
+
+        Args:
+            list_name: Choice list name (e.g., 'E1_codes')
+            choices: List of dicts {column: value}, e.g. {'list_name', 'name', 'label'}
+
+        Returns:
+            int: Number of rows appended
+        """
+        if self.choices_ws is None:
+            return 0
+
+        ws = self.choices_ws
+        list_col = self._ensure_column(ws, self._choices_columns, 'list_name')
+
+        # Remove existing rows for this list (bottom-up, contiguous blocks)
+        existing_rows = [
+            row_num for row_num, (value,) in enumerate(
+                ws.iter_rows(min_row=2, min_col=list_col, max_col=list_col, values_only=True), start=2
+            )
+            if value is not None and str(value).strip() == list_name
+        ]
+        while existing_rows:
+            end = existing_rows.pop()
+            start = end
+            while existing_rows and existing_rows[-1] == start - 1:
+                start = existing_rows.pop()
+            ws.delete_rows(start, end - start + 1)
+
+        # Append new rows
+        for choice in choices:
+            row_values = {}
+            for column, value in choice.items():
+                row_values[self._ensure_column(ws, self._choices_columns, column)] = value
+            ws.append(row_values)
+
+        self.pending_changes += 1
+        return len(choices)
+
+    def append_choices(self, list_name: str, choices: List[Dict]) -> int:
+        """
+        Add choices to `list_name` right after its last existing row
+        (appended at the end of the sheet if the list does not exist yet)
+
+        Args:
+            list_name: Choice list name (e.g., 'S10')
+            choices: List of dicts {column: value}, e.g. {'list_name', 'name', 'label'}
+
+        Returns:
+            int: Number of rows added
+        """
+        if self.choices_ws is None or not choices:
+            return 0
+
+        ws = self.choices_ws
+        list_col = self._ensure_column(ws, self._choices_columns, 'list_name')
+
+        last_row = None
+        for row_num, (value,) in enumerate(
+            ws.iter_rows(min_row=2, min_col=list_col, max_col=list_col, values_only=True), start=2
+        ):
+            if value is not None and str(value).strip() == list_name:
+                last_row = row_num
+
+        if last_row is None:
+            insert_at = ws.max_row + 1
+        else:
+            insert_at = last_row + 1
+            ws.insert_rows(insert_at, amount=len(choices))
+
+        for offset, choice in enumerate(choices):
+            for column, value in choice.items():
+                col_idx = self._ensure_column(ws, self._choices_columns, column)
+                ws.cell(row=insert_at + offset, column=col_idx, value=value)
+
+        self.pending_changes += 1
+        return len(choices)
+
+    def insert_survey_field_after(self, anchor_name: str, field: Dict) -> bool:
+        """
+        Insert a new survey row right after `anchor_name`
+
+        Args:
+            anchor_name: Existing field name (e.g., 'E1')
+            field: Dict {column: value} for the new row (must include 'name')
+
+        Returns:
+            bool: True if inserted, False if anchor missing or field already exists
+        """
+        if self.survey_ws is None:
+            return False
+
+        new_name = str(field.get('name', '')).strip()
+        anchor_row = self._survey_rows.get(anchor_name)
+
+        if anchor_row is None or not new_name or new_name in self._survey_rows:
+            return False
+
+        ws = self.survey_ws
+        insert_at = anchor_row + 1
+        ws.insert_rows(insert_at)
+
+        for column, value in field.items():
+            if value is None:
+                continue
+            col_idx = self._ensure_column(ws, self._survey_columns, column)
+            ws.cell(row=insert_at, column=col_idx, value=value)
+
+        # Shift indexed rows below the insertion point
+        for name, row_num in self._survey_rows.items():
+            if row_num >= insert_at:
+                self._survey_rows[name] = row_num + 1
+        self._survey_rows[new_name] = insert_at
+
+        self.pending_changes += 1
+        return True
+
+    def save(self, output_path: str):
+        """Save patched workbook (single write)"""
+        self.workbook.save(output_path)
+        self.pending_changes = 0
+
+    def close(self):
+        """Release workbook"""
+        self.workbook.close()
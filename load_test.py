@@ -0,0 +1,265 @@
+"""
+Load Test: Concurrent-User Capacity
+M-Code Pro - How many slow clients until the UI stalls for everyone?
+
+Per level N (--levels), N slow clients keep one request in flight each,
+while --probe-users UI users call --probe-path in a loop for --duration
+seconds. A level passes when no probe failed and the probe p95 stays under
+--max-latency; capacity = the highest passing level.
+
+Slow clients (--slow):
+- download: GET /download-job/<--job-id>, read at --slow-rate KB/s
+  (long download on a slow link; unset DOWNLOAD_ACCEL_PREFIX or use
+  STORAGE_BACKEND=s3 so the worker streams the file itself)
+- upload:   POST /upload-files trickled at --slow-rate KB/s without a CSRF
+  token (the body is read in full, then rejected: nothing is stored)
+
+Point --url at gunicorn itself (127.0.0.1:8000), not nginx: nginx buffers
+bodies and responses and would hide the worker limit.
+
+Before/after (same machine, same levels):
+    GUNICORN_WORKER_CLASS=sync   -> python load_test.py --email ... --password ... --json sync.json
+    GUNICORN_WORKER_CLASS=gevent -> python load_test.py --email ... --password ... --json gevent.json
+    python load_test.py --compare sync.json gevent.json
+"""
+
+import re
+import json
+import time
+import socket
+import argparse
+import threading
+from urllib.parse import urlsplit
+
+CHUNK_SIZE = 4096
+CSRF_FIELD = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+
+
+def login(base_url: str, email: str, password: str):
+    """Log in through the form; returns a requests.Session carrying the session cookie"""
+    import requests
+
+    session = requests.Session()
+    page = session.get(f'{base_url}/login', timeout=30)
+    match = CSRF_FIELD.search(page.text)
+    response = session.post(f'{base_url}/login', timeout=30, allow_redirects=False, data={
+        'csrf_token': match.group(1) if match else '',
+        'email': email,
+        'password': password
+    })
+    if response.status_code != 302 or '/login' in response.headers.get('Location', ''):
+        raise SystemExit(f"[LOAD TEST] Login failed for {email} (HTTP {response.status_code})")
+    return session
+
+
+def _connect(base_url: str, timeout: float) -> socket.socket:
+    parts = urlsplit(base_url)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    # Small receive window: the server feels the slow reader right away
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 16 * 1024)
+    sock.settimeout(timeout)
+    sock.connect((parts.hostname, parts.port or 80))
+    return sock
+
+
+def _slow_download(base_url, cookie, job_id, rate, stop):
+    sock = _connect(base_url, 60)
+    try:
+        host = urlsplit(base_url).netloc
+        sock.sendall((f'GET /download-job/{job_id} HTTP/1.1\r\nHost: {host}\r\n'
+                      f'Cookie: {cookie}\r\nConnection: close\r\n\r\n').encode())
+        while not stop.is_set():
+            if not sock.recv(CHUNK_SIZE):
+                break
+            time.sleep(CHUNK_SIZE / rate)
+    finally:
+        sock.close()
+
+
+def _slow_upload(base_url, cookie, size, rate, stop):
+    sock = _connect(base_url, 60)
+    try:
+        host = urlsplit(base_url).netloc
+        # multipart/form-data: the CSRF check parses (= reads) the whole body before rejecting it
+        boundary = 'loadtest'
+        head = (f'--{boundary}\r\nContent-Disposition: form-data; name="kobo_file"; filename="load_test.bin"\r\n'
+                f'Content-Type: application/octet-stream\r\n\r\n').encode()
+        tail = f'\r\n--{boundary}--\r\n'.encode()
+        sock.sendall((f'POST /upload-files HTTP/1.1\r\nHost: {host}\r\nCookie: {cookie}\r\n'
+                      f'Content-Type: multipart/form-data; boundary={boundary}\r\n'
+                      f'Content-Length: {len(head) + size + len(tail)}\r\nConnection: close\r\n\r\n').encode() + head)
+        chunk = b'0' * CHUNK_SIZE
+        sent = 0
+        while sent < size and not stop.is_set():
+            sock.sendall(chunk[:size - sent])
+            sent += CHUNK_SIZE
+            time.sleep(CHUNK_SIZE / rate)
+        if sent >= size:
+            sock.sendall(tail)
+            sock.recv(CHUNK_SIZE)  # wait for the (rejected) response
+    finally:
+        sock.close()
+
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run_level(args, session, slow_clients: int) -> dict:
+    """Run one level: slow clients in the background, timed probes in front"""
+    cookie = '; '.join(f'{name}={value}' for name, value in session.cookies.items())
+    rate = args.slow_rate * 1024
+    stop = threading.Event()
+    slow_errors = []
+
+    def slow_client():
+        while not stop.is_set():
+            try:
+                if args.slow == 'download':
+                    _slow_download(args.url, cookie, args.job_id, rate, stop)
+                else:
+                    _slow_upload(args.url, cookie, int(rate * args.duration), rate, stop)
+            except OSError as e:
+                slow_errors.append(str(e))
+                time.sleep(1)
+
+    latencies, failures = [], []
+    lock = threading.Lock()
+
+    def probe_user(deadline):
+        import requests
+
+        client = requests.Session()  # one per UI user: Session is not thread-safe
+        client.cookies.update(session.cookies)
+        while time.time() < deadline:
+            started = time.perf_counter()
+            try:
+                response = client.get(f'{args.url}{args.probe_path}', timeout=args.probe_timeout,
+                                       allow_redirects=False)
+                ok = response.status_code == 200
+            except Exception:
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                (latencies if ok else failures).append(elapsed)
+            time.sleep(args.think_time)
+
+    slow_threads = [threading.Thread(target=slow_client, daemon=True) for _ in range(slow_clients)]
+    for thread in slow_threads:
+        thread.start()
+    time.sleep(args.warmup if slow_clients else 0)
+
+    deadline = time.time() + args.duration
+    probes = [threading.Thread(target=probe_user, args=(deadline,)) for _ in range(args.probe_users)]
+    for thread in probes:
+        thread.start()
+    for thread in probes:
+        thread.join()
+
+    stop.set()
+    for thread in slow_threads:
+        thread.join(timeout=10)
+
+    p95 = _percentile(latencies, 95)
+    return {
+        'slow_clients': slow_clients,
+        'requests': len(latencies) + len(failures),
+        'failed': len(failures),
+        'p50': _percentile(latencies, 50),
+        'p95': p95,
+        'max': max(latencies) if latencies else None,
+        'slow_errors': len(slow_errors),
+        'passed': not failures and p95 is not None and p95 <= args.max_latency
+    }
+
+
+def _ms(value):
+    return f"{value * 1000:8.0f}" if value is not None else '       -'
+
+
+def print_results(label: str, results: list, max_latency: float):
+    print(f"\n{'=' * 72}\n{label}\n{'=' * 72}")
+    print(f"   {'slow':>5} {'requests':>9} {'failed':>7} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}  result")
+    for row in results:
+        print(f"   {row['slow_clients']:>5} {row['requests']:>9} {row['failed']:>7} "
+              f"{_ms(row['p50'])} {_ms(row['p95'])} {_ms(row['max'])}  {'ok' if row['passed'] else 'STALLED'}")
+    print(f"   Capacity: {capacity(results)} concurrent slow clients (probe p95 <= {max_latency * 1000:.0f} ms)")
+
+
+def capacity(results: list) -> int:
+    """Highest level passed with every lower level passing too"""
+    best = 0
+    for row in sorted(results, key=lambda r: r['slow_clients']):
+        if not row['passed']:
+            break
+        best = row['slow_clients']
+    return best
+
+
+def compare(before_path: str, after_path: str):
+    reports = []
+    for path in (before_path, after_path):
+        with open(path) as f:
+            reports.append(json.load(f))
+    for report in reports:
+        print_results(report['label'], report['results'], report['max_latency'])
+    before, after = (capacity(report['results']) for report in reports)
+    print(f"\nCapacity: {reports[0]['label']} {before} -> {reports[1]['label']} {after} concurrent slow clients")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent-user capacity of the web workers')
+    parser.add_argument('--url', default='http://127.0.0.1:8000', help='gunicorn address (not nginx)')
+    parser.add_argument('--email', help='Login email of a test user')
+    parser.add_argument('--password', help='Login password')
+    parser.add_argument('--slow', choices=('download', 'upload'), default='upload', help='Slow client kind')
+    parser.add_argument('--job-id', help='Completed job of the test user (--slow download)')
+    parser.add_argument('--slow-rate', type=float, default=64, help='Slow client speed (KB/s)')
+    parser.add_argument('--levels', default='0,2,4,8,16,32,64', help='Concurrent slow clients per level')
+    parser.add_argument('--probe-path', default='/api/status', help='UI request timed under load')
+    parser.add_argument('--probe-users', type=int, default=4, help='Concurrent UI users')
+    parser.add_argument('--probe-timeout', type=float, default=10, help='Probe timeout (s), counts as failed')
+    parser.add_argument('--think-time', type=float, default=0.2, help='Pause between probes (s)')
+    parser.add_argument('--max-latency', type=float, default=1.0, help='Probe p95 limit (s) for a passing level')
+    parser.add_argument('--duration', type=float, default=20, help='Seconds of probing per level')
+    parser.add_argument('--warmup', type=float, default=3, help='Seconds for slow clients to occupy workers')
+    parser.add_argument('--label', help='Name of this run (default: the probed URL)')
+    parser.add_argument('--json', help='Save results to this file')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='Compare two saved runs')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    if not args.email or not args.password:
+        parser.error('--email and --password are required')
+    if args.slow == 'download' and not args.job_id:
+        parser.error('--job-id is required for --slow download')
+
+    args.url = args.url.rstrip('/')
+    session = login(args.url, args.email, args.password)
+    levels = [int(level) for level in args.levels.split(',') if level.strip()]
+
+    results = []
+    for level in levels:
+        print(f"[LOAD TEST] {level} slow {args.slow} clients ...", flush=True)
+        row = run_level(args, session, level)
+        results.append(row)
+        print(f"[LOAD TEST]    p95 {_ms(row['p95']).strip()} ms, {row['failed']} failed "
+              f"-> {'ok' if row['passed'] else 'STALLED'}", flush=True)
+
+    label = args.label or args.url
+    print_results(label, results, args.max_latency)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'label': label, 'slow': args.slow, 'max_latency': args.max_latency, 'results': results}, f,
+                      indent=2)
+        print(f"\n[LOAD TEST] Saved to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -10,7 +10,6 @@ import time
 from typing import List, Dict, Tuple
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from threading import Lock
-from openai import OpenAI
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -42,7 +41,10 @@ class OpenAIClassifier:
         if not api_key or api_key == 'your_openai_api_key_here':
             raise ValueError("OPENAI_API_KEY harus diset di Admin Settings atau .env file")
         
-        self.client = OpenAI(api_key=api_key)
+        from openai import OpenAI  # lazy: keeps `import openai_classifier` cheap for workers
+        
+        # Explicit timeout: a stuck request must not hold a thread (or greenlet) for the 10-minute SDK default
+        self.client = OpenAI(api_key=api_key, timeout=float(os.getenv('OPENAI_TIMEOUT', '180')))
         self.model = model
         self.max_categories = int(os.getenv('MAX_CATEGORIES', '10'))
         self.sample_ratio = float(os.getenv('CATEGORY_SAMPLE_RATIO', '1.0'))
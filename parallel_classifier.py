@@ -4,10 +4,14 @@ Implements concurrent batch processing untuk kecepatan maksimal
 """
 import time
 from typing import List, Dict, Tuple, Callable
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from threading import Lock
 
 
+class JobCancelled(Exception):
+    """Raised when the job was cancelled while classifying (cooperative cancellation)"""
+
+
 class ParallelClassifier:
     """Helper class untuk parallel classification processing"""
     
@@ -25,6 +29,14 @@ class ParallelClassifier:
         self.rate_limit_delay = rate_limit_delay
         self._progress_lock = Lock()
         self._processed_count = 0
+        
+        # Optional callable -> True when the job was cancelled (checked between batches)
+        self.cancel_check = None
+    
+    def raise_if_cancelled(self):
+        """Raise JobCancelled if the cancel check says so"""
+        if self.cancel_check and self.cancel_check():
+            raise JobCancelled('Job cancelled')
     
     def _classify_batch_worker(self, batch_data: Dict) -> Tuple[int, List]:
         """
@@ -41,6 +53,9 @@ class ParallelClassifier:
         categories = batch_data['categories']
         question_text = batch_data['question_text']
         
+        # Skip the API call if the job was cancelled while this batch waited
+        self.raise_if_cancelled()
+        
         try:
             # Add small delay to avoid rate limits
             if batch_idx > 0:
@@ -108,16 +123,22 @@ class ParallelClassifier:
         start_time = time.time()
         
         with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            # Submit all batches to workers
-            future_to_batch = {
-                executor.submit(self._classify_batch_worker, batch_data): batch_data['batch_idx']
-                for batch_data in batches
-            }
-            
-            # Collect results as they complete
+            # Windowed submission: at most max_workers batches in flight, so a
+            # cancelled job stops after the in-flight batches instead of the whole queue
+            next_batch = 0
+            future_to_batch = {}
             completed_batches = 0
-            for future in as_completed(future_to_batch):
-                batch_idx = future_to_batch[future]
+            
+            while next_batch < len(batches) or future_to_batch:
+                while next_batch < len(batches) and len(future_to_batch) < self.max_workers:
+                    self.raise_if_cancelled()
+                    future = executor.submit(self._classify_batch_worker, batches[next_batch])
+                    future_to_batch[future] = batches[next_batch]['batch_idx']
+                    next_batch += 1
+                
+                done, _ = wait(future_to_batch, return_when=FIRST_COMPLETED)
+                future = done.pop()
+                batch_idx = future_to_batch.pop(future)
                 completed_batches += 1
                 
                 try:
@@ -134,7 +155,9 @@ class ParallelClassifier:
                     
                     if progress_callback:
                         progress_callback(message, percentage)
-                        
+                
+                except JobCancelled:
+                    raise
                 except Exception as e:
                     print(f"[PARALLEL ERROR] Batch {batch_idx} exception: {str(e)}")
                     import traceback
@@ -180,6 +203,7 @@ class ParallelClassifier:
         
         for batch_idx in range(0, len(responses), batch_size):
             batch = responses[batch_idx:batch_idx+batch_size]
+            self.raise_if_cancelled()
             
             try:
                 # Classify batch
@@ -2,9 +2,8 @@
 Semi Open-Ended Detector
 Detect and process pre-coded questions with "Lainnya" (Other) option
 """
-import pandas as pd
-import re
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, List, Optional
+from form_schema import FormSchema
 
 
 class SemiOpenDetector:
@@ -18,14 +17,16 @@ class SemiOpenDetector:
             kobo_system_path: Path to kobo_system_*.xlsx file
         """
         self.kobo_system_path = kobo_system_path
+        self.schema = None
         self.survey_df = None
         self.choices_df = None
         self.semi_open_pairs = []
         
     def load_sheets(self):
-        """Load survey and choices sheets"""
-        self.survey_df = pd.read_excel(self.kobo_system_path, sheet_name='survey')
-        self.choices_df = pd.read_excel(self.kobo_system_path, sheet_name='choices')
+        """Load survey and choices sheets (shared compiled schema, cached by file hash)"""
+        self.schema = FormSchema.load(self.kobo_system_path)
+        self.survey_df = self.schema.survey_df
+        self.choices_df = self.schema.choices_df
         
     def detect_lainnya_in_choices(self) -> Dict[str, int]:
         """
@@ -35,29 +36,10 @@ class SemiOpenDetector:
             Dict mapping list_name to lainnya code
             Example: {'S9': 96, 'S10': 96}
         """
-        lainnya_map = {}
-        
-        if self.choices_df is None or self.choices_df.empty:
-            return lainnya_map
-        
-        # Find rows with "lainnya" in label (case-insensitive)
-        lainnya_pattern = re.compile(r'lainnya', re.IGNORECASE)
+        if self.schema is None:
+            self.load_sheets()
         
-        for _, row in self.choices_df.iterrows():
-            list_name = row.get('list_name', '')
-            name = row.get('name', '')
-            label = str(row.get('label', '')).lower()
-            
-            if lainnya_pattern.search(label):
-                # Store the list_name and the code (name)
-                try:
-                    code = int(name)
-                    lainnya_map[list_name] = code
-                except (ValueError, TypeError):
-                    # If code is not integer, store as string
-                    lainnya_map[list_name] = name
-                    
-        return lainnya_map
+        return dict(self.schema.lainnya_codes)
     
     def detect_semi_open_pairs(self) -> List[Dict]:
         """
@@ -80,100 +62,36 @@ class SemiOpenDetector:
                 }
             ]
         """
-        if self.survey_df is None:
+        if self.schema is None:
             self.load_sheets()
         
-        pairs = []
-        lainnya_map = self.detect_lainnya_in_choices()
-        
-        if not lainnya_map:
+        if not self.schema.lainnya_codes:
             print("⚠️  No 'Lainnya' options found in choices sheet")
-            return pairs
+            self.semi_open_pairs = []
+            return []
         
-        # Iterate through survey rows
-        for idx, row in self.survey_df.iterrows():
-            var_type = row.get('type', '')
-            var_name = row.get('name', '')
-            
-            # Check if this is a select question with lainnya option
-            if var_type in ['select_one', 'select_multiple']:
-                # Extract list_name from type (e.g., "select_one S10" -> "S10")
-                type_parts = var_type.split()
-                if len(type_parts) > 1:
-                    list_name = type_parts[1]
-                else:
-                    # Try to get from name if not in type
-                    list_name = var_name
-                
-                # Check if this list has lainnya option
-                if list_name in lainnya_map:
-                    lainnya_code = lainnya_map[list_name]
-                    
-                    # Look for corresponding text field
-                    # Common patterns: S10_L, S10_lainnya, S10_other
-                    text_var = self._find_text_pair(var_name, idx)
-                    
-                    if text_var:
-                        pair = {
-                            'select_var': var_name,
-                            'text_var': text_var['name'],
-                            'lainnya_code': lainnya_code,
-                            'select_label': row.get('label', ''),
-                            'text_label': text_var['label'],
-                            'list_name': list_name,
-                            'select_type': var_type
-                        }
-                        pairs.append(pair)
-                        print(f"✅ Detected semi open-ended pair: {var_name} + {text_var['name']} (code: {lainnya_code})")
+        pairs = self.schema.semi_open_pairs()
+        for pair in pairs:
+            print(f"✅ Detected semi open-ended pair: {pair['select_var']} + {pair['text_var']} (code: {pair['lainnya_code']})")
         
         self.semi_open_pairs = pairs
         return pairs
     
-    def _find_text_pair(self, select_var: str, select_idx: int) -> Optional[Dict]:
+    def _find_text_pair(self, select_var: str, select_idx: int = None) -> Optional[Dict]:
         """
         Find corresponding text field for select variable
         
         Args:
             select_var: Name of select variable (e.g., 'S10')
-            select_idx: Index of select variable in survey df
+            select_idx: Unused (kept for backward compatibility, pairs are precomputed)
             
         Returns:
             Dict with text variable info or None
         """
-        # Common suffixes for "lainnya" text fields
-        suffixes = ['_L', '_l', '_lainnya', '_Lainnya', '_other', '_Other']
-        
-        # Check next few rows (usually text field comes right after select)
-        search_range = min(select_idx + 5, len(self.survey_df))
-        
-        for idx in range(select_idx + 1, search_range):
-            row = self.survey_df.iloc[idx]
-            var_type = row.get('type', '')
-            var_name = row.get('name', '')
-            label = str(row.get('label', '')).lower()
-            
-            # Check if this is a text field
-            if var_type == 'text':
-                # Check if name matches pattern
-                for suffix in suffixes:
-                    if var_name == f"{select_var}{suffix}":
-                        return {
-                            'name': var_name,
-                            'label': row.get('label', ''),
-                            'type': var_type
-                        }
-                
-                # Also check if label contains "lainnya" or "sebutkan"
-                if 'lainnya' in label or 'sebutkan' in label:
-                    # Verify it's related to select_var
-                    if var_name.startswith(select_var):
-                        return {
-                            'name': var_name,
-                            'label': row.get('label', ''),
-                            'type': var_type
-                        }
+        if self.schema is None:
+            self.load_sheets()
         
-        return None
+        return self.schema.text_pairs.get(select_var)
     
     def get_summary(self) -> str:
         """Get summary of detected semi open-ended pairs"""
@@ -184,8 +102,8 @@ class SemiOpenDetector:
         
         for i, pair in enumerate(self.semi_open_pairs, 1):
             summary += f"{i}. {pair['select_var']} (code {pair['lainnya_code']}: Lainnya) + {pair['text_var']}\n"
-            summary += f"   Label: {pair['select_label'][:60]}...\n"
-            summary += f"   Text field: {pair['text_label'][:60]}...\n\n"
+            summary += f"   Label: {str(pair['select_label'])[:60]}...\n"
+            summary += f"   Text field: {str(pair['text_label'])[:60]}...\n\n"
         
         return summary
 
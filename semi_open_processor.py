@@ -2,10 +2,53 @@
 Semi Open-Ended Processor
 Process pre-coded questions with "Lainnya" (Other) option and merge with classifications
 """
+import os
+import re
 import pandas as pd
 import logging
 from typing import Dict, List
 from openai_classifier import OpenAIClassifier
+from parallel_classifier import ParallelClassifier
+from form_schema import FormSchema
+from storage import get_storage
+
+
+def normalize_select_codes(series: pd.Series) -> pd.Series:
+    """
+    Normalize select answers to space-separated code strings
+    
+    Handles numeric cells read as float (96.0 -> '96') and select_multiple
+    answers ('1 96'). Empty answers are dropped.
+    """
+    codes = series.dropna().astype(str).str.strip()
+    codes = codes.str.replace(r'(?<=\d)\.0(?=\s|$)', '', regex=True)
+    return codes[codes != '']
+
+
+def lainnya_mask(series: pd.Series, lainnya_code) -> pd.Series:
+    """
+    Boolean mask of rows whose answer includes the "Lainnya" code
+    
+    Works for select_one (96) and select_multiple ('1 96') answers.
+    """
+    codes = normalize_select_codes(series)
+    pattern = rf'(?:^|\s){re.escape(str(lainnya_code))}(?:\s|$)'
+    return codes.str.contains(pattern, regex=True).reindex(series.index, fill_value=False)
+
+
+def insert_merged_columns(df: pd.DataFrame, select_var: str, merged_columns: pd.DataFrame):
+    """
+    Insert merged columns into df right after select_var (in place)
+    
+    Existing merged columns (from a previous run) are overwritten.
+    """
+    insert_at = df.columns.get_loc(select_var) + 1
+    for column in merged_columns.columns:
+        if column in df.columns:
+            df[column] = merged_columns[column]
+        else:
+            df.insert(insert_at, column, merged_columns[column])
+        insert_at += 1
 
 
 class SemiOpenProcessor:
@@ -16,31 +59,64 @@ class SemiOpenProcessor:
         Initialize processor
         
         Args:
-            kobo_system_path: Path to kobo_system_*.xlsx
-            raw_data_path: Path to raw data Excel
-            openai_api_key: OpenAI API key for classification
+            kobo_system_path: Path / storage ref of kobo_system_*.xlsx
+            raw_data_path: Path / storage ref of raw data Excel
+            openai_api_key: OpenAI API key (kept for compatibility; the classifier
+                reads the key from SystemSettings / .env)
         """
-        self.kobo_system_path = kobo_system_path
-        self.raw_data_path = raw_data_path
+        # Storage refs -> local files (downloaded once per node)
+        storage = get_storage()
+        self.kobo_system_path = storage.fetch(kobo_system_path)
+        self.raw_data_path = storage.fetch(raw_data_path)
         self.openai_api_key = openai_api_key
         
+        self.schema = None
         self.kobo_system_df = None
         self.choices_df = None
         self.raw_data_df = None
-        self.classifier = OpenAIClassifier(openai_api_key)
+        self.classifier = OpenAIClassifier()
+        
+        # Same batched/concurrent path as pure open-ended variables
+        # Priority: Database settings > .env > defaults
+        self.enable_parallel = str(self._get_setting('enable_parallel_processing',
+                                   os.getenv('ENABLE_PARALLEL_PROCESSING', 'true'))).lower() == 'true'
+        self.parallel_classifier = ParallelClassifier(
+            self.classifier,
+            max_workers=int(self._get_setting('parallel_max_workers', os.getenv('PARALLEL_MAX_WORKERS', '5'))),
+            rate_limit_delay=float(self._get_setting('rate_limit_delay', os.getenv('RATE_LIMIT_DELAY', '0.1')))
+        )
         
         self.logger = logging.getLogger(__name__)
+    
+    @staticmethod
+    def _get_setting(key, default):
+        """Get setting from SystemSettings (needs an app context), fallback to default"""
+        try:
+            from app.models import SystemSettings
+            value = SystemSettings.get_setting(key, None)
+            if value is not None:
+                return value
+        except Exception:
+            pass
+        return default
+        
+    def load_data(self, columns: List[str] = None):
+        """
+        Load all required data
         
-    def load_data(self):
-        """Load all required data"""
+        Args:
+            columns: Only load these raw data columns (e.g. one pair's select + text
+                     variables); row index is unchanged so results align with the full file
+        """
         self.logger.info("Loading data files...")
         
-        # Load kobo_system sheets
-        self.kobo_system_df = pd.read_excel(self.kobo_system_path, sheet_name='survey')
-        self.choices_df = pd.read_excel(self.kobo_system_path, sheet_name='choices')
+        # Load kobo_system sheets (compiled schema, cached by file hash)
+        self.schema = FormSchema.load(self.kobo_system_path)
+        self.kobo_system_df = self.schema.survey_df
+        self.choices_df = self.schema.choices_df
         
         # Load raw data
-        self.raw_data_df = pd.read_excel(self.raw_data_path)
+        self.raw_data_df = pd.read_excel(self.raw_data_path, usecols=columns)
         
         self.logger.info(f"✅ Loaded {len(self.raw_data_df)} responses")
         
@@ -55,31 +131,19 @@ class SemiOpenProcessor:
             Dict mapping code to label
             Example: {1: 'Suami / istri', 2: 'Orang tua', 96: 'Lainnya'}
         """
-        if self.choices_df is None:
+        if self.schema is None:
             return {}
         
-        choice_map = {}
-        
-        for _, row in self.choices_df[self.choices_df['list_name'] == list_name].iterrows():
-            try:
-                code = int(row['name'])
-                label = row['label']
-                choice_map[code] = label
-            except (ValueError, TypeError):
-                # If code is not integer
-                code = row['name']
-                label = row['label']
-                choice_map[code] = label
-        
-        return choice_map
+        return self.schema.choice_labels(list_name)
     
-    def process_semi_open_pair(self, pair: Dict, progress_callback=None) -> Dict:
+    def process_semi_open_pair(self, pair: Dict, progress_callback=None, max_categories: int = 10) -> Dict:
         """
         Process a semi open-ended pair
         
         Args:
             pair: Dict with pair info from SemiOpenDetector
-            progress_callback: Optional callback function for progress updates
+            progress_callback: Optional callback(message, percentage)
+            max_categories: Maximum number of new categories from 'Lainnya' responses
             
         Returns:
             Dict with results including merged variable
@@ -113,12 +177,14 @@ class SemiOpenProcessor:
         
         # Step 3: Classify the "Lainnya" text responses
         if progress_callback:
-            progress_callback(f"Classifying {len(lainnya_responses)} 'Lainnya' responses for {text_var}...")
+            progress_callback(f"Classifying {len(lainnya_responses)} 'Lainnya' responses for {text_var}...", 10)
         
         categories, classified_df = self._classify_lainnya_responses(
             text_var, 
             lainnya_responses,
-            pair.get('text_label', '')
+            pair.get('text_label', ''),
+            max_categories=max_categories,
+            progress_callback=progress_callback
         )
         
         self.logger.info(f"✅ Generated {len(categories)} new categories from 'Lainnya' responses")
@@ -129,11 +195,11 @@ class SemiOpenProcessor:
         
         category_code_map = {}
         for i, cat in enumerate(categories, start=new_code_start):
-            category_code_map[cat['category']] = i
+            category_code_map[cat] = i
         
-        # Step 5: Create merged variable
+        # Step 5: Create merged variable (only the two new columns, no full-frame copy)
         merged_var = f"{select_var}_merged"
-        merged_df = self._create_merged_variable(
+        merged_columns = self._create_merged_variable(
             select_var,
             text_var,
             lainnya_code,
@@ -145,17 +211,22 @@ class SemiOpenProcessor:
         # Step 6: Update choices sheet
         new_choices = self._create_new_choices(list_name, categories, new_code_start)
         
+        # Per-response results for the response index
+        response_rows = self._response_rows(select_var, text_var, lainnya_code, lainnya_responses,
+                                            classified_df, category_code_map)
+        
         result = {
             'success': True,
             'select_var': select_var,
             'text_var': text_var,
             'merged_var': merged_var,
-            'merged_df': merged_df,
+            'merged_columns': merged_columns,
             'new_categories': categories,
             'new_choices': new_choices,
             'category_code_map': category_code_map,
             'choice_labels': choice_labels,
             'lainnya_code': lainnya_code,
+            'response_rows': response_rows,
             'stats': {
                 'total_responses': len(self.raw_data_df),
                 'lainnya_responses': len(lainnya_responses),
@@ -170,7 +241,7 @@ class SemiOpenProcessor:
         return result
     
     def _extract_lainnya_responses(self, select_var: str, text_var: str, lainnya_code) -> pd.DataFrame:
-        """Extract responses where select_var = lainnya_code"""
+        """Extract responses where select_var includes lainnya_code (select_one or select_multiple)"""
         if select_var not in self.raw_data_df.columns:
             self.logger.error(f"❌ Select variable '{select_var}' not found in raw data")
             return pd.DataFrame()
@@ -179,8 +250,8 @@ class SemiOpenProcessor:
             self.logger.error(f"❌ Text variable '{text_var}' not found in raw data")
             return pd.DataFrame()
         
-        # Filter rows where select_var equals lainnya_code
-        mask = self.raw_data_df[select_var] == lainnya_code
+        # Filter rows where select_var includes lainnya_code
+        mask = lainnya_mask(self.raw_data_df[select_var], lainnya_code)
         
         # Get text responses for those rows
         lainnya_df = self.raw_data_df[mask][[text_var]].copy()
@@ -188,104 +259,167 @@ class SemiOpenProcessor:
         
         return lainnya_df
     
-    def _classify_lainnya_responses(self, text_var: str, responses_df: pd.DataFrame, question_text: str) -> tuple:
+    def _classify_lainnya_responses(self, text_var: str, responses_df: pd.DataFrame, question_text: str,
+                                    max_categories: int = 10, progress_callback=None) -> tuple:
         """
-        Classify the "Lainnya" text responses using OpenAI
+        Classify the "Lainnya" text responses using OpenAI (batched, parallel)
+        
+        Duplicate texts are classified once; invalid answers (TA, tidak ada, ...)
+        are skipped and keep the Lainnya code.
         
         Returns:
             Tuple of (categories, classified_df)
+            categories: List of category names
+            classified_df: responses_df rows that were classified, with
+                           'category' and 'confidence' columns
         """
-        responses_list = responses_df[text_var].tolist()
+        texts = responses_df[text_var].astype(str).str.strip()
+        unique_texts = [t for t in texts.unique() if t and self.classifier.is_valid_response(t)]
         
-        # Phase 1: Generate categories
+        if not unique_texts:
+            return [], responses_df.iloc[0:0].assign(category=None, confidence=None)
+        
+        # Phase 1: Generate categories (cancel check set by the task, see parallel_classifier)
+        self.parallel_classifier.raise_if_cancelled()
         self.logger.info("🤖 Phase 1: Generating categories from 'Lainnya' responses...")
+        if progress_callback:
+            progress_callback(f"Generating categories from {len(unique_texts)} unique 'Lainnya' responses...", 15)
         categories = self.classifier.generate_categories(
-            responses=responses_list,
+            responses=unique_texts,
             question_text=question_text,
-            max_categories=10
+            max_categories=max_categories
         )
         
-        # Phase 2: Classify all responses
-        self.logger.info("🤖 Phase 2: Classifying 'Lainnya' responses...")
-        classified_results = []
+        # Phase 2: Classify unique responses (batched, concurrent when enabled)
+        self.logger.info(f"🤖 Phase 2: Classifying {len(unique_texts)} unique 'Lainnya' responses...")
+        classify = (self.parallel_classifier.classify_parallel if self.enable_parallel
+                    else self.parallel_classifier.classify_sequential)
+        results = classify(
+            responses=unique_texts,
+            categories=categories,
+            question_text=question_text or "",
+            batch_size=10,
+            progress_callback=lambda msg, pct: progress_callback(msg, 30 + int(pct * 0.6)) if progress_callback else None
+        )
         
-        for response in responses_list:
-            result = self.classifier.classify_response(
-                response=response,
-                categories=categories,
-                question_text=question_text
-            )
-            classified_results.append(result)
+        # Primary category per unique text
+        text_to_result = {}
+        for text, result in zip(unique_texts, results):
+            if isinstance(result, list) and len(result) > 0:
+                text_to_result[text] = result[0]
         
-        # Create DataFrame with results
+        # Create DataFrame with results (map back to every response row)
         classified_df = responses_df.copy()
-        classified_df['category'] = [r['category'] for r in classified_results]
-        classified_df['category_number'] = [r['category_number'] for r in classified_results]
-        classified_df['confidence'] = [r['confidence'] for r in classified_results]
+        classified_df[text_var] = texts
+        classified_df = classified_df[texts.isin(text_to_result.keys())]
+        classified_df['category'] = classified_df[text_var].map(lambda t: text_to_result[t][0])
+        classified_df['confidence'] = classified_df[text_var].map(lambda t: text_to_result[t][1])
         
         return categories, classified_df
     
+    def _response_rows(self, select_var: str, text_var: str, lainnya_code, lainnya_responses: pd.DataFrame,
+                       classified_df: pd.DataFrame, category_code_map: Dict) -> List[Dict]:
+        """
+        One row per 'Lainnya' answer: classified ones get their new category,
+        invalid/unclassified ones keep the Lainnya code
+        
+        Returns:
+            List of {'variable', 'row_index', 'response', 'category', 'codes', 'confidence', 'source'}
+        """
+        rows = []
+        for row_index, text in lainnya_responses[text_var].items():
+            text = str(text).strip()
+            if not text:
+                continue
+            if row_index in classified_df.index:
+                category = classified_df.at[row_index, 'category']
+                confidence = classified_df.at[row_index, 'confidence']
+                rows.append({
+                    'variable': select_var,
+                    'row_index': int(row_index),
+                    'response': text,
+                    'category': category,
+                    'codes': str(category_code_map.get(category, lainnya_code)),
+                    'confidence': float(confidence) if pd.notna(confidence) else None,
+                    'source': 'ai'
+                })
+            else:
+                rows.append({
+                    'variable': select_var,
+                    'row_index': int(row_index),
+                    'response': text,
+                    'category': 'Lainnya',
+                    'codes': str(lainnya_code),
+                    'confidence': None,
+                    'source': 'invalid'
+                })
+        return rows
+    
     def _create_merged_variable(self, select_var: str, text_var: str, lainnya_code,
                                 choice_labels: Dict, classified_df: pd.DataFrame,
                                 category_code_map: Dict) -> pd.DataFrame:
         """
-        Create merged variable combining pre-coded and classified responses
+        Create merged variable combining pre-coded and classified responses (vectorized)
         
         Logic:
-        - If select_var != lainnya_code → use pre-coded label (from choice_labels)
-        - If select_var == lainnya_code → use classified category (from classified_df)
-        """
-        merged_df = self.raw_data_df.copy()
+        - Pre-coded answer → keep code, label from choice_labels
+        - "Lainnya" answer → classified category code/label (from classified_df),
+          fallback to the Lainnya code if the text is empty or unclassified
+        - select_multiple ('1 96') → only the Lainnya token is replaced ('1 12')
         
-        # Initialize merged columns
-        merged_code_col = []
-        merged_label_col = []
-        
-        # Create lookup for classified responses (text -> category code)
-        text_to_category = {}
-        if not classified_df.empty:
-            for _, row in classified_df.iterrows():
-                text = row[text_var]
-                category = row['category']
-                code = category_code_map.get(category)
-                text_to_category[text] = code
-        
-        # Iterate through all rows
-        for _, row in merged_df.iterrows():
-            select_value = row[select_var]
-            text_value = row[text_var] if text_var in row else None
-            
-            if pd.isna(select_value):
-                # No selection made
-                merged_code_col.append(None)
-                merged_label_col.append(None)
-            elif select_value == lainnya_code:
-                # "Lainnya" selected - use classified category
-                if pd.notna(text_value) and text_value in text_to_category:
-                    code = text_to_category[text_value]
-                    # Find category label
-                    category = next((k for k, v in category_code_map.items() if v == code), "Unknown")
-                    merged_code_col.append(code)
-                    merged_label_col.append(category)
-                else:
-                    # Lainnya selected but no text or not classified
-                    merged_code_col.append(lainnya_code)
-                    merged_label_col.append(choice_labels.get(lainnya_code, "Lainnya"))
-            else:
-                # Pre-coded option selected
-                merged_code_col.append(select_value)
-                merged_label_col.append(choice_labels.get(select_value, f"Code {select_value}"))
+        Codes are written as strings, same convention as the *_coded columns.
         
-        # Add merged columns to dataframe
+        Returns:
+            DataFrame with `{select_var}_merged` and `{select_var}_merged_label`,
+            aligned to raw_data_df.index (empty selections stay empty)
+        """
         merged_var_code = f"{select_var}_merged"
         merged_var_label = f"{select_var}_merged_label"
+        lainnya_str = str(lainnya_code)
+        
+        # code (string) -> label: pre-coded choices + new categories
+        label_lookup = {str(code): label for code, label in choice_labels.items()}
+        label_lookup.setdefault(lainnya_str, "Lainnya")
+        label_lookup.update({str(code): category for category, code in category_code_map.items()})
         
-        merged_df[merged_var_code] = merged_code_col
-        merged_df[merged_var_label] = merged_label_col
+        codes = normalize_select_codes(self.raw_data_df[select_var])
         
-        return merged_df
+        # Replacement code for the Lainnya token of each row (row -> category -> code)
+        if not classified_df.empty:
+            replacement = classified_df['category'].map(category_code_map)
+            replacement = replacement.dropna().astype(int).astype(str).reindex(codes.index)
+        else:
+            replacement = pd.Series(index=codes.index, dtype=object)
+        replacement = replacement.fillna(lainnya_str)
+        
+        # select_one answers: direct mask + map
+        is_multi = codes.str.contains(' ', regex=False)
+        single = codes[~is_multi]
+        merged_single = single.where(single != lainnya_str, replacement[~is_multi])
+        label_single = merged_single.map(label_lookup).fillna('Code ' + merged_single)
+        
+        # select_multiple answers: explode tokens, replace Lainnya token, join back
+        tokens = codes[is_multi].str.split().explode()
+        tokens = tokens.where(tokens != lainnya_str, replacement.reindex(tokens.index))
+        token_labels = tokens.map(label_lookup).fillna('Code ' + tokens)
+        merged_multi = tokens.groupby(level=0).agg(' '.join)
+        label_multi = token_labels.groupby(level=0).agg('; '.join)
+        
+        merged = pd.DataFrame(index=self.raw_data_df.index, columns=[merged_var_code, merged_var_label], dtype=object)
+        merged[merged_var_code] = pd.concat([merged_single, merged_multi])
+        merged[merged_var_label] = pd.concat([label_single, label_multi])
+        
+        return merged
+    
+    def apply_merged_columns(self, select_var: str, merged_columns: pd.DataFrame):
+        """
+        Insert merged columns into raw_data_df right after select_var (in place)
+        
+        Existing merged columns (from a previous run) are overwritten.
+        """
+        insert_merged_columns(self.raw_data_df, select_var, merged_columns)
     
-    def _create_new_choices(self, list_name: str, categories: List[Dict], start_code: int) -> pd.DataFrame:
+    def _create_new_choices(self, list_name: str, categories: List[str], start_code: int) -> pd.DataFrame:
         """
         Create new rows for choices sheet
         
@@ -298,7 +432,7 @@ class SemiOpenProcessor:
             new_choices.append({
                 'list_name': list_name,
                 'name': i,
-                'label': cat['category']
+                'label': cat
             })
         
         return pd.DataFrame(new_choices)
@@ -313,12 +447,12 @@ class SemiOpenProcessor:
         """
         self.logger.info(f"💾 Saving results to {output_path}...")
         
-        # Get merged data
-        merged_df = result['merged_df']
+        # Add merged columns to raw data
+        self.apply_merged_columns(result['select_var'], result['merged_columns'])
         
         with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
             # Save merged raw data
-            merged_df.to_excel(writer, sheet_name='data', index=False)
+            self.raw_data_df.to_excel(writer, sheet_name='data', index=False)
             
             # Update and save choices
             updated_choices = self._update_choices_sheet(result)
@@ -0,0 +1,113 @@
+"""
+SSE Progress Server
+M-Code Pro - Push-based progress via Server-Sent Events
+
+Small dedicated Flask app: each open progress stream is one greenlet waiting
+on the job's Redis pub/sub channel (see tasks/progress.py), so watching jobs
+costs nothing on the main app's sync gunicorn workers.
+
+Run with an async worker class (nginx routes /sse/ here):
+    gunicorn -k gevent -w 1 --worker-connections 1000 -b 127.0.0.1:8001 sse_app:app
+
+Uses the main app's SECRET_KEY, so the Flask-Login session cookie
+authenticates the stream; only the job's owner (the _user_id field of its
+progress hash) may watch it. No database access.
+"""
+
+import os
+import json
+import time
+from flask import Flask, Response, session, stream_with_context
+from dotenv import load_dotenv
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+load_dotenv(os.path.join(basedir, '.env'))
+
+from config import config
+from tasks.progress import progress_tracker
+
+KEEPALIVE_SECONDS = int(os.getenv('SSE_KEEPALIVE_SECONDS', '15'))
+MAX_STREAM_SECONDS = int(os.getenv('SSE_MAX_STREAM_SECONDS', '3600'))  # browser reconnects after this
+RETRY_MS = int(os.getenv('SSE_RETRY_MS', '3000'))
+
+FINAL_STATUSES = ('completed', 'error', 'failed', 'cancelled')
+
+app = Flask(__name__)
+app.config.from_object(config[os.getenv('FLASK_ENV', 'development')])
+
+
+def _format_event(event: str, data) -> str:
+    """Format one SSE message"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def _is_final(data) -> bool:
+    """True when the progress (snapshot or update) marks the end of the job"""
+    if not data:
+        return False
+    return data.get('status') in FINAL_STATUSES or data.get('completed') is True
+
+
+def _event_stream(job_id: str):
+    """
+    Yield SSE messages for one job
+
+    Subscribes first, then sends the current snapshot, so no delta published
+    in between is lost. Ends when the job reaches a final status.
+    """
+    pubsub = progress_tracker.subscribe(job_id)
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+
+        snapshot = progress_tracker.get_progress(job_id)
+        if snapshot is not None:
+            yield _format_event('snapshot', snapshot)
+            if _is_final(snapshot):
+                return
+
+        deadline = time.time() + MAX_STREAM_SECONDS
+        while time.time() < deadline:
+            message = pubsub.get_message(timeout=KEEPALIVE_SECONDS)
+            if message is None:
+                yield ": keepalive\n\n"
+                continue
+
+            delta = json.loads(message['data'])
+            yield _format_event(delta['event'], delta['data'])
+
+            if delta['event'] in ('snapshot', 'update') and _is_final(delta['data']):
+                return
+    finally:
+        pubsub.close()
+
+
+@app.route('/sse/progress/<job_id>')
+def progress_stream(job_id):
+    """SSE stream of progress deltas for one job (its owner only)"""
+    user_id = session.get('_user_id')
+    if not user_id:
+        return Response('Unauthorized', status=401)
+
+    # Same answer for other users' jobs and unknown jobs: don't reveal which exist
+    if progress_tracker.get_owner(job_id) != str(user_id):
+        return Response('Not found', status=404)
+
+    return Response(
+        stream_with_context(_event_stream(job_id)),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # nginx: don't buffer the stream
+        }
+    )
+
+
+@app.route('/sse/health')
+def health():
+    """Health check for supervisor/nginx"""
+    return {'status': 'ok'}
+
+
+if __name__ == '__main__':
+    # Development only (threaded server); production uses gunicorn + gevent
+    app.run(host='127.0.0.1', port=int(os.getenv('SSE_PORT', '8001')), threaded=True)
@@ -0,0 +1,355 @@
+"""
+File Storage
+Semua file job (upload, output, bundle download, partial hasil subtask) lewat
+satu abstraksi, supaya worker Celery bisa jalan di node lain tanpa disk
+bersama dengan web host.
+
+Backend (env STORAGE_BACKEND):
+- local (default): file di files/ pada disk lokal; reference = path absolut
+  (sama dengan isi kolom *_path yang sudah ada, jadi data lama tetap jalan)
+- s3: bucket S3-compatible (AWS S3, atau MinIO lewat S3_ENDPOINT_URL);
+  reference = s3://<bucket>/<key>. Tiap node punya read-through cache lokal
+  (STORAGE_CACHE_DIR): object hanya di-download sekali per node.
+
+Key = path relatif terhadap root, mis.
+    uploads/<sha256>.xlsx
+    output/output_raw_<ts>.xlsx, output/output_raw_<ts>.zip
+    output/partials_<job_id>/variable_0001.pkl
+
+Pola pakai:
+    path = storage.local_path('output/x.xlsx')   # tulis file lokal di sini
+    ref = storage.publish(path)                  # upload (s3) / no-op (local)
+    local = storage.fetch(ref)                   # path lokal (download sekali per node)
+    body = storage.open(ref)                     # stream baca tanpa file lokal
+    storage.evict(ref)                           # buang copy lokal (s3) / no-op (local)
+
+Web host tidak menyimpan copy (publish(keep_local=False) untuk upload, evict()
+setelah build bundle): cache-nya tidak pernah di-prune janitor, yang hanya
+jalan di worker.
+
+Env s3: S3_BUCKET, S3_ENDPOINT_URL (MinIO: http://localhost:9000), S3_REGION,
+S3_ACCESS_KEY_ID, S3_SECRET_ACCESS_KEY (default: kredensial standar boto3).
+"""
+import os
+import shutil
+import uuid
+from typing import Iterable, Iterator, Optional, Tuple
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+FILES_ROOT = os.path.join(BASE_DIR, 'files')
+
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'local').lower()
+STORAGE_CACHE_DIR = os.getenv('STORAGE_CACHE_DIR', os.path.join(FILES_ROOT, 'cache', 'storage'))
+
+TRANSFER_CHUNK_SIZE = 8 * 1024 * 1024  # multipart part size + download stream chunk
+DELETE_BATCH = 1000  # S3 DeleteObjects limit
+
+
+def _ensure_parent(path: str) -> str:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+class LocalStorage:
+    """Files on the local disk under root (single node, or a shared mount)"""
+
+    name = 'local'
+
+    def __init__(self, root: str = FILES_ROOT):
+        self.root = os.path.abspath(root)
+
+    def ref(self, key: str) -> str:
+        """Reference for a key (absolute path)"""
+        return os.path.join(self.root, *key.split('/'))
+
+    def ref_for(self, local_path: str) -> str:
+        """Reference a file will have once published"""
+        return local_path
+
+    def is_local(self, ref: str) -> bool:
+        return True
+
+    def local_path(self, key: str) -> str:
+        """Where to write a file for key (parent directory created)"""
+        return _ensure_parent(self.ref(key))
+
+    def publish(self, local_path: str, keep_local: bool = True) -> str:
+        """Make a written file available to every node (already is: same disk)"""
+        return local_path
+
+    def fetch(self, ref: str) -> str:
+        """Local path of a stored file"""
+        return ref
+
+    def evict(self, ref: Optional[str]):
+        """Drop this node's cached copy of a stored file (the file itself is the copy here)"""
+
+    def open(self, ref: str):
+        """Binary stream of a stored file (caller closes)"""
+        return open(ref, 'rb')
+
+    def exists(self, ref: Optional[str]) -> bool:
+        return bool(ref) and os.path.exists(ref)
+
+    def size(self, ref: str) -> int:
+        return os.path.getsize(ref)
+
+    def touch(self, ref: str):
+        """Mark a file as recently used (retention goes by modification time)"""
+        os.utime(ref)
+
+    def delete(self, ref: Optional[str]) -> bool:
+        """Delete a stored file; False when it did not exist"""
+        if not self.exists(ref):
+            return False
+        os.remove(ref)
+        return True
+
+    def delete_many(self, refs: Iterable[str]) -> Tuple[int, int]:
+        """
+        Delete several stored files (missing ones are skipped)
+
+        Returns:
+            tuple: (files removed, bytes reclaimed)
+        """
+        removed = reclaimed = 0
+        for ref in refs:
+            try:
+                size = os.path.getsize(ref)
+                os.remove(ref)
+            except FileNotFoundError:
+                continue
+            removed += 1
+            reclaimed += size
+        return removed, reclaimed
+
+    def delete_prefix(self, key: str):
+        """Delete everything under a key prefix (e.g. a job's partials)"""
+        shutil.rmtree(self.ref(key), ignore_errors=True)
+
+    def iter_objects(self, prefix: str) -> Iterator[Tuple[str, float, int]]:
+        """Yield (ref, modified timestamp, size) of files directly under a key prefix"""
+        directory = self.ref(prefix)
+        if not os.path.isdir(directory):
+            return
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    stat = entry.stat()
+                    yield entry.path, stat.st_mtime, stat.st_size
+
+
+class S3Storage:
+    """
+    S3-compatible bucket with a local read-through cache
+
+    Files are written into the cache directory first (same layout as the
+    keys), then uploaded by publish(); fetch() downloads an object into the
+    cache once per node. Plain paths (rows from before the switch) are
+    served from the local disk.
+    """
+
+    name = 's3'
+
+    def __init__(self, bucket: str, cache_dir: str = STORAGE_CACHE_DIR,
+                 endpoint_url: Optional[str] = None, region: Optional[str] = None,
+                 access_key: Optional[str] = None, secret_key: Optional[str] = None):
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+
+        if not bucket:
+            raise ValueError('S3_BUCKET is required for STORAGE_BACKEND=s3')
+
+        self.bucket = bucket
+        self.root = os.path.abspath(cache_dir)
+        self.prefix = f's3://{bucket}/'
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url or None,
+            region_name=region or None,
+            aws_access_key_id=access_key or None,
+            aws_secret_access_key=secret_key or None
+        )
+        # Streamed multipart transfers: files never have to fit in memory
+        self.transfer = TransferConfig(multipart_threshold=TRANSFER_CHUNK_SIZE,
+                                       multipart_chunksize=TRANSFER_CHUNK_SIZE)
+
+    def ref(self, key: str) -> str:
+        return f'{self.prefix}{key}'
+
+    def _key(self, ref: str) -> str:
+        return ref[len(self.prefix):]
+
+    def _cache_path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split('/'))
+
+    def _key_for(self, local_path: str) -> str:
+        relative = os.path.relpath(os.path.abspath(local_path), self.root)
+        if relative.startswith('..'):
+            raise ValueError(f'{local_path} is not under the storage cache ({self.root})')
+        return relative.replace(os.sep, '/')
+
+    def ref_for(self, local_path: str) -> str:
+        return self.ref(self._key_for(local_path))
+
+    def is_local(self, ref: str) -> bool:
+        return not ref.startswith(self.prefix)
+
+    def local_path(self, key: str) -> str:
+        return _ensure_parent(self._cache_path(key))
+
+    def publish(self, local_path: str, keep_local: bool = True) -> str:
+        key = self._key_for(local_path)
+        self.client.upload_file(local_path, self.bucket, key, Config=self.transfer)
+        if not keep_local:
+            os.remove(local_path)
+        return self.ref(key)
+
+    def evict(self, ref: Optional[str]):
+        if ref and not self.is_local(ref):
+            cached = self._cache_path(self._key(ref))
+            if os.path.exists(cached):
+                os.remove(cached)
+
+    def fetch(self, ref: str) -> str:
+        if self.is_local(ref):
+            return ref
+        path = self._cache_path(self._key(ref))
+        if os.path.exists(path):
+            os.utime(path)  # keep it away from cache pruning
+            return path
+
+        tmp_path = _ensure_parent(f'{path}.{uuid.uuid4().hex}.tmp')
+        try:
+            self.client.download_file(self.bucket, self._key(ref), tmp_path, Config=self.transfer)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return path
+
+    def open(self, ref: str):
+        if self.is_local(ref):
+            return open(ref, 'rb')
+        return self.client.get_object(Bucket=self.bucket, Key=self._key(ref))['Body']
+
+    def exists(self, ref: Optional[str]) -> bool:
+        from botocore.exceptions import ClientError
+
+        if not ref:
+            return False
+        if self.is_local(ref):
+            return os.path.exists(ref)
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(ref))
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def size(self, ref: str) -> int:
+        if self.is_local(ref):
+            return os.path.getsize(ref)
+        return self.client.head_object(Bucket=self.bucket, Key=self._key(ref))['ContentLength']
+
+    def touch(self, ref: str):
+        if self.is_local(ref):
+            os.utime(ref)
+            return
+        key = self._key(ref)
+        # Copy onto itself: the only way to bump LastModified. S3 only allows it
+        # with MetadataDirective=REPLACE, so the object's metadata is passed through
+        head = self.client.head_object(Bucket=self.bucket, Key=key)
+        metadata = {name: head[name] for name in
+                    ('ContentType', 'ContentEncoding', 'ContentDisposition', 'ContentLanguage', 'CacheControl')
+                    if head.get(name)}
+        self.client.copy_object(Bucket=self.bucket, Key=key, CopySource={'Bucket': self.bucket, 'Key': key},
+                                MetadataDirective='REPLACE', Metadata=head.get('Metadata', {}), **metadata)
+
+    def delete(self, ref: Optional[str]) -> bool:
+        if not self.exists(ref):
+            return False
+        if self.is_local(ref):
+            os.remove(ref)
+            return True
+        key = self._key(ref)
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+        cached = self._cache_path(key)
+        if os.path.exists(cached):
+            os.remove(cached)
+        return True
+
+    def delete_many(self, refs: Iterable[str]) -> Tuple[int, int]:
+        from botocore.exceptions import ClientError
+
+        removed = reclaimed = 0
+        keys = []
+        for ref in refs:
+            if self.is_local(ref):
+                if os.path.exists(ref):
+                    reclaimed += os.path.getsize(ref)
+                    os.remove(ref)
+                    removed += 1
+                continue
+            try:
+                reclaimed += self.size(ref)
+            except ClientError:
+                continue  # already gone
+            keys.append(self._key(ref))
+
+        for start in range(0, len(keys), DELETE_BATCH):
+            batch = keys[start:start + DELETE_BATCH]
+            self.client.delete_objects(Bucket=self.bucket,
+                                       Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True})
+            removed += len(batch)
+            for key in batch:
+                cached = self._cache_path(key)
+                if os.path.exists(cached):
+                    os.remove(cached)
+        return removed, reclaimed
+
+    def delete_prefix(self, key: str):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=key.rstrip('/') + '/'):
+            objects = [{'Key': obj['Key']} for obj in page.get('Contents', [])]
+            if objects:
+                self.client.delete_objects(Bucket=self.bucket, Delete={'Objects': objects, 'Quiet': True})
+        shutil.rmtree(self._cache_path(key), ignore_errors=True)
+
+    def iter_objects(self, prefix: str) -> Iterator[Tuple[str, float, int]]:
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix.rstrip('/') + '/', Delimiter='/'):
+            for obj in page.get('Contents', []):
+                yield self.ref(obj['Key']), obj['LastModified'].timestamp(), obj['Size']
+
+
+_storage = None
+
+
+def get_storage():
+    """
+    Storage backend configured by STORAGE_BACKEND (created once per process)
+
+    Raises:
+        ValueError: Unknown backend or missing S3_BUCKET
+    """
+    global _storage
+    if _storage is None:
+        if STORAGE_BACKEND == 'local':
+            _storage = LocalStorage()
+        elif STORAGE_BACKEND == 's3':
+            _storage = S3Storage(
+                bucket=os.getenv('S3_BUCKET', ''),
+                endpoint_url=os.getenv('S3_ENDPOINT_URL'),
+                region=os.getenv('S3_REGION'),
+                access_key=os.getenv('S3_ACCESS_KEY_ID'),
+                secret_key=os.getenv('S3_SECRET_ACCESS_KEY')
+            )
+        else:
+            raise ValueError(f'Unknown STORAGE_BACKEND: {STORAGE_BACKEND}')
+        print(f"[STORAGE] Backend: {_storage.name} (local root: {_storage.root})", flush=True)
+    return _storage
+
+
+__all__ = ['get_storage', 'LocalStorage', 'S3Storage', 'FILES_ROOT']
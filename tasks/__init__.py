@@ -4,7 +4,10 @@ M-Code Pro - Celery Background Tasks
 
 This package contains all Celery task definitions:
 - classification.py: Classification tasks
+- semi_open.py: Semi open-ended tasks (per-pair subtasks + merge)
 - progress.py: Progress tracking with Redis
+- upload_analysis.py: Post-upload analysis (variable detection + statistics)
+- janitor.py: Background file deletion + periodic sweep of expired/orphaned files
 """
 
 from celery_app import celery_app
@@ -0,0 +1,76 @@
+"""
+Cooperative Job Cancellation
+M-Code Pro - Celery Background Task Processing
+
+api_cancel_job sets a cancel token in Redis; running tasks check it between
+variables, between API batches and before submitting new batches, then stop
+and free their worker slot. Queued Celery tasks are revoked by the web app
+and also check the token when they start (revoke is best-effort).
+
+Token lives in Redis DB 2 (next to progress): cancel:<job_id>
+"""
+
+import os
+import time
+import redis
+from typing import Callable
+from dotenv import load_dotenv
+
+from parallel_classifier import JobCancelled
+
+load_dotenv()
+
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379')
+redis_client = redis.from_url(REDIS_URL + '/2', decode_responses=True)  # DB 2 (same as progress)
+
+CANCEL_TTL = 86400  # 24 hours
+
+
+def _key(job_id: str) -> str:
+    return f"cancel:{job_id}"
+
+
+def request_cancel(job_id: str):
+    """Set the cancel token for a job"""
+    redis_client.setex(_key(job_id), CANCEL_TTL, '1')
+
+
+def is_cancelled(job_id: str) -> bool:
+    """Check whether the job was cancelled"""
+    return bool(redis_client.exists(_key(job_id)))
+
+
+def raise_if_cancelled(job_id: str):
+    """Raise JobCancelled if the job was cancelled"""
+    if is_cancelled(job_id):
+        raise JobCancelled(f'Job {job_id} cancelled')
+
+
+def cancel_checker(job_id: str, interval: float = 0.5) -> Callable[[], bool]:
+    """
+    Cheap cancel check for hot loops (classifier batches, thread pool workers)
+
+    Redis is asked at most once per `interval` seconds; once cancelled the
+    answer sticks. Redis errors never fail the job.
+
+    Returns:
+        callable: () -> True when the job was cancelled
+    """
+    state = {'checked_at': 0.0, 'cancelled': False}
+
+    def check() -> bool:
+        if state['cancelled']:
+            return True
+        now = time.monotonic()
+        if now - state['checked_at'] >= interval:
+            state['checked_at'] = now
+            try:
+                state['cancelled'] = is_cancelled(job_id)
+            except redis.RedisError as e:
+                print(f"[CANCEL WARNING] Cancel check failed for {job_id}: {e}", flush=True)
+        return state['cancelled']
+
+    return check
+
+
+__all__ = ['JobCancelled', 'request_cancel', 'is_cancelled', 'raise_if_cancelled', 'cancel_checker']
@@ -7,15 +7,243 @@ This module contains the main Celery task for classification:
 - Tasks survive browser close/logout
 - Progress tracked in Redis
 - Multiple concurrent classifications supported
+
+Multi-variable jobs run as a chord (spread across all workers):
+- prepare_dataset: creates the job record, profiles + caches raw data per column
+- classify_variable: one task per variable (classification queue)
+- merge_dataset: writes both workbooks once and updates ClassificationJob
+- chord_failed: error callback of the chord (also used by semi-open jobs) -
+  a header task that raises (time limit, worker lost, ...) means the merge
+  never runs, so the job is failed and its slot + partials freed here
+classify_dataset (single task) is kept for single-variable jobs.
+
+Files go through storage.py (local disk or S3-compatible bucket): inputs are
+fetched into a node-local cache, outputs and per-variable partials are
+written locally and published, so chord steps may run on different nodes.
 """
 
+from celery import chord
 from celery_app import celery_app
 from tasks.progress import progress_tracker
+from tasks.scheduler import job_finished
+from tasks.cancellation import JobCancelled, is_cancelled, raise_if_cancelled, cancel_checker
+from storage import get_storage
 import os
 import json
 from datetime import datetime
 import time
 
+OUTPUT_PREFIX = 'output'
+
+
+def _build_output_paths():
+    """
+    Timestamped output files for storage keys output/output_{kobo,raw}_<ts>.xlsx
+    
+    Returns:
+        tuple: (output_dir, output_kobo, output_raw) - local paths, publish with _publish_outputs()
+    """
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    storage = get_storage()
+    output_kobo = storage.local_path(f'{OUTPUT_PREFIX}/output_kobo_{timestamp}.xlsx')
+    output_raw = storage.local_path(f'{OUTPUT_PREFIX}/output_raw_{timestamp}.xlsx')
+    return os.path.dirname(output_raw), output_kobo, output_raw
+
+
+def _partials_key(job_id, kind='partials'):
+    """Storage key prefix for the per-variable (or per-pair) partial results of a job"""
+    return f'{OUTPUT_PREFIX}/{kind}_{job_id}'
+
+
+def _publish_outputs(output_kobo, output_raw):
+    """Upload both written workbooks and their download bundle to storage"""
+    from app.downloads import build_bundle_quietly
+    
+    storage = get_storage()
+    for path in (output_kobo, output_raw):
+        if os.path.exists(path):
+            storage.publish(path)
+    build_bundle_quietly(output_kobo, output_raw)
+
+
+def _columnar_cache(raw_data_path, profile_for=None, cache_dir=None):
+    """
+    Node-local columnar cache of a raw data file (built once per node and file content)
+    
+    Args:
+        raw_data_path: Storage ref of the raw data file
+        profile_for: Column names to profile
+        cache_dir: Cache directory already known (e.g. from prepare_dataset); used when present on this node
+    
+    Returns:
+        tuple: (cache_dir, manifest or None)
+    """
+    from columnar_cache import ensure_columnar_cache, CACHE_ROOT, MANIFEST_FILE
+    from upload_store import content_hash
+    
+    if cache_dir and os.path.exists(os.path.join(cache_dir, MANIFEST_FILE)):
+        return cache_dir, None
+    return ensure_columnar_cache(get_storage().fetch(raw_data_path), CACHE_ROOT,
+                                 content_hash(raw_data_path), profile_for=profile_for)
+
+
+def _create_job_record(job_id, task_id, user_id, kobo_system_path, raw_data_path,
+                       output_kobo, output_raw, kobo_original_filename, raw_original_filename,
+                       settings, job_type='open_ended'):
+    """
+    Start the ClassificationJob row for a job (needs app context)
+    
+    The web app creates the 'queued' row before submitting the job to the
+    scheduler. A missing row means the job was deleted while it waited:
+    it must not run (and spend API tokens) for a record nobody owns.
+    
+    Raises:
+        JobCancelled: The job's row no longer exists
+    """
+    from app import db
+    from app.models import ClassificationJob
+    
+    classification_job = ClassificationJob.query.filter_by(job_id=job_id).first()
+    if classification_job is None:
+        raise JobCancelled(f'Job {job_id} was deleted')
+    
+    classification_job.task_id = task_id  # Store Celery task ID
+    classification_job.status = 'processing'
+    classification_job.original_kobo_filename = kobo_original_filename
+    classification_job.original_raw_filename = raw_original_filename
+    classification_job.input_kobo_path = kobo_system_path
+    classification_job.input_raw_path = raw_data_path
+    classification_job.output_kobo_filename = os.path.basename(output_kobo)
+    classification_job.output_raw_filename = os.path.basename(output_raw)
+    classification_job.output_kobo_path = get_storage().ref_for(output_kobo)
+    classification_job.output_raw_path = get_storage().ref_for(output_raw)
+    classification_job.settings = json.dumps(settings)
+    classification_job.started_at = datetime.utcnow()
+    db.session.commit()
+    print(f"[CELERY TASK] ClassificationJob started in database (ID: {classification_job.id})", flush=True)
+    return classification_job
+
+
+def _variable_record(job_db_id, var_name, question_text, summary, started_at=None):
+    """Build ClassificationVariable row from a process_variable summary"""
+    from app.models import ClassificationVariable
+    
+    return ClassificationVariable(
+        job_id=job_db_id,
+        variable_name=var_name,
+        question_text=question_text,
+        categories_generated=summary.get('categories_generated', 0),
+        total_responses=summary.get('total_responses', 0),
+        valid_classified=summary.get('valid_classified', 0),
+        invalid_count=summary.get('invalid_count', 0),
+        empty_count=summary.get('empty_count', 0),
+        categories=json.dumps(summary.get('category_summary', [])),
+        started_at=started_at or datetime.utcnow(),
+        completed_at=datetime.utcnow(),
+        status='error' if summary.get('status') == 'error' else 'completed',
+        error_message=summary.get('error')
+    )
+
+
+def _delete_input_files(*paths):
+    """Delete input files to save disk space (content-addressed uploads are shared and kept)"""
+    from upload_store import delete_input
+    try:
+        for path in paths:
+            if delete_input(path):
+                print(f"[CELERY TASK] Deleted input file: {os.path.basename(path)}", flush=True)
+        print(f"[CELERY TASK] Input files cleaned up (only output files + shared uploads remain)", flush=True)
+    except Exception as delete_error:
+        # Log error but don't fail the job
+        print(f"[CELERY TASK WARNING] Failed to delete input files: {str(delete_error)}", flush=True)
+
+
+def _mark_job_error(app, job_id, error_msg):
+    """Mark job as failed in database and Redis"""
+    from app import db
+    from app.models import ClassificationJob
+    
+    try:
+        if app is None:
+            from app import get_app
+            app = get_app()
+        with app.app_context():
+            job_to_update = ClassificationJob.query.filter_by(job_id=job_id).first()
+            if job_to_update:
+                job_to_update.status = 'error'
+                job_to_update.error_message = error_msg
+                job_to_update.completed_at = datetime.utcnow()
+                db.session.commit()
+                print(f"[CELERY TASK] Updated ClassificationJob status to error", flush=True)
+            else:
+                print(f"[CELERY TASK ERROR] Job {job_id} not found for error update!", flush=True)
+    except Exception as db_error:
+        print(f"[CELERY TASK] Failed to update database: {db_error}", flush=True)
+    
+    progress_tracker.update_progress(
+        job_id,
+        status='error',
+        error_message=error_msg,
+        completed_at=datetime.utcnow().isoformat()
+    )
+    
+    # Free scheduler slot
+    job_finished(job_id)
+
+
+def _mark_job_cancelled(app, job_id):
+    """Mark job as cancelled in database and Redis, free its scheduler slot"""
+    from app import db
+    from app.models import ClassificationJob
+    
+    print(f"[CELERY TASK] Job {job_id} cancelled - stopping", flush=True)
+    try:
+        if app is None:
+            from app import get_app
+            app = get_app()
+        with app.app_context():
+            job_to_update = ClassificationJob.query.filter_by(job_id=job_id).first()
+            if job_to_update and job_to_update.status != 'cancelled':
+                job_to_update.status = 'cancelled'
+                job_to_update.error_message = 'Cancelled by user'
+                job_to_update.completed_at = datetime.utcnow()
+                db.session.commit()
+    except Exception as db_error:
+        print(f"[CELERY TASK] Failed to update database: {db_error}", flush=True)
+    
+    progress_tracker.update_progress(
+        job_id,
+        status='cancelled',
+        current_step='Cancelled',
+        error='Job cancelled by user',
+        completed_at=datetime.utcnow().isoformat()
+    )
+    
+    # Free scheduler slot
+    job_finished(job_id)
+
+
+@celery_app.task(name='tasks.classification.chord_failed')
+def chord_failed(request, exc, traceback, job_id, partials_key):
+    """
+    Chord error callback: mark the job failed, free its scheduler slot, drop its partials
+    
+    Attached with callback.on_error(chord_failed.s(job_id, partials_key));
+    Celery calls it with the failed request, the exception and the traceback.
+    """
+    print(f"[CELERY TASK ERROR] Chord of job {job_id} failed: {exc!r}", flush=True)
+    
+    # The merge may already have recorded its own failure
+    if progress_tracker.get_status(job_id) in ('completed', 'error', 'failed', 'cancelled'):
+        job_finished(job_id)
+    else:
+        _mark_job_error(None, job_id, f'Processing failed: {exc}')
+    
+    try:
+        get_storage().delete_prefix(partials_key)
+    except Exception as e:
+        print(f"[CELERY TASK WARNING] Failed to delete partials of job {job_id}: {e}", flush=True)
+
 
 @celery_app.task(bind=True, name='tasks.classification.classify_dataset')
 def classify_dataset(self, job_id, kobo_system_path, raw_data_path, variables_to_process,
@@ -45,8 +273,10 @@ def classify_dataset(self, job_id, kobo_system_path, raw_data_path, variables_to
     import traceback
     
     # Import Flask app and models
-    from app import create_app, db
-    from app.models import ClassificationJob, ClassificationVariable
+    from app import get_app, db
+    from app.models import ClassificationJob
+    from app.dashboard_stats import record_job_completion
+    from app.response_store import store_responses
     from excel_classifier import ExcelClassifier
     
     print(f"\n{'='*80}")
@@ -56,6 +286,12 @@ def classify_dataset(self, job_id, kobo_system_path, raw_data_path, variables_to
     print(f"[CELERY TASK] Variables to process: {len(variables_to_process)}")
     print(f"{'='*80}\n", flush=True)
     
+    # Cancelled while queued (revoke is best-effort)
+    if is_cancelled(job_id):
+        _mark_job_cancelled(None, job_id)
+        return {'job_id': job_id, 'status': 'cancelled'}
+    
+    app = None
     try:
         # Initialize progress in Redis
         progress_tracker.set_progress(job_id, {
@@ -72,47 +308,23 @@ def classify_dataset(self, job_id, kobo_system_path, raw_data_path, variables_to
         time.sleep(0.5)
         
         # Create Flask app context for database operations
-        app = create_app()
+        app = get_app()
         with app.app_context():
             # Generate output filenames with timestamp in files/output/ directory
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            
-            # Get base directory (files/) and create output directory
-            files_dir = os.path.dirname(os.path.dirname(raw_data_path))  # Go up from uploads/ to files/
-            output_dir = os.path.join(files_dir, 'output')
-            os.makedirs(output_dir, exist_ok=True)  # Create if not exists
-            
-            output_kobo = os.path.join(output_dir, f'output_kobo_{timestamp}.xlsx')
-            output_raw = os.path.join(output_dir, f'output_raw_{timestamp}.xlsx')
-            
+            output_dir, output_kobo, output_raw = _build_output_paths()
             print(f"[CELERY TASK] Output directory: {output_dir}", flush=True)
             
             # Create job record in database
-            classification_job = ClassificationJob(
-                job_id=job_id,
-                task_id=self.request.id,  # Store Celery task ID
-                user_id=user_id,
-                job_type='open_ended',
-                status='processing',
-                original_kobo_filename=kobo_original_filename,
-                original_raw_filename=raw_original_filename,
-                input_kobo_path=kobo_system_path,
-                input_raw_path=raw_data_path,
-                output_kobo_filename=os.path.basename(output_kobo),
-                output_raw_filename=os.path.basename(output_raw),
-                output_kobo_path=output_kobo,
-                output_raw_path=output_raw,
-                settings=json.dumps({
+            _create_job_record(
+                job_id, self.request.id, user_id, kobo_system_path, raw_data_path,
+                output_kobo, output_raw, kobo_original_filename, raw_original_filename,
+                settings={
                     'max_categories': max_categories,
                     'confidence_threshold': confidence_threshold,
                     'auto_upload': auto_upload,
                     'classification_mode': classification_mode
-                }),
-                started_at=datetime.utcnow()
+                }
             )
-            db.session.add(classification_job)
-            db.session.commit()
-            print(f"[CELERY TASK] ClassificationJob created in database (ID: {classification_job.id})", flush=True)
         
         # Initialize classifier
         print(f"[CELERY TASK] Initializing ExcelClassifier...", flush=True)
@@ -123,6 +335,12 @@ def classify_dataset(self, job_id, kobo_system_path, raw_data_path, variables_to
         
         # Set output paths (preserve originals)
         classifier.set_output_paths(output_kobo, output_raw)
+        
+        # Patch kobo_system in memory per variable, write once at the end of the job
+        classifier.defer_kobo_save = True
+        
+        # Stop between batches when the job gets cancelled
+        classifier.set_cancel_check(cancel_checker(job_id))
         print(f"[CELERY TASK] Output paths configured:", flush=True)
         print(f"[CELERY TASK]   Kobo: {output_kobo}", flush=True)
         print(f"[CELERY TASK]   Raw: {output_raw}", flush=True)
@@ -131,6 +349,7 @@ def classify_dataset(self, job_id, kobo_system_path, raw_data_path, variables_to
         
         # Process each variable
         all_summaries = []
+        response_rows = []
         start_time = datetime.now()
         total_vars = len(variables_to_process)
         
@@ -138,6 +357,7 @@ def classify_dataset(self, job_id, kobo_system_path, raw_data_path, variables_to
             var_name = var_info['name']
             question_text = var_info['question']
             
+            raise_if_cancelled(job_id)
             print(f"[CELERY TASK] Processing variable {idx}/{total_vars}: {var_name}", flush=True)
             
             # Update progress in Redis - starting variable
@@ -197,6 +417,7 @@ def classify_dataset(self, job_id, kobo_system_path, raw_data_path, variables_to
             print(f"[CELERY TASK] Calling classifier.process_variable for {var_name}...", flush=True)
             print(f"[CELERY TASK] Classification mode: {classification_mode}", flush=True)
             
+            var_started_at = datetime.utcnow()
             try:
                 summary = classifier.process_variable(
                     var_name,
@@ -218,20 +439,8 @@ def classify_dataset(self, job_id, kobo_system_path, raw_data_path, variables_to
                     print(f"[CELERY TASK ERROR] Job {job_id} not found!", flush=True)
                     continue
                 
-                classification_var = ClassificationVariable(
-                    job_id=job_to_update.id,
-                    variable_name=var_name,
-                    question_text=question_text,
-                    categories_generated=summary.get('categories_generated', 0),
-                    total_responses=summary.get('total_responses', 0),
-                    valid_classified=summary.get('valid_classified', 0),
-                    invalid_count=summary.get('invalid_count', 0),
-                    empty_count=summary.get('empty_count', 0),
-                    categories=json.dumps(summary.get('category_summary', [])),
-                    started_at=datetime.utcnow(),
-                    completed_at=datetime.utcnow(),
-                    status='completed'
-                )
+                classification_var = _variable_record(job_to_update.id, var_name, question_text, summary,
+                                                     started_at=var_started_at)
                 db.session.add(classification_var)
                 
                 # Update job progress in database
@@ -252,8 +461,14 @@ def classify_dataset(self, job_id, kobo_system_path, raw_data_path, variables_to
             })
             
             all_summaries.append(summary)
+            if summary.get('status') != 'skipped':
+                response_rows.extend(classifier.get_response_rows(var_name))
             print(f"[CELERY TASK] Progress: {idx}/{total_vars} variables completed", flush=True)
         
+        # Single kobo_system write for the whole job
+        classifier.save_kobo_file()
+        _publish_outputs(output_kobo, output_raw)
+        
         end_time = datetime.now()
         duration = (end_time - start_time).total_seconds()
         
@@ -284,25 +499,16 @@ def classify_dataset(self, job_id, kobo_system_path, raw_data_path, variables_to
                 job_to_update.completed_at = datetime.utcnow()
                 job_to_update.progress = 100
                 job_to_update.results_summary = json.dumps(results)
+                job_to_update.update_totals()
+                record_job_completion(job_to_update)
+                store_responses(job_to_update.id, response_rows)
                 db.session.commit()
                 print(f"[CELERY TASK] Updated ClassificationJob status to completed", flush=True)
             else:
                 print(f"[CELERY TASK ERROR] Job {job_id} not found for completion update!", flush=True)
         
         # Delete input files to save disk space (keep only output files)
-        try:
-            if os.path.exists(kobo_system_path):
-                os.remove(kobo_system_path)
-                print(f"[CELERY TASK] Deleted input file: {os.path.basename(kobo_system_path)}", flush=True)
-            
-            if os.path.exists(raw_data_path):
-                os.remove(raw_data_path)
-                print(f"[CELERY TASK] Deleted input file: {os.path.basename(raw_data_path)}", flush=True)
-            
-            print(f"[CELERY TASK] Input files deleted successfully (only output files remain)", flush=True)
-        except Exception as delete_error:
-            # Log error but don't fail the job
-            print(f"[CELERY TASK WARNING] Failed to delete input files: {str(delete_error)}", flush=True)
+        _delete_input_files(kobo_system_path, raw_data_path)
         
         # Mark job as complete in Redis
         progress_tracker.update_progress(
@@ -316,39 +522,389 @@ def classify_dataset(self, job_id, kobo_system_path, raw_data_path, variables_to
         
         print(f"[CELERY TASK] Classification job {job_id} completed successfully", flush=True)
         
-        return results
+        # Free scheduler slot
+        job_finished(job_id)
+        
+        # Full summary lives in ClassificationJob.results_summary; keep the Celery result small
+        return {'job_id': job_id, 'status': 'completed', 'variables': len(all_summaries)}
+        
+    except JobCancelled:
+        _mark_job_cancelled(app, job_id)
+        return {'job_id': job_id, 'status': 'cancelled'}
         
     except Exception as e:
         error_msg = str(e)
         print(f"[CELERY TASK ERROR] Classification failed: {error_msg}", flush=True)
         traceback.print_exc()
         
-        # Update job as failed in database
-        try:
-            with app.app_context():
-                # Query job again in this context
-                job_to_update = ClassificationJob.query.filter_by(job_id=job_id).first()
-                if job_to_update:
-                    job_to_update.status = 'error'
-                    job_to_update.error_message = error_msg
-                    job_to_update.completed_at = datetime.utcnow()
-                    db.session.commit()
-                    print(f"[CELERY TASK] Updated ClassificationJob status to error", flush=True)
-                else:
-                    print(f"[CELERY TASK ERROR] Job {job_id} not found for error update!", flush=True)
-        except Exception as db_error:
-            print(f"[CELERY TASK] Failed to update database: {db_error}", flush=True)
-        
-        # Update progress in Redis
+        # Update job as failed in database + Redis
+        _mark_job_error(app, job_id, error_msg)
+        
+        # Propagate exception to Celery
+        raise
+
+
+@celery_app.task(bind=True, name='tasks.classification.prepare_dataset')
+def prepare_dataset(self, job_id, kobo_system_path, raw_data_path, variables_to_process,
+                    max_categories, confidence_threshold, auto_upload, classification_mode,
+                    user_id, kobo_original_filename, raw_original_filename):
+    """
+    Chord step 1: create job record, build columnar cache, fan out per-variable tasks
+    
+    Same arguments as classify_dataset. Raw data Excel is parsed ONCE here;
+    every classify_variable task loads only its own columns from the cache.
+    
+    Returns:
+        dict: job_id and chord id
+    """
+    import traceback
+    from app import get_app
+    
+    total_vars = len(variables_to_process)
+    
+    print(f"\n{'='*80}")
+    print(f"[CELERY PREPARE] Preparing job {job_id} ({total_vars} variables)")
+    print(f"[CELERY PREPARE] Task ID: {self.request.id}")
+    print(f"{'='*80}\n", flush=True)
+    
+    if is_cancelled(job_id):
+        _mark_job_cancelled(None, job_id)
+        return {'job_id': job_id, 'status': 'cancelled'}
+    
+    app = None
+    try:
+        progress_tracker.set_progress(job_id, {
+            'status': 'processing',
+            'progress': 0,
+            'current_step': 'Preparing data...',
+            'started_at': datetime.utcnow().isoformat(),
+            'task_id': self.request.id,
+            'variables': {
+                var_info['name']: {
+                    'status': 'pending',
+                    'progress': 0,
+                    'step': 'Queued',
+                    'index': idx,
+                    'total': total_vars,
+                    'question': var_info['question']
+                }
+                for idx, var_info in enumerate(variables_to_process, 1)
+            },
+            'total_variables': total_vars,
+            'completed_variables': 0
+        })
+        
+        app = get_app()
+        output_dir, output_kobo, output_raw = _build_output_paths()
+        with app.app_context():
+            _create_job_record(
+                job_id, self.request.id, user_id, kobo_system_path, raw_data_path,
+                output_kobo, output_raw, kobo_original_filename, raw_original_filename,
+                settings={
+                    'max_categories': max_categories,
+                    'confidence_threshold': confidence_threshold,
+                    'auto_upload': auto_upload,
+                    'classification_mode': classification_mode
+                }
+            )
+        
+        # Parse raw data once per file content, store per column (shared across jobs)
+        partials_key = _partials_key(job_id)
+        cache_dir, manifest = _columnar_cache(
+            raw_data_path,
+            profile_for=[var_info['name'] for var_info in variables_to_process]
+        )
+        profile = manifest['profile']
+        print(f"[CELERY PREPARE] Cached {len(manifest['columns'])} columns x {manifest['rows']} rows", flush=True)
+        
+        # Cancelled while parsing raw data: don't fan out
+        if is_cancelled(job_id):
+            _mark_job_cancelled(app, job_id)
+            return {'job_id': job_id, 'status': 'cancelled'}
+        
         progress_tracker.update_progress(
             job_id,
-            status='error',
-            error_message=error_msg,
-            completed_at=datetime.utcnow().isoformat()
+            progress=2,
+            current_step=f'Classifying {total_vars} variables in parallel...',
+            profile=profile
         )
         
-        # Propagate exception to Celery
+        # Largest variables first so they don't end up as the long tail
+        dispatch_order = sorted(
+            enumerate(variables_to_process, 1),
+            key=lambda item: profile.get(item[1]['name'], {}).get('non_empty', 0),
+            reverse=True
+        )
+        # Subtasks stay on the lane the scheduler picked for this job
+        queue = (self.request.delivery_info or {}).get('routing_key') or 'classification'
+        header = [
+            classify_variable.s(job_id, kobo_system_path, raw_data_path, cache_dir, partials_key,
+                                var_info, idx, total_vars, classification_mode).set(queue=queue)
+            for idx, var_info in dispatch_order
+        ]
+        callback = merge_dataset.s(
+            job_id, kobo_system_path, raw_data_path, cache_dir, partials_key,
+            output_kobo, output_raw, variables_to_process,
+            {
+                'max_categories': max_categories,
+                'confidence_threshold': confidence_threshold,
+                'auto_upload': auto_upload
+            }
+        ).set(queue=queue)
+        callback.on_error(chord_failed.s(job_id, partials_key))
+        result = chord(header)(callback)
+        
+        print(f"[CELERY PREPARE] Dispatched {total_vars} variable tasks (chord: {result.id})", flush=True)
+        
+        return {'job_id': job_id, 'chord_id': result.id}
+        
+    except JobCancelled:
+        _mark_job_cancelled(app, job_id)
+        return {'job_id': job_id, 'status': 'cancelled'}
+        
+    except Exception as e:
+        error_msg = str(e)
+        print(f"[CELERY PREPARE ERROR] Preparing job failed: {error_msg}", flush=True)
+        traceback.print_exc()
+        _mark_job_error(app, job_id, error_msg)
+        raise
+
+
+@celery_app.task(bind=True, name='tasks.classification.classify_variable')
+def classify_variable(self, job_id, kobo_system_path, raw_data_path, cache_dir, partials_key,
+                      var_info, idx, total_vars, classification_mode):
+    """
+    Chord step 2: classify ONE variable (no Excel writes)
+    
+    Coded values, kobo choices and the summary are pickled and published to
+    storage under partials_key. cache_dir is the columnar cache built by
+    prepare_dataset; a node without it builds its own copy.
+    Errors are returned (not raised) so the other variables still get merged.
+    
+    Returns:
+        dict: {'variable', 'status', 'partial_path' (storage ref) | 'error'}
+    """
+    import traceback
+    import pandas as pd
+    from excel_classifier import ExcelClassifier
+    from columnar_cache import load_columns
+    
+    var_name = var_info['name']
+    question_text = var_info['question']
+    started_at = datetime.utcnow()
+    
+    def set_variable_progress(status, percentage, step, **extra):
+        data = {
+            'status': status,
+            'progress': percentage,
+            'step': step,
+            'index': idx,
+            'total': total_vars,
+            'question': question_text
+        }
+        data.update(extra)
+        progress_tracker.set_variable_progress(job_id, var_name, data)
+        progress_tracker.refresh_overall_progress(job_id, total_vars, f'[{var_name}] {step}')
+    
+    print(f"[CELERY VARIABLE] Processing variable {idx}/{total_vars}: {var_name}", flush=True)
+    
+    if is_cancelled(job_id):
+        return {'variable': var_name, 'status': 'cancelled'}
+    
+    try:
+        set_variable_progress('processing', 0, 'Starting...')
+        
+        cache_dir, _ = _columnar_cache(raw_data_path, cache_dir=cache_dir)
+        classifier = ExcelClassifier(kobo_system_path, raw_data_path)
+        classifier.raw_df = load_columns(cache_dir, [var_name, f"{var_name}_coded"])
+        classifier.write_files = False
+        classifier.set_cancel_check(cancel_checker(job_id))
+        
+        def update_classifier_progress(message, percentage):
+            """Callback function to update progress from classifier"""
+            print(f"[CALLBACK] {var_name}: {message} ({percentage}%)", flush=True)
+            if percentage is not None:
+                set_variable_progress('processing', percentage, message)
+        
+        summary = classifier.process_variable(
+            var_name,
+            question_text,
+            progress_callback=update_classifier_progress,
+            classification_mode=classification_mode
+        )
+        
+        output = None if summary.get('status') == 'skipped' else classifier.get_variable_output(var_name)
+        
+        storage = get_storage()
+        local_partial = storage.local_path(f'{partials_key}/variable_{idx:04d}.pkl')
+        pd.to_pickle({
+            'summary': summary,
+            'output': output,
+            'rows': classifier.get_response_rows(var_name) if output is not None else [],
+            'started_at': started_at
+        }, local_partial)
+        partial_path = storage.publish(local_partial)
+        
+        set_variable_progress(summary.get('status', 'completed'), 100, 'Completed')
+        print(f"[CELERY VARIABLE] Variable {var_name} processed successfully", flush=True)
+        
+        return {'variable': var_name, 'status': summary.get('status', 'completed'), 'partial_path': partial_path}
+        
+    except JobCancelled:
+        print(f"[CELERY VARIABLE] Variable {var_name} stopped: job cancelled", flush=True)
+        return {'variable': var_name, 'status': 'cancelled'}
+        
+    except Exception as e:
+        error_msg = str(e)
+        print(f"[CELERY VARIABLE ERROR] Failed to process variable {var_name}: {error_msg}", flush=True)
+        traceback.print_exc()
+        set_variable_progress('error', 100, f'Error: {error_msg}', error=error_msg)
+        return {'variable': var_name, 'status': 'error', 'error': error_msg}
+
+
+@celery_app.task(bind=True, name='tasks.classification.merge_dataset')
+def merge_dataset(self, variable_results, job_id, kobo_system_path, raw_data_path, cache_dir,
+                  partials_key, output_kobo, output_raw, variables_to_process, settings):
+    """
+    Chord step 3: write both workbooks ONCE and complete ClassificationJob
+    
+    Args:
+        variable_results: Results of classify_variable (chord header)
+        settings: Job settings shown on the result page
+    
+    Returns:
+        dict: Classification results (same shape as classify_dataset)
+    """
+    import traceback
+    import pandas as pd
+    from app import get_app, db
+    from app.models import ClassificationJob
+    from app.dashboard_stats import record_job_completion
+    from app.response_store import store_responses
+    from columnar_cache import load_columns
+    from excel_classifier import insert_coded_column, patch_kobo_variable
+    from kobo_form_patcher import KoboFormPatcher
+    
+    app = get_app()
+    results_by_var = {result['variable']: result for result in variable_results}
+    total_vars = len(variables_to_process)
+    
+    print(f"[CELERY MERGE] Merging {len(variable_results)} variable results for job {job_id}", flush=True)
+    
+    storage = get_storage()
+    if is_cancelled(job_id):
+        storage.delete_prefix(partials_key)
+        _mark_job_cancelled(app, job_id)
+        return {'job_id': job_id, 'status': 'cancelled'}
+    
+    try:
+        progress_tracker.update_progress(job_id, progress=95, current_step='Saving results to Excel files...')
+        
+        with app.app_context():
+            job = ClassificationJob.query.filter_by(job_id=job_id).first()
+            job_started_at = job.started_at if job and job.started_at else datetime.utcnow()
+        
+        cache_dir, _ = _columnar_cache(raw_data_path, cache_dir=cache_dir)
+        df_raw = load_columns(cache_dir)
+        patcher = KoboFormPatcher(storage.fetch(kobo_system_path))
+        
+        all_summaries = []
+        variable_rows = []
+        response_rows = []
+        failed = []
+        
+        # Original variable order (chord dispatch order may differ)
+        for var_info in variables_to_process:
+            var_name = var_info['name']
+            result = results_by_var.get(var_name, {'status': 'error', 'error': 'No result'})
+            
+            if result['status'] == 'error':
+                failed.append(f"{var_name}: {result.get('error')}")
+                variable_rows.append((var_info, {'status': 'error', 'error': result.get('error')}, None))
+                continue
+            
+            partial = pd.read_pickle(storage.fetch(result['partial_path']))
+            summary = partial['summary']
+            
+            if partial['output'] is not None:
+                print(f"\n   [MERGE] {var_name}", flush=True)
+                insert_coded_column(df_raw, var_name, partial['output']['codes'])
+                patch_kobo_variable(patcher, var_name, partial['output']['choices'])
+            
+            response_rows.extend(partial.get('rows', []))
+            all_summaries.append(summary)
+            variable_rows.append((var_info, summary, partial['started_at']))
+        
+        if not all_summaries:
+            raise RuntimeError('All variables failed: ' + '; '.join(failed))
+        
+        # Single write per output file
+        df_raw.to_excel(output_raw, index=False)
+        patcher.save(output_kobo)
+        patcher.close()
+        print(f"[CELERY MERGE] Saved {os.path.basename(output_raw)} and {os.path.basename(output_kobo)}", flush=True)
+        _publish_outputs(output_kobo, output_raw)
+        
+        end_time = datetime.utcnow()
+        results = {
+            'summaries': all_summaries,
+            'failed_variables': failed,
+            'start_time': job_started_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'end_time': end_time.strftime('%Y-%m-%d %H:%M:%S'),
+            'duration': (end_time - job_started_at).total_seconds(),
+            'total_variables': total_vars,
+            'settings': settings,
+            'output_files': {
+                'kobo': os.path.basename(output_kobo),
+                'raw': os.path.basename(output_raw)
+            }
+        }
+        
+        with app.app_context():
+            job_to_update = ClassificationJob.query.filter_by(job_id=job_id).first()
+            if job_to_update:
+                for var_info, summary, started_at in variable_rows:
+                    db.session.add(_variable_record(
+                        job_to_update.id, var_info['name'], var_info['question'], summary, started_at
+                    ))
+                job_to_update.status = 'completed'
+                job_to_update.completed_at = end_time
+                job_to_update.progress = 100
+                job_to_update.current_step = f"Completed {len(all_summaries)}/{total_vars} variables"
+                job_to_update.results_summary = json.dumps(results, default=str)
+                job_to_update.update_totals()
+                record_job_completion(job_to_update)
+                store_responses(job_to_update.id, response_rows)
+                db.session.commit()
+                print(f"[CELERY MERGE] Updated ClassificationJob status to completed", flush=True)
+            else:
+                print(f"[CELERY MERGE ERROR] Job {job_id} not found for completion update!", flush=True)
+        
+        # Remove intermediate files + inputs (columnar cache is shared per raw data hash)
+        storage.delete_prefix(partials_key)
+        _delete_input_files(kobo_system_path, raw_data_path)
+        
+        progress_tracker.update_progress(
+            job_id,
+            status='completed',
+            progress=100,
+            completed_variables=total_vars,
+            current_step='Classification completed',
+            completed_at=end_time.isoformat(),
+            results=results
+        )
+        
+        print(f"[CELERY MERGE] Classification job {job_id} completed successfully", flush=True)
+        job_finished(job_id)
+        
+        return {'job_id': job_id, 'status': 'completed', 'variables': len(all_summaries)}
+        
+    except Exception as e:
+        error_msg = str(e)
+        print(f"[CELERY MERGE ERROR] Merge failed: {error_msg}", flush=True)
+        traceback.print_exc()
+        _mark_job_error(app, job_id, error_msg)
         raise
 
 
-__all__ = ['classify_dataset']
+__all__ = ['classify_dataset', 'prepare_dataset', 'classify_variable', 'merge_dataset']
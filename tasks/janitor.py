@@ -0,0 +1,221 @@
+"""
+Janitor Celery Tasks
+M-Code Pro - Background File Cleanup
+
+Deleting files never happens inside a web request, and nothing under
+files/ (or the bucket) grows forever:
+- delete_files: removes the files of jobs deleted by the routes
+  (app/job_cleanup.py queue_file_cleanup)
+- sweep: periodic (Celery beat, JANITOR_INTERVAL seconds)
+  1. expired outputs: jobs past ClassificationJob.DOWNLOAD_HOURS, in batches
+     of JANITOR_BATCH_SIZE jobs (one SELECT + one storage batch + one UPDATE)
+  2. orphaned outputs: files in output/ that no job references anymore
+  3. orphaned uploads: content-addressed uploads unused for
+     UPLOAD_RETENTION_HOURS and not an input of a queued/running job
+  4. node-local caches (columnar cache, S3 read-through cache) unused for
+     CACHE_RETENTION_HOURS - only on the node that runs the sweep (web
+     hosts keep no copies, see storage.py)
+
+Metrics (Redis DB 2, shown by /api/admin/janitor):
+    janitor:last_sweep -> JSON {'started_at', 'duration_ms', <category>: {'files', 'bytes'}}
+    janitor:totals     -> hash '<category>:files' / '<category>:bytes' (cumulative)
+"""
+
+import os
+import json
+import time
+import shutil
+import redis
+from datetime import datetime
+from typing import Dict, Tuple
+from dotenv import load_dotenv
+
+from celery_app import celery_app
+from storage import get_storage
+
+load_dotenv()
+
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379')
+redis_client = redis.from_url(REDIS_URL + '/2', decode_responses=True)  # DB 2 (same as progress)
+
+LAST_SWEEP_KEY = 'janitor:last_sweep'
+TOTALS_KEY = 'janitor:totals'
+
+BATCH_SIZE = int(os.getenv('JANITOR_BATCH_SIZE', '200'))
+UPLOAD_RETENTION_HOURS = float(os.getenv('UPLOAD_RETENTION_HOURS', '48'))
+CACHE_RETENTION_HOURS = float(os.getenv('CACHE_RETENTION_HOURS', '72'))
+
+CATEGORIES = ('deleted_jobs', 'expired_outputs', 'orphaned_outputs', 'orphaned_uploads', 'local_cache')
+
+
+def _record(category: str, files: int, reclaimed: int):
+    """Add to the cumulative counters (metrics never fail a cleanup)"""
+    if not files:
+        return
+    try:
+        pipe = redis_client.pipeline()
+        pipe.hincrby(TOTALS_KEY, f'{category}:files', files)
+        pipe.hincrby(TOTALS_KEY, f'{category}:bytes', reclaimed)
+        pipe.execute()
+    except redis.RedisError as e:
+        print(f"[JANITOR WARNING] Metrics update failed: {e}", flush=True)
+
+
+def _tree_size(path: str) -> int:
+    total = 0
+    for directory, _, names in os.walk(path):
+        for name in names:
+            try:
+                total += os.path.getsize(os.path.join(directory, name))
+            except OSError:
+                pass
+    return total
+
+
+def _prune_columnar_cache(cutoff: float) -> Tuple[int, int]:
+    """Remove columnar caches (one directory per raw data hash) not used since cutoff"""
+    from columnar_cache import CACHE_ROOT
+
+    if not os.path.isdir(CACHE_ROOT):
+        return 0, 0
+    removed = reclaimed = 0
+    with os.scandir(CACHE_ROOT) as entries:
+        for entry in entries:
+            if entry.is_dir() and entry.stat().st_mtime < cutoff:
+                size = _tree_size(entry.path)
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+                reclaimed += size
+    return removed, reclaimed
+
+
+def _prune_read_through_cache(storage, cutoff: float) -> Tuple[int, int]:
+    """Remove files of the S3 read-through cache not fetched since cutoff (local backend has none)"""
+    if storage.name == 'local' or not os.path.isdir(storage.root):
+        return 0, 0
+    removed = reclaimed = 0
+    for directory, _, names in os.walk(storage.root):
+        for name in names:
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+                if stat.st_mtime < cutoff:
+                    os.remove(path)
+                    removed += 1
+                    reclaimed += stat.st_size
+            except OSError:
+                continue
+    return removed, reclaimed
+
+
+@celery_app.task(name='tasks.janitor.delete_files', autoretry_for=(Exception,), max_retries=3)
+def delete_files(refs):
+    """
+    Delete files of deleted jobs (shared content-addressed uploads are kept)
+
+    Args:
+        refs: Storage refs
+
+    Returns:
+        dict: {'files', 'bytes'}
+    """
+    from upload_store import is_content_addressed
+
+    removed, reclaimed = get_storage().delete_many(
+        [ref for ref in refs if ref and not is_content_addressed(ref)]
+    )
+    _record('deleted_jobs', removed, reclaimed)
+    print(f"[JANITOR] Deleted {removed} files of deleted jobs ({reclaimed / (1024 * 1024):.1f} MB)", flush=True)
+    return {'files': removed, 'bytes': reclaimed}
+
+
+@celery_app.task(name='tasks.janitor.sweep')
+def sweep():
+    """
+    Periodic cleanup of expired outputs, orphans and node-local caches
+
+    Returns:
+        dict: {<category>: {'files', 'bytes'}, 'duration_ms'}
+    """
+    from app import get_app, db
+    from app.job_cleanup import expired_output_batch, clear_outputs, output_files, referenced_files
+    from app.models import ClassificationJob
+    from upload_store import prune_uploads
+
+    started = time.perf_counter()
+    started_at = datetime.utcnow()
+    storage = get_storage()
+    stats: Dict[str, Dict[str, int]] = {category: {'files': 0, 'bytes': 0} for category in CATEGORIES}
+
+    def add(category, result):
+        stats[category]['files'] += result[0]
+        stats[category]['bytes'] += result[1]
+        _record(category, *result)
+
+    app = get_app()
+    with app.app_context():
+        # 1. Outputs past the download window, batch by batch
+        while True:
+            rows = expired_output_batch(BATCH_SIZE)
+            if not rows:
+                break
+            refs = [ref for row in rows for ref in output_files(row.output_kobo_path, row.output_raw_path)]
+            add('expired_outputs', storage.delete_many(refs))
+            clear_outputs([row.id for row in rows])
+            db.session.commit()
+            if len(rows) < BATCH_SIZE:
+                break
+
+        # 2 + 3. Files no job owns anymore
+        active_inputs, outputs = referenced_files()
+        db.session.remove()
+
+    now = time.time()
+    orphan_cutoff = now - ClassificationJob.DOWNLOAD_HOURS * 3600
+    orphans = [ref for ref, modified, _ in storage.iter_objects('output')
+               if modified < orphan_cutoff and ref not in outputs]
+    add('orphaned_outputs', storage.delete_many(orphans))
+    add('orphaned_uploads', prune_uploads(int(UPLOAD_RETENTION_HOURS * 3600), keep=active_inputs))
+
+    # 4. Caches on this node
+    cache_cutoff = now - CACHE_RETENTION_HOURS * 3600
+    add('local_cache', _prune_columnar_cache(cache_cutoff))
+    add('local_cache', _prune_read_through_cache(storage, cache_cutoff))
+
+    duration_ms = int((time.perf_counter() - started) * 1000)
+    try:
+        redis_client.set(LAST_SWEEP_KEY, json.dumps({
+            'started_at': started_at.isoformat(),
+            'duration_ms': duration_ms,
+            **stats
+        }))
+    except redis.RedisError as e:
+        print(f"[JANITOR WARNING] Metrics update failed: {e}", flush=True)
+
+    reclaimed = sum(category['bytes'] for category in stats.values())
+    print(f"[JANITOR] Sweep done in {duration_ms} ms: "
+          + ', '.join(f"{name} {values['files']}" for name, values in stats.items())
+          + f" ({reclaimed / (1024 * 1024):.1f} MB reclaimed)", flush=True)
+    return {**stats, 'duration_ms': duration_ms}
+
+
+def janitor_stats() -> Dict:
+    """
+    Last sweep + cumulative reclaimed space
+
+    Returns:
+        dict: {'last_sweep': dict | None, 'totals': {category: {'files', 'bytes'}}}
+    """
+    last_sweep = redis_client.get(LAST_SWEEP_KEY)
+    raw_totals = redis_client.hgetall(TOTALS_KEY)
+    totals = {
+        category: {
+            'files': int(raw_totals.get(f'{category}:files', 0)),
+            'bytes': int(raw_totals.get(f'{category}:bytes', 0))
+        }
+        for category in CATEGORIES
+    }
+    return {'last_sweep': json.loads(last_sweep) if last_sweep else None, 'totals': totals}
+
+
+__all__ = ['delete_files', 'sweep', 'janitor_stats']
@@ -4,19 +4,123 @@ M-Code Pro - Celery Background Task Processing
 
 Replaces in-memory progress tracker with Redis for multi-worker support.
 Progress survives worker restarts and is shared across all workers.
+
+Schema (Redis DB 2, all keys expire after 24h):
+- progress:<job_id>             hash, one field per top-level progress key
+                                (values JSON-encoded, '_' fields are internal)
+- progress:<job_id>:vars        set of variable names
+- progress:<job_id>:var:<name>  hash, one field per variable progress key
+- active-jobs[:user:<id>|:company:<id>]
+                                sorted sets of active job IDs (score = last
+                                update time), used by /api/active-jobs instead
+                                of scanning the keyspace
+
+Small field values are JSON; values of COMPRESS_MIN_BYTES or more (final
+results, long step lists) are stored with compact_codec (msgpack + zstd),
+so reads go through a binary client.
+
+Field updates are atomic (HSET / HINCRBY / small Lua scripts), so parallel
+batch callbacks no longer overwrite each other. Updates are coalesced per
+job in each process and written as one pipeline every
+PROGRESS_FLUSH_INTERVAL seconds; status changes are written immediately.
+
+Every flush is also published as a delta on the job's pub/sub channel
+(progress-events:<job_id>) so sse_app.py can push it to browsers:
+- snapshot: full progress data (set_progress)
+- update:   changed top-level fields (update_progress)
+- variable: {'name', 'data'} for one variable (set_variable_progress)
 """
 
 import redis
 import json
-from typing import Dict, Any, Optional
+import time
+import atexit
+import threading
+from typing import Dict, Any, Optional, Tuple, Union
 import os
 from dotenv import load_dotenv
 
+import compact_codec
+
 load_dotenv()
 
 # Redis connection
 REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379')
 redis_client = redis.from_url(REDIS_URL + '/2', decode_responses=True)  # DB 2 for progress
+raw_client = redis.from_url(REDIS_URL + '/2')  # same DB, bytes replies (compressed hash fields)
+
+FLUSH_INTERVAL = float(os.getenv('PROGRESS_FLUSH_INTERVAL', '0.25'))  # max ~4 writes/sec per job
+
+# Variable statuses that count towards completed_variables
+FINAL_VARIABLE_STATUSES = ('completed', 'skipped', 'error')
+
+# Job statuses that take a job out of the active-job indexes
+TERMINAL_STATUSES = ('completed', 'error', 'failed', 'cancelled')
+
+# Replace one variable hash and keep the job's running totals in sync.
+# KEYS: var hash, job hash, vars set
+# ARGV: name, ttl, progress, final ('1'/'0'), field, value, field, value, ...
+_SET_VARIABLE_LUA = """
+local old = tonumber(redis.call('HGET', KEYS[1], '_progress')) or 0
+local was_final = redis.call('HEXISTS', KEYS[1], '_final') == 1
+local new = tonumber(ARGV[3]) or 0
+local final = ARGV[4] == '1'
+redis.call('DEL', KEYS[1])
+for i = 5, #ARGV, 2 do
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+redis.call('HSET', KEYS[1], '_progress', ARGV[3])
+if final or was_final then
+    redis.call('HSET', KEYS[1], '_final', '1')
+end
+if new ~= old then
+    redis.call('HINCRBYFLOAT', KEYS[2], '_progress_sum', new - old)
+end
+if final and not was_final then
+    redis.call('HINCRBY', KEYS[2], '_completed', 1)
+end
+redis.call('SADD', KEYS[3], ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+redis.call('EXPIRE', KEYS[3], ARGV[2])
+return 1
+"""
+
+# Overall progress from the per-variable running totals (no per-variable reads).
+# KEYS: job hash
+# ARGV: total_variables, max_progress, current_step (JSON), ttl
+_REFRESH_LUA = """
+local sum = tonumber(redis.call('HGET', KEYS[1], '_progress_sum')) or 0
+local completed = tonumber(redis.call('HGET', KEYS[1], '_completed')) or 0
+local total = math.max(tonumber(ARGV[1]) or 1, 1)
+local max_progress = tonumber(ARGV[2])
+local progress = math.min(math.floor(sum / total * max_progress / 100), max_progress)
+redis.call('HSET', KEYS[1], 'progress', progress, 'completed_variables', completed, 'current_step', ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return {progress, completed}
+"""
+
+
+def _encode(value: Any) -> Union[str, bytes]:
+    """JSON for small values, compact_codec for large ones"""
+    encoded = json.dumps(value, default=str)
+    if len(encoded) >= compact_codec.COMPRESS_MIN_BYTES:
+        return compact_codec.pack(value)
+    return encoded
+
+
+def _decode_hash(data: Dict[bytes, bytes]) -> Dict[str, Any]:
+    """Decode a progress hash read with raw_client, skipping internal '_' fields"""
+    result = {}
+    for field, value in data.items():
+        field = field.decode() if isinstance(field, bytes) else field
+        if not field.startswith('_'):
+            result[field] = compact_codec.unpack(value)
+    return result
+
+
+def _is_final(status) -> bool:
+    return status in FINAL_VARIABLE_STATUSES
 
 
 class RedisProgressTracker:
@@ -24,30 +128,233 @@ class RedisProgressTracker:
     
     def __init__(self):
         self.redis = redis_client
+        self.raw = raw_client
         self.default_ttl = 86400  # 24 hours
+        self.flush_interval = FLUSH_INTERVAL
+        
+        # Per-process write buffer: job_id -> {'fields', 'variables', 'refresh', 'timer'}
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()        # guards _pending
+        self._write_lock = threading.Lock()  # keeps flushes of this process in order
+        self._owners: Dict[str, Tuple] = {}  # job_id -> (user_id, company_id), guarded by _write_lock
+        
+        self._set_variable_script = self.redis.register_script(_SET_VARIABLE_LUA)
+        self._refresh_script = self.redis.register_script(_REFRESH_LUA)
     
     def _key(self, job_id: str) -> str:
         """Generate Redis key for job"""
         return f"progress:{job_id}"
     
-    def set_progress(self, job_id: str, progress_data: Dict[str, Any], ttl: Optional[int] = None):
+    def _vars_key(self, job_id: str) -> str:
+        """Set of variable names of a job"""
+        return f"progress:{job_id}:vars"
+    
+    def _var_key(self, job_id: str, variable_name: str) -> str:
+        """Hash holding one variable's progress"""
+        return f"progress:{job_id}:var:{variable_name}"
+    
+    def _index_key(self, scope: Optional[str] = None, owner_id=None) -> str:
+        """Active-job sorted set (all jobs, or one user's / company's)"""
+        return f"active-jobs:{scope}:{owner_id}" if scope else "active-jobs"
+    
+    def _owner(self, job_id: str) -> Tuple:
+        """(user_id, company_id) of a job, cached per process (caller holds _write_lock)"""
+        if job_id not in self._owners:
+            if len(self._owners) > 10000:
+                self._owners.clear()  # entries of jobs that ended in another process
+            self._owners[job_id] = tuple(self.redis.hmget(self._key(job_id), '_user_id', '_company_id'))
+        return self._owners[job_id]
+    
+    def _index(self, pipe, job_id: str, status: Optional[str]):
+        """Queue active-index updates: bump the score, or drop the job once it ended"""
+        user_id, company_id = self._owner(job_id)
+        index_keys = [self._index_key()]
+        if user_id:
+            index_keys.append(self._index_key('user', user_id))
+        if company_id:
+            index_keys.append(self._index_key('company', company_id))
+        
+        if status in TERMINAL_STATUSES:
+            for index_key in index_keys:
+                pipe.zrem(index_key, job_id)
+            self._owners.pop(job_id, None)
+        else:
+            now = time.time()
+            for index_key in index_keys:
+                pipe.zadd(index_key, {job_id: now})
+                pipe.expire(index_key, self.default_ttl)
+    
+    def channel(self, job_id: str) -> str:
+        """Pub/sub channel carrying progress deltas for a job"""
+        return f"progress-events:{job_id}"
+    
+    def _publish(self, job_id: str, event: str, data: Any, client=None):
+        """Publish a progress delta (cheap when nobody is subscribed)"""
+        (client or self.redis).publish(self.channel(job_id), json.dumps({'event': event, 'data': data}, default=str))
+    
+    def subscribe(self, job_id: str):
+        """
+        Subscribe to a job's progress deltas
+        
+        Returns:
+            redis PubSub (caller must close it)
+        """
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel(job_id))
+        return pubsub
+    
+    # ------------------------------------------------------------------
+    # Write buffer (coalescing)
+    # ------------------------------------------------------------------
+    
+    def _buffer(self, job_id: str) -> Dict[str, Any]:
+        """Pending updates of a job (caller holds _lock)"""
+        if job_id not in self._pending:
+            self._pending[job_id] = {'fields': {}, 'variables': {}, 'refresh': None, 'timer': None}
+        return self._pending[job_id]
+    
+    def _schedule(self, job_id: str, buffer: Dict[str, Any]):
+        """Start the flush timer of a job (caller holds _lock)"""
+        if buffer['timer'] is None:
+            timer = threading.Timer(self.flush_interval, self.flush, args=(job_id,))
+            timer.daemon = True
+            buffer['timer'] = timer
+            timer.start()
+    
+    def flush(self, job_id: Optional[str] = None):
+        """
+        Write buffered updates to Redis now
+        
+        Args:
+            job_id: Only this job (default: all jobs buffered in this process)
+        """
+        with self._write_lock:
+            with self._lock:
+                if job_id is None:
+                    batches, self._pending = self._pending, {}
+                elif job_id in self._pending:
+                    batches = {job_id: self._pending.pop(job_id)}
+                else:
+                    batches = {}
+                for buffer in batches.values():
+                    if buffer['timer'] is not None:
+                        buffer['timer'].cancel()
+            
+            for pending_job_id, buffer in batches.items():
+                try:
+                    self._write(pending_job_id, buffer)
+                except redis.RedisError as e:
+                    print(f"[PROGRESS WARNING] Failed to write progress for {pending_job_id}: {e}", flush=True)
+    
+    def _write(self, job_id: str, buffer: Dict[str, Any]):
+        """Write one job's buffered updates in a single pipeline"""
+        ttl = self.default_ttl
+        key = self._key(job_id)
+        fields = buffer['fields']
+        variables = buffer['variables']
+        refresh = buffer['refresh']
+        
+        pipe = self.redis.pipeline(transaction=False)
+        
+        for variable_name, data in variables.items():
+            args = [variable_name, ttl, data.get('progress') or 0, '1' if _is_final(data.get('status')) else '0']
+            for field, value in data.items():
+                args.extend([field, _encode(value)])
+            self._set_variable_script(
+                keys=[self._var_key(job_id, variable_name), key, self._vars_key(job_id)],
+                args=args,
+                client=pipe
+            )
+        
+        if refresh is not None:
+            total_variables, current_step, max_progress = refresh
+            self._refresh_script(keys=[key], args=[total_variables, max_progress, _encode(current_step), ttl], client=pipe)
+        
+        # Explicit fields last: they win over a refresh in the same batch
+        if fields:
+            pipe.hset(key, mapping={field: _encode(value) for field, value in fields.items()})
+            pipe.expire(key, ttl)
+        
+        self._index(pipe, job_id, fields.get('status'))
+        
+        results = pipe.execute()
+        
+        update = dict(fields)
+        if refresh is not None:
+            progress, completed = results[len(variables)]
+            update.setdefault('progress', progress)
+            update.setdefault('completed_variables', completed)
+            update.setdefault('current_step', refresh[1])
+        
+        pipe = self.redis.pipeline(transaction=False)
+        for variable_name, data in variables.items():
+            self._publish(job_id, 'variable', {'name': variable_name, 'data': data}, client=pipe)
+        if update:
+            self._publish(job_id, 'update', update, client=pipe)
+        pipe.execute()
+    
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    
+    def set_progress(self, job_id: str, progress_data: Dict[str, Any], ttl: Optional[int] = None,
+                     user_id=None, company_id=None):
         """
-        Set progress data for a job
+        Set progress data for a job (replaces everything, written immediately)
         
         Args:
             job_id: Classification job ID
             progress_data: Dict with progress information
             ttl: Time-to-live in seconds (default: 24 hours)
+            user_id: Job owner for the active-job index (kept from earlier writes if omitted)
+            company_id: Owner's company for the active-job index
         """
-        key = self._key(job_id)
         ttl = ttl or self.default_ttl
+        key = self._key(job_id)
         
-        # Serialize and store
-        self.redis.setex(
-            key,
-            ttl,
-            json.dumps(progress_data, default=str)
-        )
+        with self._write_lock:
+            with self._lock:
+                buffer = self._pending.pop(job_id, None)
+                if buffer and buffer['timer'] is not None:
+                    buffer['timer'].cancel()
+            
+            if user_id is not None or company_id is not None:
+                self._owners[job_id] = (
+                    str(user_id) if user_id is not None else None,
+                    str(company_id) if company_id is not None else None
+                )
+            owner_user_id, owner_company_id = self._owner(job_id)
+            
+            old_variables = self.redis.smembers(self._vars_key(job_id))
+            variables = progress_data.get('variables') or {}
+            
+            mapping = {field: _encode(value) for field, value in progress_data.items() if field != 'variables'}
+            mapping['_progress_sum'] = sum((v.get('progress') or 0) for v in variables.values())
+            mapping['_completed'] = sum(1 for v in variables.values() if _is_final(v.get('status')))
+            if owner_user_id:
+                mapping['_user_id'] = owner_user_id
+            if owner_company_id:
+                mapping['_company_id'] = owner_company_id
+            
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.delete(key, self._vars_key(job_id), *[self._var_key(job_id, name) for name in old_variables])
+            pipe.hset(key, mapping=mapping)
+            pipe.expire(key, ttl)
+            
+            for variable_name, data in variables.items():
+                var_mapping = {field: _encode(value) for field, value in data.items()}
+                var_mapping['_progress'] = data.get('progress') or 0
+                if _is_final(data.get('status')):
+                    var_mapping['_final'] = '1'
+                pipe.hset(self._var_key(job_id, variable_name), mapping=var_mapping)
+                pipe.expire(self._var_key(job_id, variable_name), ttl)
+                pipe.sadd(self._vars_key(job_id), variable_name)
+            if variables:
+                pipe.expire(self._vars_key(job_id), ttl)
+            
+            self._index(pipe, job_id, progress_data.get('status'))
+            self._publish(job_id, 'snapshot', progress_data, client=pipe)
+            pipe.execute()
     
     def get_progress(self, job_id: str) -> Optional[Dict[str, Any]]:
         """
@@ -55,28 +362,86 @@ class RedisProgressTracker:
         
         Args:
             job_id: Classification job ID
-            
+        
         Returns:
             Progress data dict or None if not found
         """
+        if job_id in self._pending:
+            self.flush(job_id)
+        
         key = self._key(job_id)
-        data = self.redis.get(key)
+        try:
+            data = self.raw.hgetall(key)
+        except redis.ResponseError:
+            # Legacy JSON blob written before the hash schema (expires within 24h)
+            legacy = self.redis.get(key)
+            return json.loads(legacy) if legacy else None
+        
+        if not data:
+            return None
+        
+        progress = _decode_hash(data)
+        
+        variable_names = sorted(self.redis.smembers(self._vars_key(job_id)))
+        if variable_names:
+            pipe = self.raw.pipeline(transaction=False)
+            for variable_name in variable_names:
+                pipe.hgetall(self._var_key(job_id, variable_name))
+            progress['variables'] = {
+                variable_name: _decode_hash(var_data)
+                for variable_name, var_data in zip(variable_names, pipe.execute())
+                if var_data
+            }
         
-        if data:
-            return json.loads(data)
-        return None
+        return progress
+    
+    def get_status(self, job_id: str) -> Optional[str]:
+        """
+        Get only the status field of a job (single HGET)
+        
+        Returns:
+            Status string, or None if the job has no progress (or no status)
+        """
+        try:
+            value = self.redis.hget(self._key(job_id), 'status')
+        except redis.ResponseError:
+            return (self.get_progress(job_id) or {}).get('status')
+        return json.loads(value) if value is not None else None
+    
+    def get_owner(self, job_id: str) -> Optional[str]:
+        """
+        Get the user ID that owns a job's progress (single HGET)
+        
+        Returns:
+            User ID string, or None if the job has no progress (or no owner)
+        """
+        try:
+            return self.redis.hget(self._key(job_id), '_user_id')
+        except redis.ResponseError:
+            return None
     
     def update_progress(self, job_id: str, **updates):
         """
         Update specific fields in progress data
         
+        Coalesced with other updates of the job; a 'status' change is
+        written immediately.
+        
         Args:
             job_id: Classification job ID
             **updates: Key-value pairs to update
         """
-        current = self.get_progress(job_id) or {}
-        current.update(updates)
-        self.set_progress(job_id, current)
+        with self._lock:
+            buffer = self._buffer(job_id)
+            buffer['fields'].update(updates)
+            if 'progress' in updates:
+                buffer['refresh'] = None  # explicit progress wins over a pending refresh
+            immediate = 'status' in updates
+            if not immediate:
+                self._schedule(job_id, buffer)
+        
+        if immediate:
+            self.flush(job_id)
     
     def delete_progress(self, job_id: str):
         """
@@ -85,44 +450,119 @@ class RedisProgressTracker:
         Args:
             job_id: Classification job ID
         """
-        key = self._key(job_id)
-        self.redis.delete(key)
+        with self._lock:
+            buffer = self._pending.pop(job_id, None)
+            if buffer and buffer['timer'] is not None:
+                buffer['timer'].cancel()
+        
+        with self._write_lock:
+            variable_names = self.redis.smembers(self._vars_key(job_id))
+            pipe = self.redis.pipeline(transaction=False)
+            self._index(pipe, job_id, 'cancelled')  # any terminal status: drop from the indexes
+            pipe.delete(
+                self._key(job_id),
+                self._vars_key(job_id),
+                *[self._var_key(job_id, name) for name in variable_names]
+            )
+            pipe.execute()
     
-    def get_all_jobs(self) -> Dict[str, Dict[str, Any]]:
+    def get_active_jobs(self, user_id=None, company_id=None) -> Dict[str, Dict[str, Any]]:
         """
-        Get progress data for all jobs
+        Get progress data of active jobs (most recently updated first)
         
+        Reads the active-job index plus one HGETALL per job in a single
+        pipeline - no keyspace scan. Per-variable details are not included.
+        
+        Args:
+            user_id: Only this user's jobs
+            company_id: Only this company's jobs (ignored when user_id is given)
+            
         Returns:
             Dict mapping job_id to progress data
         """
-        pattern = self._key("*")
-        keys = self.redis.keys(pattern)
+        if user_id is not None:
+            index_key = self._index_key('user', user_id)
+        elif company_id is not None:
+            index_key = self._index_key('company', company_id)
+        else:
+            index_key = self._index_key()
+        
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zremrangebyscore(index_key, '-inf', time.time() - self.default_ttl)  # progress already expired
+        pipe.zrevrange(index_key, 0, -1)
+        job_ids = pipe.execute()[1]
+        if not job_ids:
+            return {}
+        
+        pipe = self.raw.pipeline(transaction=False)
+        for job_id in job_ids:
+            pipe.hgetall(self._key(job_id))
         
         result = {}
-        for key in keys:
-            job_id = key.split(":", 1)[1]  # Extract job_id from "progress:job_id"
-            data = self.redis.get(key)
+        missing = []
+        for job_id, data in zip(job_ids, pipe.execute()):
             if data:
-                result[job_id] = json.loads(data)
+                result[job_id] = _decode_hash(data)
+            else:
+                missing.append(job_id)
+        
+        if missing:
+            self.redis.zrem(index_key, *missing)  # progress deleted or expired
         
         return result
     
+    def get_all_jobs(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Get progress data for all active jobs
+        
+        Returns:
+            Dict mapping job_id to progress data
+        """
+        return self.get_active_jobs()
+    
     def set_variable_progress(self, job_id: str, variable_name: str, progress_data: Dict[str, Any]):
         """
         Set progress for a specific variable within a job
         
+        Coalesced with other updates of the job; a status other than
+        'processing'/'pending' (start, finish, error) is written immediately.
+        
         Args:
             job_id: Classification job ID
             variable_name: Variable being classified
             progress_data: Progress data for this variable
         """
-        job_progress = self.get_progress(job_id) or {}
+        with self._lock:
+            buffer = self._buffer(job_id)
+            buffer['variables'][variable_name] = dict(progress_data)
+            immediate = progress_data.get('status') not in ('processing', 'pending')
+            if not immediate:
+                self._schedule(job_id, buffer)
         
-        if 'variables' not in job_progress:
-            job_progress['variables'] = {}
+        if immediate:
+            self.flush(job_id)
+    
+    def refresh_overall_progress(self, job_id: str, total_variables: int, current_step: str,
+                                 max_progress: int = 95):
+        """
+        Recompute overall job progress from per-variable progress
+        
+        Used when variables run as parallel subtasks (no single loop index).
+        The remaining (100 - max_progress)% is reserved for the merge step.
+        Computed in Redis from running totals kept by set_variable_progress.
         
-        job_progress['variables'][variable_name] = progress_data
-        self.set_progress(job_id, job_progress)
+        Args:
+            job_id: Classification job ID
+            total_variables: Number of variables/pairs in the job
+            current_step: Step text to show
+            max_progress: Cap while variables are still running
+        """
+        with self._lock:
+            buffer = self._buffer(job_id)
+            for field in ('progress', 'completed_variables', 'current_step'):
+                buffer['fields'].pop(field, None)
+            buffer['refresh'] = (total_variables, current_step, max_progress)
+            self._schedule(job_id, buffer)
     
     def get_variable_progress(self, job_id: str, variable_name: str) -> Optional[Dict[str, Any]]:
         """
@@ -131,19 +571,23 @@ class RedisProgressTracker:
         Args:
             job_id: Classification job ID
             variable_name: Variable name
-            
+        
         Returns:
             Variable progress data or None
         """
-        job_progress = self.get_progress(job_id)
-        if job_progress and 'variables' in job_progress:
-            return job_progress['variables'].get(variable_name)
-        return None
+        if job_id in self._pending:
+            self.flush(job_id)
+        
+        data = self.raw.hgetall(self._var_key(job_id, variable_name))
+        return _decode_hash(data) if data else None
 
 
 # Global progress tracker instance
 progress_tracker = RedisProgressTracker()
 
+# Don't lose the last buffered updates when a worker process exits
+atexit.register(progress_tracker.flush)
+
 
 # Convenience functions for backward compatibility
 def set_progress(job_id: str, progress_data: Dict[str, Any]):
@@ -0,0 +1,449 @@
+"""
+Fair Job Scheduler
+M-Code Pro - Multi-Tenant Job Scheduling
+
+Jobs are no longer pushed straight onto the Celery queue (FIFO). The web app
+submits them here; the scheduler starts them when capacity is available:
+- Per-company and per-user concurrency caps (a user without a company is
+  a tenant of its own, see _tenant)
+- Weighted fair sharing between companies (served cost / weight, lowest first)
+- API token budget (estimated tokens of running jobs), shared by weight:
+  each company with waiting/running jobs may hold at most
+  budget * weight / sum(weights of those companies) in flight
+- Fast lane: small jobs go to the `classification_fast` queue with own slots
+- Queue position + expected start time for /api/active-jobs
+
+State lives in Redis DB 3 (shared by all web + worker processes).
+dispatch() runs on submit, when a job finishes, and every few seconds via
+Celery beat (tasks.scheduler.dispatch_pending) as a safety net. One process
+dispatches at a time (sched:lock, released only by its owner); a dispatch
+asked for while another process holds the lock is picked up by the holder
+before it exits (sched:dispatch_requested), and each job is claimed from
+the pending hash before its task is sent, so it never starts twice.
+"""
+
+import os
+import json
+import time
+import uuid
+import redis
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
+
+from celery_app import celery_app
+from tasks.progress import progress_tracker
+
+load_dotenv()
+
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379')
+redis_client = redis.from_url(REDIS_URL + '/3', decode_responses=True)  # DB 3 for scheduler
+
+REGULAR_QUEUE = 'classification'
+FAST_QUEUE = 'classification_fast'
+
+TERMINAL_STATUSES = ('completed', 'error', 'failed', 'cancelled')
+
+
+def _env_int(name, default):
+    return int(os.getenv(name, str(default)))
+
+
+def _env_float(name, default):
+    return float(os.getenv(name, str(default)))
+
+
+def _parse_weights(value: str) -> Dict[str, float]:
+    """'1:2,5:0.5' -> {'1': 2.0, '5': 0.5} (company_id -> weight)"""
+    weights = {}
+    for item in (value or '').split(','):
+        if ':' in item:
+            company_id, weight = item.split(':', 1)
+            try:
+                weights[company_id.strip()] = max(float(weight), 0.01)
+            except ValueError:
+                continue
+    return weights
+
+
+class FairScheduler:
+    """Redis-backed fair scheduler for classification jobs"""
+
+    PENDING_KEY = 'sched:pending'     # hash job_id -> spec (waiting)
+    RUNNING_KEY = 'sched:running'     # hash job_id -> spec (dispatched)
+    USAGE_KEY = 'sched:usage'         # hash tenant -> served cost / weight
+    LOCK_KEY = 'sched:lock'
+    REQUESTED_KEY = 'sched:dispatch_requested'
+    LOCK_SECONDS = 30
+
+    # Delete the lock only if this dispatcher still owns it
+    RELEASE_LOCK_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+    def __init__(self):
+        self.redis = redis_client
+        self._release_lock = self.redis.register_script(self.RELEASE_LOCK_SCRIPT)
+
+        # Capacity (regular lane = classification worker slots)
+        self.max_running = _env_int('SCHED_MAX_RUNNING', 4)
+        self.fast_slots = _env_int('SCHED_FAST_SLOTS', 2)
+        self.max_per_company = _env_int('SCHED_MAX_PER_COMPANY', 2)
+        self.max_per_user = _env_int('SCHED_MAX_PER_USER', 2)
+        self.token_budget = _env_int('SCHED_TOKEN_BUDGET', 2000000)
+
+        # Fast lane thresholds
+        self.fast_max_responses = _env_int('SCHED_FAST_MAX_RESPONSES', 2000)
+        self.fast_max_variables = _env_int('SCHED_FAST_MAX_VARIABLES', 3)
+
+        # Rough cost model (used when no estimate is given)
+        self.tokens_per_response = _env_float('SCHED_TOKENS_PER_RESPONSE', 60)
+        self.tokens_per_variable = _env_float('SCHED_TOKENS_PER_VARIABLE', 8000)
+        self.seconds_per_response = _env_float('SCHED_SECONDS_PER_RESPONSE', 0.05)
+        self.seconds_per_variable = _env_float('SCHED_SECONDS_PER_VARIABLE', 30)
+
+        self.company_weights = _parse_weights(os.getenv('SCHED_COMPANY_WEIGHTS', ''))
+
+    # ------------------------------------------------------------------
+    # Cost / lane
+    # ------------------------------------------------------------------
+    def estimate_cost(self, responses: int, variables: int) -> Dict:
+        """
+        Rough job cost from response and variable counts
+
+        Returns:
+            dict: {'responses', 'variables', 'tokens', 'seconds'}
+        """
+        return {
+            'responses': int(responses),
+            'variables': int(variables),
+            'tokens': int(responses * self.tokens_per_response + variables * self.tokens_per_variable),
+            'seconds': float(responses * self.seconds_per_response + variables * self.seconds_per_variable)
+        }
+
+    def lane_for(self, estimate: Dict) -> str:
+        """Fast lane for small jobs, regular lane otherwise"""
+        if estimate.get('responses', 0) <= self.fast_max_responses and \
+           estimate.get('variables', 0) <= self.fast_max_variables:
+            return 'fast'
+        return 'regular'
+
+    def _weight(self, tenant) -> float:
+        return self.company_weights.get(str(tenant), 1.0)
+
+    @staticmethod
+    def _tenant(spec: Dict) -> str:
+        """Fair-share unit of a job: its company, or its user when it has none"""
+        if spec.get('company_id') is not None:
+            return str(spec['company_id'])
+        return f"user:{spec['user_id']}"
+
+    # ------------------------------------------------------------------
+    # Submit / release
+    # ------------------------------------------------------------------
+    def submit(self, job_id: str, task_name: str, args: List, user_id: int, company_id: int,
+               estimate: Dict) -> Dict:
+        """
+        Queue a job and try to start it right away
+
+        Args:
+            job_id: Classification job UUID
+            task_name: Celery task name (e.g. 'tasks.classification.prepare_dataset')
+            args: Task args (JSON-serializable)
+            user_id: Submitting user
+            company_id: User's company (tenant)
+            estimate: Cost estimate ({'responses', 'variables', 'tokens', 'seconds'})
+
+        Returns:
+            dict: Queue status for this job
+        """
+        spec = {
+            'job_id': job_id,
+            'task_name': task_name,
+            'args': args,
+            'user_id': user_id,
+            'company_id': company_id,
+            'estimate': estimate,
+            'lane': self.lane_for(estimate),
+            'submitted_at': time.time()
+        }
+        self.redis.hset(self.PENDING_KEY, job_id, json.dumps(spec, default=str))
+        print(f"[SCHEDULER] Queued job {job_id} (company={company_id}, user={user_id}, "
+              f"lane={spec['lane']}, est={estimate.get('seconds', 0):.0f}s)", flush=True)
+
+        self.dispatch()
+        return self.queue_status(job_id)
+
+    def release(self, job_id: str, dispatch: bool = True):
+        """Forget a job (finished, failed or cancelled) and start waiting jobs"""
+        removed = self.redis.hdel(self.RUNNING_KEY, job_id) + self.redis.hdel(self.PENDING_KEY, job_id)
+        if removed:
+            print(f"[SCHEDULER] Released job {job_id}", flush=True)
+        if dispatch:
+            self.dispatch()
+
+    # ------------------------------------------------------------------
+    # Dispatch
+    # ------------------------------------------------------------------
+    def _load(self, key) -> Dict[str, Dict]:
+        return {job_id: json.loads(spec) for job_id, spec in self.redis.hgetall(key).items()}
+
+    def _reap(self, running: Dict[str, Dict]):
+        """Drop running entries whose job already ended (or was lost)"""
+        now = time.time()
+        stale_after = celery_app.conf.task_time_limit or 3900
+
+        for job_id, spec in list(running.items()):
+            status = progress_tracker.get_status(job_id)
+            started_at = spec.get('started_at', now)
+
+            if status in TERMINAL_STATUSES or \
+               (status is None and now - started_at > 600) or \
+               now - started_at > stale_after * 4:
+                self.redis.hdel(self.RUNNING_KEY, job_id)
+                running.pop(job_id)
+                print(f"[SCHEDULER] Reaped job {job_id} (status={status})", flush=True)
+
+    def _token_share(self, tenant: str, active_companies: set) -> float:
+        """Tenant's weighted share of the token budget among active tenants"""
+        total_weight = sum(self._weight(c) for c in active_companies | {tenant})
+        return self.token_budget * self._weight(tenant) / total_weight
+
+    def _eligible(self, spec: Dict, running: Dict[str, Dict], active_companies: set) -> bool:
+        """Check caps + token budget (global and the company's weighted share) for one waiting job"""
+        lane_running = [s for s in running.values() if s['lane'] == spec['lane']]
+        lane_slots = self.fast_slots if spec['lane'] == 'fast' else self.max_running
+        if len(lane_running) >= lane_slots:
+            return False
+
+        tenant = self._tenant(spec)
+        if sum(1 for s in running.values() if self._tenant(s) == tenant) >= self.max_per_company:
+            return False
+
+        if sum(1 for s in running.values() if s['user_id'] == spec['user_id']) >= self.max_per_user:
+            return False
+
+        tokens = spec['estimate'].get('tokens', 0)
+        tokens_in_flight = sum(s['estimate'].get('tokens', 0) for s in running.values())
+        if running and tokens_in_flight + tokens > self.token_budget:
+            return False
+
+        # A company never holds more than its share, so one tenant's large jobs
+        # can't starve the others (its first job may exceed it: it would never start)
+        company_in_flight = sum(s['estimate'].get('tokens', 0) for s in running.values()
+                                if self._tenant(s) == tenant)
+        if company_in_flight and \
+           company_in_flight + tokens > self._token_share(tenant, active_companies):
+            return False
+
+        return True
+
+    def _fair_order(self, pending: Dict[str, Dict], usage: Dict[str, float]) -> List[Dict]:
+        """Waiting jobs ordered by company share (usage / weight), then submit time"""
+        return sorted(
+            pending.values(),
+            key=lambda s: (usage.get(self._tenant(s), 0.0), s['submitted_at'])
+        )
+
+    def _start(self, spec: Dict, usage: Dict[str, float], active_companies: set) -> bool:
+        """
+        Claim a waiting job, send its Celery task and account the company's usage
+
+        Returns:
+            bool: False when the job was no longer waiting (released/cancelled meanwhile)
+        """
+        # The HDEL is the claim: only one dispatcher can remove the entry
+        if not self.redis.hdel(self.PENDING_KEY, spec['job_id']):
+            return False
+
+        queue = FAST_QUEUE if spec['lane'] == 'fast' else REGULAR_QUEUE
+        try:
+            task = celery_app.send_task(spec['task_name'], args=spec['args'], queue=queue)
+        except Exception:
+            self.redis.hset(self.PENDING_KEY, spec['job_id'], json.dumps(spec, default=str))  # retry next round
+            raise
+
+        spec['task_id'] = task.id
+        spec['started_at'] = time.time()
+        self.redis.hset(self.RUNNING_KEY, spec['job_id'], json.dumps(spec, default=str))
+
+        # Virtual time: an idle company re-enters at the current minimum share
+        company = self._tenant(spec)
+        floor = min((usage.get(c, 0.0) for c in active_companies if c != company), default=0.0)
+        served = max(usage.get(company, 0.0), floor) + spec['estimate'].get('seconds', 1.0) / self._weight(company)
+        usage[company] = served
+        self.redis.hset(self.USAGE_KEY, company, served)
+
+        progress_tracker.update_progress(
+            spec['job_id'],
+            status='pending',
+            current_step='Starting...',
+            task_id=task.id,
+            queue_position=None,
+            expected_start=None
+        )
+        print(f"[SCHEDULER] Started job {spec['job_id']} on '{queue}' (task {task.id})", flush=True)
+        return True
+
+    def dispatch(self) -> List[str]:
+        """
+        Start as many waiting jobs as capacity allows (fair order)
+
+        Only one dispatcher runs at a time (web processes + beat). When another
+        process holds the lock, the request is left in REQUESTED_KEY and the
+        holder runs one more round for it before exiting.
+
+        Returns:
+            list: Job IDs started by this call
+        """
+        token = uuid.uuid4().hex
+        self.redis.set(self.REQUESTED_KEY, '1', ex=self.LOCK_SECONDS * 2)
+
+        started = []
+        # Lock released before the flag is checked again: a request made meanwhile
+        # is seen either here or by the process that takes the lock next
+        while self.redis.get(self.REQUESTED_KEY):
+            if not self.redis.set(self.LOCK_KEY, token, nx=True, ex=self.LOCK_SECONDS):
+                break  # the holder picks the request up
+            try:
+                self.redis.delete(self.REQUESTED_KEY)
+                started.extend(self._dispatch_round())
+            finally:
+                self._release_lock(keys=[self.LOCK_KEY], args=[token])
+        return started
+
+    def _dispatch_round(self) -> List[str]:
+        """One dispatch pass (caller holds the lock)"""
+        started = []
+        try:
+            pending = self._load(self.PENDING_KEY)
+            running = self._load(self.RUNNING_KEY)
+            self._reap(running)
+
+            if not pending:
+                return started
+
+            usage = {k: float(v) for k, v in self.redis.hgetall(self.USAGE_KEY).items()}
+            active_companies = {self._tenant(s) for s in list(pending.values()) + list(running.values())}
+
+            progressed = True
+            while pending and progressed:
+                progressed = False
+                for spec in self._fair_order(pending, usage):
+                    if not self._eligible(spec, running, active_companies):
+                        continue
+                    pending.pop(spec['job_id'])
+                    if self._start(spec, usage, active_companies):
+                        running[spec['job_id']] = spec
+                        started.append(spec['job_id'])
+                    progressed = True
+                    break  # re-sort: usage changed
+
+            self._publish_queue_positions(pending, running, usage)
+        except Exception as e:
+            print(f"[SCHEDULER ERROR] Dispatch failed: {e}", flush=True)
+
+        return started
+
+    # ------------------------------------------------------------------
+    # Queue position / ETA
+    # ------------------------------------------------------------------
+    def _simulate(self, pending: Dict[str, Dict], running: Dict[str, Dict],
+                  usage: Dict[str, float]) -> Dict[str, Dict]:
+        """
+        Approximate start times: waiting jobs (fair order) take the earliest free
+        slot of their lane. Per-company/user caps are not simulated.
+        """
+        now = time.time()
+        free_at = {'regular': [], 'fast': []}
+        for spec in running.values():
+            remaining = spec['estimate'].get('seconds', 60) - (now - spec.get('started_at', now))
+            free_at[spec['lane']].append(now + max(remaining, 30))
+
+        for lane, slots in (('regular', self.max_running), ('fast', self.fast_slots)):
+            free_at[lane] = sorted(free_at[lane] + [now] * max(slots - len(free_at[lane]), 0))[:max(slots, 1)]
+
+        positions = {'regular': 0, 'fast': 0}
+        snapshot = {}
+        for spec in self._fair_order(pending, usage):
+            lane = spec['lane']
+            start = free_at[lane].pop(0)
+            free_at[lane].append(start + spec['estimate'].get('seconds', 60))
+            free_at[lane].sort()
+            positions[lane] += 1
+            snapshot[spec['job_id']] = {
+                'queue_position': positions[lane],
+                'lane': lane,
+                'wait_seconds': int(start - now),
+                'expected_start': (datetime.utcnow() + timedelta(seconds=start - now)).isoformat()
+            }
+        return snapshot
+
+    def _publish_queue_positions(self, pending, running, usage):
+        """Write queue position + ETA into each waiting job's progress"""
+        for job_id, info in self._simulate(pending, running, usage).items():
+            progress_tracker.update_progress(
+                job_id,
+                status='queued',
+                current_step=f"Queued (position {info['queue_position']}, {info['lane']} lane)",
+                **info
+            )
+
+    def queue_snapshot(self) -> Dict[str, Dict]:
+        """Queue position + ETA for all waiting jobs"""
+        pending = self._load(self.PENDING_KEY)
+        if not pending:
+            return {}
+        running = self._load(self.RUNNING_KEY)
+        usage = {k: float(v) for k, v in self.redis.hgetall(self.USAGE_KEY).items()}
+        return self._simulate(pending, running, usage)
+
+    def queue_status(self, job_id: str) -> Optional[Dict]:
+        """Queue info for one job (None when not waiting)"""
+        return self.queue_snapshot().get(job_id)
+
+    def estimate_wait(self, estimate: Dict, user_id: int, company_id: int) -> Dict:
+        """
+        Expected queue wait for a job that has not been submitted yet
+
+        The job is simulated as if submitted now, next to the jobs already waiting.
+
+        Returns:
+            dict: {'queue_position', 'lane', 'wait_seconds', 'expected_start'}
+        """
+        pending = self._load(self.PENDING_KEY)
+        running = self._load(self.RUNNING_KEY)
+        usage = {k: float(v) for k, v in self.redis.hgetall(self.USAGE_KEY).items()}
+
+        probe_id = '__estimate__'
+        pending[probe_id] = {
+            'job_id': probe_id,
+            'user_id': user_id,
+            'company_id': company_id,
+            'estimate': estimate,
+            'lane': self.lane_for(estimate),
+            'submitted_at': time.time()
+        }
+        return self._simulate(pending, running, usage)[probe_id]
+
+
+# Global scheduler instance
+scheduler = FairScheduler()
+
+
+def job_finished(job_id: str):
+    """Call when a job completes/fails: frees its slot and starts waiting jobs"""
+    try:
+        scheduler.release(job_id)
+    except Exception as e:
+        print(f"[SCHEDULER WARNING] Release failed for {job_id}: {e}", flush=True)
+
+
+@celery_app.task(name='tasks.scheduler.dispatch_pending', ignore_result=True)
+def dispatch_pending():
+    """Periodic safety net (Celery beat): reap finished jobs, start waiting ones"""
+    started = scheduler.dispatch()
+    if started:
+        print(f"[SCHEDULER] Beat dispatch started {len(started)} jobs", flush=True)
+    return len(started)
+
+
+__all__ = ['FairScheduler', 'scheduler', 'job_finished', 'dispatch_pending']
@@ -0,0 +1,440 @@
+"""
+Semi Open-Ended Celery Tasks
+M-Code Pro - Background Semi Open-Ended Processing
+
+Semi open-ended jobs run on Celery workers (not gunicorn threads):
+- process_semi_open_job: creates the job record, then fans out one subtask per pair
+- process_semi_open_pair: classifies one pair's "Lainnya" responses (runs in parallel)
+- merge_semi_open_results: chord callback, combines all pairs into ONE raw data
+  workbook and ONE patched kobo_system workbook
+- Progress tracked in Redis (tasks.progress), same as open-ended jobs
+- Inputs, partials and outputs go through storage.py (pairs may run on other nodes)
+"""
+
+from celery import chord
+from celery_app import celery_app
+from tasks.progress import progress_tracker
+from tasks.scheduler import job_finished
+from tasks.cancellation import JobCancelled, is_cancelled, cancel_checker
+from storage import get_storage
+import os
+import json
+from datetime import datetime
+
+
+@celery_app.task(bind=True, name='tasks.semi_open.process_semi_open_job')
+def process_semi_open_job(self, job_id, kobo_system_path, raw_data_path, pairs_to_process,
+                          max_categories, create_merged_column, user_id,
+                          kobo_original_filename, raw_original_filename):
+    """
+    Celery task to start a semi open-ended job
+
+    Args:
+        self: Celery task instance (bind=True)
+        job_id: Unique job identifier
+        kobo_system_path: Path to kobo system file
+        raw_data_path: Path to raw data file
+        pairs_to_process: List of pair dicts from SemiOpenDetector
+        max_categories: Maximum new categories per pair
+        create_merged_column: Whether to write {select_var}_merged columns
+        user_id: User ID who submitted the job
+        kobo_original_filename: Original kobo filename
+        raw_original_filename: Original raw filename
+
+    Returns:
+        dict: job_id and chord id
+    """
+    from app import get_app
+    from tasks.classification import (_build_output_paths, _partials_key, _create_job_record,
+                                      _mark_job_error, _mark_job_cancelled, chord_failed)
+
+    print(f"\n{'='*80}")
+    print(f"[SEMI_OPEN TASK] Semi open-ended job started")
+    print(f"[SEMI_OPEN TASK] Task ID: {self.request.id}")
+    print(f"[SEMI_OPEN TASK] Job ID: {job_id}")
+    print(f"[SEMI_OPEN TASK] Pairs to process: {len(pairs_to_process)}")
+    print(f"{'='*80}\n", flush=True)
+
+    # Cancelled while queued (revoke is best-effort)
+    if is_cancelled(job_id):
+        _mark_job_cancelled(None, job_id)
+        return {'job_id': job_id, 'status': 'cancelled'}
+
+    total_pairs = len(pairs_to_process)
+
+    progress_tracker.set_progress(job_id, {
+        'status': 'processing',
+        'progress': 0,
+        'current_step': f'Processing {total_pairs} pairs in parallel...',
+        'started_at': datetime.utcnow().isoformat(),
+        'task_id': self.request.id,
+        'processing_type': 'semi_open_ended',
+        'variables': {
+            pair['select_var']: {
+                'status': 'pending',
+                'progress': 0,
+                'step': 'Queued',
+                'index': idx,
+                'total': total_pairs,
+                'question': pair.get('select_label', '')
+            }
+            for idx, pair in enumerate(pairs_to_process, 1)
+        },
+        'total_variables': total_pairs,
+        'completed_variables': 0
+    })
+
+    app = None
+    try:
+        # Output files under storage key output/ (same layout as open-ended jobs)
+        output_dir, output_kobo, output_raw = _build_output_paths()
+        partials_key = _partials_key(job_id, kind='semi_open')
+
+        app = get_app()
+        with app.app_context():
+            _create_job_record(
+                job_id, self.request.id, user_id, kobo_system_path, raw_data_path,
+                output_kobo, output_raw, kobo_original_filename, raw_original_filename,
+                settings={
+                    'max_categories': max_categories,
+                    'create_merged_column': create_merged_column,
+                    'pairs': [pair['select_var'] for pair in pairs_to_process]
+                },
+                job_type='semi_open'
+            )
+
+        # Fan out: one subtask per pair, merge once all pairs are done
+        # Subtasks stay on the lane the scheduler picked for this job
+        queue = (self.request.delivery_info or {}).get('routing_key') or 'classification'
+        header = [
+            process_semi_open_pair.s(job_id, kobo_system_path, raw_data_path, pair,
+                                     max_categories, partials_key, total_pairs).set(queue=queue)
+            for pair in pairs_to_process
+        ]
+        callback = merge_semi_open_results.s(
+            job_id, kobo_system_path, raw_data_path, pairs_to_process,
+            output_kobo, output_raw, partials_key, max_categories, create_merged_column
+        ).set(queue=queue)
+        callback.on_error(chord_failed.s(job_id, partials_key))
+        result = chord(header)(callback)
+
+        print(f"[SEMI_OPEN TASK] Dispatched {total_pairs} pair subtasks (chord: {result.id})", flush=True)
+
+    except JobCancelled:
+        _mark_job_cancelled(app, job_id)
+        return {'job_id': job_id, 'status': 'cancelled'}
+
+    except Exception as e:
+        print(f"[SEMI_OPEN TASK ERROR] Starting job failed: {e}", flush=True)
+        _mark_job_error(app, job_id, str(e))
+        raise
+
+    return {'job_id': job_id, 'chord_id': result.id}
+
+
+@celery_app.task(bind=True, name='tasks.semi_open.process_semi_open_pair')
+def process_semi_open_pair(self, job_id, kobo_system_path, raw_data_path, pair,
+                           max_categories, partials_key, total_pairs):
+    """
+    Classify one semi open-ended pair and store its partial result
+
+    Only the pair's two columns are read from raw data. The merged columns,
+    new choices and summary are pickled and published to storage under
+    partials_key for the merge step.
+    Errors are returned (not raised) so the other pairs still get merged.
+
+    Returns:
+        dict: {'select_var', 'success', 'partial_path' (storage ref), 'summary' | 'message'}
+    """
+    import traceback
+    import pandas as pd
+    from semi_open_processor import SemiOpenProcessor
+
+    select_var = pair['select_var']
+    text_var = pair['text_var']
+
+    def set_pair_progress(status, percentage, step, **extra):
+        data = {
+            'status': status,
+            'progress': percentage,
+            'step': step,
+            'total': total_pairs,
+            'question': pair.get('select_label', '')
+        }
+        data.update(extra)
+        progress_tracker.set_variable_progress(job_id, select_var, data)
+        progress_tracker.refresh_overall_progress(job_id, total_pairs, f'[{select_var}] {step}')
+
+    print(f"[SEMI_OPEN PAIR] Processing {select_var} + {text_var}", flush=True)
+
+    if is_cancelled(job_id):
+        return {'select_var': select_var, 'success': False, 'message': 'Cancelled', 'cancelled': True}
+
+    pair_started_at = datetime.utcnow()
+    try:
+        set_pair_progress('processing', 0, "Extracting 'Lainnya' responses")
+
+        processor = SemiOpenProcessor(kobo_system_path, raw_data_path, None)
+        processor.load_data(columns=[select_var, text_var])
+        processor.parallel_classifier.cancel_check = cancel_checker(job_id)
+
+        def update_progress(message, percentage):
+            print(f"[SEMI_OPEN CALLBACK] {select_var}: {message} ({percentage}%)", flush=True)
+            set_pair_progress('processing', percentage, message)
+
+        result = processor.process_semi_open_pair(
+            pair,
+            progress_callback=update_progress,
+            max_categories=max_categories
+        )
+
+        if not result.get('success'):
+            set_pair_progress('completed', 100, result.get('message', 'Nothing to classify'))
+            return {'select_var': select_var, 'success': False, 'message': result.get('message')}
+
+        summary = {
+            'variable': select_var,
+            'text_variable': text_var,
+            'type': 'semi_open_ended',
+            'lainnya_code': pair['lainnya_code'],
+            'lainnya_responses': result['stats']['lainnya_responses'],
+            'new_categories_generated': len(result['new_categories']),
+            'new_categories': result['new_categories'],
+            'merged_column': result['merged_var'],
+            'pre_coded_categories': len(result['choice_labels']),
+            'total_categories': len(result['choice_labels']) + len(result['new_categories']),
+            'status': 'success',
+            'started_at': pair_started_at.isoformat(),
+            'completed_at': datetime.utcnow().isoformat()
+        }
+
+        storage = get_storage()
+        local_partial = storage.local_path(f'{partials_key}/{select_var}.pkl')
+        pd.to_pickle({
+            'merged_columns': result['merged_columns'],
+            'new_choices': result['new_choices'].to_dict('records'),
+            'category_code_map': result['category_code_map'],
+            'choice_labels': result['choice_labels'],
+            'response_rows': result['response_rows'],
+            'summary': summary
+        }, local_partial)
+        partial_path = storage.publish(local_partial)
+
+        set_pair_progress('completed', 100, 'Completed', summary=summary)
+        print(f"[SEMI_OPEN PAIR] {select_var} done: {summary['lainnya_responses']} 'Lainnya' -> "
+              f"{summary['new_categories_generated']} new categories", flush=True)
+
+        return {'select_var': select_var, 'success': True, 'partial_path': partial_path, 'summary': summary}
+
+    except JobCancelled:
+        print(f"[SEMI_OPEN PAIR] {select_var} stopped: job cancelled", flush=True)
+        return {'select_var': select_var, 'success': False, 'message': 'Cancelled', 'cancelled': True}
+
+    except Exception as e:
+        error_msg = str(e)
+        print(f"[SEMI_OPEN PAIR ERROR] {select_var}: {error_msg}", flush=True)
+        traceback.print_exc()
+        set_pair_progress('error', 100, f'Error: {error_msg}', error=error_msg)
+        return {'select_var': select_var, 'success': False, 'message': error_msg, 'error': True}
+
+
+@celery_app.task(bind=True, name='tasks.semi_open.merge_semi_open_results')
+def merge_semi_open_results(self, pair_results, job_id, kobo_system_path, raw_data_path,
+                            pairs_to_process, output_kobo, output_raw, partials_key,
+                            max_categories, create_merged_column):
+    """
+    Chord callback: combine all pair results into one workbook per output file
+
+    Raw data is read once and written once; kobo_system is patched in place
+    (new choices + merged survey fields) and saved once.
+
+    Returns:
+        dict: Job results (same shape as shown on the result page)
+    """
+    import traceback
+    import pandas as pd
+    from app import get_app, db
+    from app.models import ClassificationJob, ClassificationVariable
+    from app.dashboard_stats import record_job_completion
+    from app.response_store import store_responses
+    from kobo_form_patcher import KoboFormPatcher
+    from semi_open_processor import insert_merged_columns
+    from upload_store import delete_input
+    from tasks.classification import _mark_job_cancelled, _publish_outputs
+
+    app = get_app()
+    pairs_by_var = {pair['select_var']: pair for pair in pairs_to_process}
+
+    print(f"[SEMI_OPEN MERGE] Merging {len(pair_results)} pair results for job {job_id}", flush=True)
+
+    storage = get_storage()
+    if is_cancelled(job_id):
+        storage.delete_prefix(partials_key)
+        _mark_job_cancelled(app, job_id)
+        return {'job_id': job_id, 'status': 'cancelled'}
+
+    try:
+        progress_tracker.update_progress(job_id, progress=95, current_step='Merging results into output files...')
+
+        with app.app_context():
+            job = ClassificationJob.query.filter_by(job_id=job_id).first()
+            started_at = job.started_at if job and job.started_at else datetime.utcnow()
+
+        raw_df = pd.read_excel(storage.fetch(raw_data_path))
+        patcher = KoboFormPatcher(storage.fetch(kobo_system_path))
+
+        summaries = []
+        summary_rows = []
+        response_rows = []
+        failed = []
+
+        for pair_result in pair_results:
+            select_var = pair_result['select_var']
+
+            if not pair_result.get('success'):
+                if pair_result.get('error'):
+                    failed.append(f"{select_var}: {pair_result.get('message')}")
+                continue
+
+            partial = pd.read_pickle(storage.fetch(pair_result['partial_path']))
+            pair = pairs_by_var[select_var]
+            summary = partial['summary']
+
+            if create_merged_column:
+                insert_merged_columns(raw_df, select_var, partial['merged_columns'])
+
+                select_type = str(pair.get('select_type') or 'select_one').split()[0]
+                patcher.insert_survey_field_after(select_var, {
+                    'type': f"{select_type} {pair['list_name']}",
+                    'name': summary['merged_column'],
+                    'label': f"{pair.get('select_label') or select_var} - Merged",
+                    'required': False
+                })
+
+            patcher.append_choices(pair['list_name'], partial['new_choices'])
+
+            for code, label in partial['choice_labels'].items():
+                summary_rows.append({'Variable': select_var, 'Type': 'Pre-coded', 'Code': code,
+                                     'Label': label, 'Source': 'Original choices'})
+            for category, code in partial['category_code_map'].items():
+                summary_rows.append({'Variable': select_var, 'Type': 'New (from Lainnya)', 'Code': code,
+                                     'Label': category, 'Source': 'AI Classification'})
+
+            response_rows.extend(partial.get('response_rows', []))
+            summaries.append(summary)
+
+        if failed and not summaries:
+            raise RuntimeError('All semi open-ended pairs failed: ' + '; '.join(failed))
+
+        # Single write per output file
+        with pd.ExcelWriter(output_raw, engine='openpyxl') as writer:
+            raw_df.to_excel(writer, sheet_name='data', index=False)
+            pd.DataFrame(summary_rows).to_excel(writer, sheet_name='category_summary', index=False)
+        patcher.save(output_kobo)
+        patcher.close()
+        print(f"[SEMI_OPEN MERGE] Saved {os.path.basename(output_raw)} and {os.path.basename(output_kobo)}", flush=True)
+        _publish_outputs(output_kobo, output_raw)
+
+        end_time = datetime.utcnow()
+        results = {
+            'summaries': summaries,
+            'failed_pairs': failed,
+            'start_time': started_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'end_time': end_time.strftime('%Y-%m-%d %H:%M:%S'),
+            'duration': (end_time - started_at).total_seconds(),
+            'total_pairs': len(pairs_to_process),
+            'total_variables': len(pairs_to_process),
+            'processing_type': 'semi_open_ended',
+            'settings': {
+                'max_categories': max_categories,
+                'create_merged_column': create_merged_column
+            },
+            'output_files': {
+                'kobo': os.path.basename(output_kobo),
+                'raw': os.path.basename(output_raw)
+            }
+        }
+
+        with app.app_context():
+            job = ClassificationJob.query.filter_by(job_id=job_id).first()
+            if job:
+                for summary in summaries:
+                    db.session.add(ClassificationVariable(
+                        job_id=job.id,
+                        variable_name=summary['variable'],
+                        question_text=pairs_by_var[summary['variable']].get('select_label', ''),
+                        categories_generated=summary['new_categories_generated'],
+                        total_responses=summary['lainnya_responses'],
+                        valid_classified=summary['lainnya_responses'],
+                        categories=json.dumps(summary['new_categories']),
+                        started_at=datetime.fromisoformat(summary['started_at']) if summary.get('started_at') else started_at,
+                        completed_at=datetime.fromisoformat(summary['completed_at']) if summary.get('completed_at') else end_time,
+                        status='completed'
+                    ))
+                job.status = 'completed'
+                job.completed_at = end_time
+                job.progress = 100
+                job.current_step = f"Completed {len(summaries)}/{len(pairs_to_process)} pairs"
+                job.results_summary = json.dumps(results, default=str)
+                job.update_totals()
+                record_job_completion(job)
+                store_responses(job.id, response_rows)
+                db.session.commit()
+                print(f"[SEMI_OPEN MERGE] Updated ClassificationJob status to completed", flush=True)
+            else:
+                print(f"[SEMI_OPEN MERGE ERROR] Job {job_id} not found for completion update!", flush=True)
+
+        # Delete input files and partials (keep only output files)
+        try:
+            storage.delete_prefix(partials_key)
+            for path in (kobo_system_path, raw_data_path):
+                if delete_input(path):
+                    print(f"[SEMI_OPEN MERGE] Deleted input file: {os.path.basename(path)}", flush=True)
+        except Exception as delete_error:
+            print(f"[SEMI_OPEN MERGE WARNING] Failed to delete input files: {str(delete_error)}", flush=True)
+
+        progress_tracker.update_progress(
+            job_id,
+            status='completed',
+            completed=True,
+            progress=100,
+            completed_variables=len(pairs_to_process),
+            current_step='Semi open-ended processing completed',
+            completed_at=end_time.isoformat(),
+            results=results
+        )
+
+        print(f"[SEMI_OPEN MERGE] Job {job_id} completed successfully", flush=True)
+        job_finished(job_id)
+
+        # Full summary lives in ClassificationJob.results_summary; keep the Celery result small
+        return {'job_id': job_id, 'status': 'completed', 'pairs': len(summaries)}
+
+    except Exception as e:
+        error_msg = str(e)
+        print(f"[SEMI_OPEN MERGE ERROR] Merge failed: {error_msg}", flush=True)
+        traceback.print_exc()
+
+        try:
+            with app.app_context():
+                job = ClassificationJob.query.filter_by(job_id=job_id).first()
+                if job:
+                    job.status = 'error'
+                    job.error_message = error_msg
+                    job.completed_at = datetime.utcnow()
+                    db.session.commit()
+        except Exception as db_error:
+            print(f"[SEMI_OPEN MERGE] Failed to update database: {db_error}", flush=True)
+
+        progress_tracker.update_progress(
+            job_id,
+            status='error',
+            error_message=error_msg,
+            completed_at=datetime.utcnow().isoformat()
+        )
+        job_finished(job_id)
+
+        raise
+
+
+__all__ = ['process_semi_open_job', 'process_semi_open_pair', 'merge_semi_open_results']
@@ -0,0 +1,238 @@
+"""
+Upload Analysis Celery Task
+M-Code Pro - Post-upload analysis off the HTTP request
+
+/upload-files only saves both files and returns an analysis ID; this task
+(queue `analysis`) validates the raw data, detects open-ended variables and
+semi open-ended pairs and computes their statistics (raw data read ONCE).
+
+Everything about an upload lives server-side in Redis DB 2 (next to progress),
+keyed by the analysis ID - the session cookie only holds that ID:
+    upload-analysis:<analysis_id> -> JSON {'status', 'progress', 'step', 'error',
+                                           'user_id', 'upload': {paths, filenames, hashes}}
+    upload-profile:<kobo_sha256>:<raw_sha256>
+                                  -> compact_codec {'file_info', 'detected_variables',
+                                                    'semi_open_pairs'}
+Uploads are content-addressed (upload_store.py), so the profile is keyed by
+the content of both files: re-uploading the same pair reuses it without
+running this task (reuse_profile). Status: queued -> processing ->
+completed | error. State expires after UPLOAD_STATE_TTL (default 24h),
+profiles after UPLOAD_PROFILE_TTL (default 7 days, refreshed on reuse).
+"""
+
+import os
+import json
+import redis
+from datetime import datetime
+from typing import Any, Dict, Optional
+from dotenv import load_dotenv
+
+import compact_codec
+from celery_app import celery_app
+from upload_store import content_hash, delete_input
+
+load_dotenv()
+
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379')
+redis_client = redis.from_url(REDIS_URL + '/2', decode_responses=True)  # DB 2 (same as progress)
+raw_client = redis.from_url(REDIS_URL + '/2')  # same DB, bytes replies (packed profile)
+
+ANALYSIS_QUEUE = 'analysis'
+STATE_TTL = int(os.getenv('UPLOAD_STATE_TTL', '86400'))  # 24 hours
+PROFILE_TTL = int(os.getenv('UPLOAD_PROFILE_TTL', '604800'))  # 7 days
+
+# State fields the browser never sees (server paths, owner)
+PRIVATE_FIELDS = ('upload', 'user_id')
+
+
+def _key(analysis_id: str) -> str:
+    return f"upload-analysis:{analysis_id}"
+
+
+def _profile_key(kobo_hash: str, raw_hash: str) -> str:
+    return f"upload-profile:{kobo_hash}:{raw_hash}"
+
+
+def set_state(analysis_id: str, **fields):
+    """Merge fields into the analysis state (single writer: the task)"""
+    state = get_state(analysis_id) or {}
+    state.update(fields)
+    state['updated_at'] = datetime.utcnow().isoformat()
+    redis_client.setex(_key(analysis_id), STATE_TTL, json.dumps(state, default=str))
+
+
+def get_state(analysis_id: str) -> Optional[Dict[str, Any]]:
+    """Current analysis state, or None if unknown/expired"""
+    data = redis_client.get(_key(analysis_id))
+    return json.loads(data) if data else None
+
+
+def public_state(state: Dict[str, Any]) -> Dict[str, Any]:
+    """State without server-side fields (safe to return to the browser)"""
+    return {field: value for field, value in state.items() if field not in PRIVATE_FIELDS}
+
+
+def get_upload(analysis_id: Optional[str], user_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Saved files of an upload owned by user_id
+
+    Returns:
+        {'kobo_path', 'raw_path', 'kobo_hash', 'raw_hash',
+         'kobo_original_filename', 'raw_original_filename'} or None
+    """
+    state = get_state(analysis_id) if analysis_id else None
+    if not state or state.get('user_id') != user_id:
+        return None
+    return state.get('upload')
+
+
+def load_profile(upload: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Read the profile of an upload (from get_upload) written by analyze_upload
+
+    Returns:
+        {'file_info', 'detected_variables', 'semi_open_pairs'} or None
+    """
+    if not upload or not upload.get('kobo_hash') or not upload.get('raw_hash'):
+        return None
+    data = raw_client.get(_profile_key(upload['kobo_hash'], upload['raw_hash']))
+    return compact_codec.unpack(data) if data else None
+
+
+def _save_profile(kobo_hash: str, raw_hash: str, profile: Dict[str, Any]):
+    raw_client.setex(_profile_key(kobo_hash, raw_hash), PROFILE_TTL, compact_codec.pack(profile))
+
+
+def _completion_fields(profile: Dict[str, Any]) -> Dict[str, Any]:
+    variables = len(profile['detected_variables'])
+    pairs = len(profile['semi_open_pairs'])
+    return {
+        'status': 'completed',
+        'progress': 100,
+        'step': 'Analysis complete',
+        'message': (f'Files uploaded successfully. Detected {variables} open-ended and '
+                    f'{pairs} semi open-ended variables.'),
+        'variables': variables,
+        'pairs': pairs
+    }
+
+
+def reuse_profile(analysis_id: str, upload: Dict[str, Any], user_id: int) -> bool:
+    """
+    Complete an analysis from the stored profile of identical files (no task)
+
+    Args:
+        analysis_id: New analysis ID
+        upload: Upload dict (paths, filenames, kobo_hash, raw_hash)
+        user_id: Owner
+
+    Returns:
+        bool: True when a profile existed and the analysis is completed
+    """
+    key = _profile_key(upload['kobo_hash'], upload['raw_hash'])
+    data = raw_client.get(key)
+    if not data:
+        return False
+    raw_client.expire(key, PROFILE_TTL)
+    set_state(analysis_id, user_id=user_id, upload=upload, reused=True,
+              **_completion_fields(compact_codec.unpack(data)))
+    print(f"[UPLOAD ANALYSIS] {analysis_id}: reused profile of identical upload", flush=True)
+    return True
+
+
+def _remove_files(*paths):
+    for path in paths:
+        try:
+            delete_input(path)
+        except OSError as e:
+            print(f"[UPLOAD ANALYSIS WARNING] Failed to delete {path}: {e}", flush=True)
+
+
+@celery_app.task(bind=True, name='tasks.upload_analysis.analyze_upload')
+def analyze_upload(self, analysis_id, kobo_path, raw_path, profile_path=None):
+    """
+    Analyze an uploaded kobo_system + raw data pair
+
+    Args:
+        analysis_id: ID returned to the browser by /upload-files
+        kobo_path: Stored kobo_system file (storage ref)
+        raw_path: Stored raw data file (storage ref)
+        profile_path: Unused (profiles are stored in Redis); kept for queued tasks
+
+    Returns:
+        dict: {'analysis_id', 'status', 'variables', 'pairs'}
+    """
+    import time
+    import traceback
+    import pandas as pd
+    from app.utils import FileProcessor
+    from storage import get_storage
+
+    started = time.perf_counter()
+
+    def fail(error_msg):
+        print(f"[UPLOAD ANALYSIS] {analysis_id} failed: {error_msg}", flush=True)
+        _remove_files(kobo_path, raw_path)
+        set_state(analysis_id, status='error', error=error_msg, step='Failed')
+        return {'analysis_id': analysis_id, 'status': 'error'}
+
+    try:
+        set_state(analysis_id, status='processing', progress=5, step='Reading raw data...')
+        storage = get_storage()
+        kobo_file, raw_file = storage.fetch(kobo_path), storage.fetch(raw_path)
+        file_processor = FileProcessor(os.path.dirname(raw_file))
+        try:
+            df = pd.read_excel(raw_file, sheet_name=0)
+        except Exception as e:
+            return fail(f"Error reading Excel: {str(e)}")
+
+        is_valid, error_msg = file_processor.validate_excel_structure(raw_file, df=df)
+        if not is_valid:
+            return fail(error_msg)
+
+        file_info = file_processor.get_file_info(raw_file, df=df)
+
+        set_state(analysis_id, progress=30, step='Detecting variables...')
+        detected_vars = file_processor.detect_open_ended_variables(kobo_file)
+        semi_open_pairs = file_processor.detect_semi_open_pairs(kobo_file)
+
+        if not detected_vars and not semi_open_pairs:
+            return fail('No open-ended or semi open-ended variables detected. '
+                        'Please check kobo_system file structure.')
+
+        # Statistics from the DataFrame loaded above (no re-read per variable)
+        total = len(detected_vars) + len(semi_open_pairs)
+        done = 0
+        for var in detected_vars:
+            var.update(file_processor.get_variable_statistics(raw_file, var['name'], df=df))
+            done += 1
+            set_state(analysis_id, progress=40 + int(done / total * 55), step=f"Statistics: {var['name']}")
+
+        for pair in semi_open_pairs:
+            pair.update(file_processor.get_semi_open_statistics(raw_file, pair, df=df))
+            done += 1
+            set_state(analysis_id, progress=40 + int(done / total * 55), step=f"Statistics: {pair['select_var']}")
+
+        _save_profile(content_hash(kobo_path), content_hash(raw_path), {
+            'file_info': file_info,
+            'detected_variables': detected_vars,
+            'semi_open_pairs': semi_open_pairs
+        })
+
+        set_state(analysis_id, **_completion_fields({
+            'detected_variables': detected_vars,
+            'semi_open_pairs': semi_open_pairs
+        }))
+        print(f"[UPLOAD ANALYSIS] {analysis_id}: {len(detected_vars)} variables, {len(semi_open_pairs)} pairs "
+              f"in {time.perf_counter() - started:.1f}s", flush=True)
+
+        return {'analysis_id': analysis_id, 'status': 'completed',
+                'variables': len(detected_vars), 'pairs': len(semi_open_pairs)}
+
+    except Exception as e:
+        traceback.print_exc()
+        return fail(str(e))
+
+
+__all__ = ['analyze_upload', 'get_state', 'set_state', 'public_state', 'get_upload', 'load_profile',
+           'reuse_profile', 'ANALYSIS_QUEUE']
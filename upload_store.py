@@ -0,0 +1,113 @@
+"""
+Content-Addressed Upload Store
+Upload disimpan dengan nama = SHA-256 isi file (dihitung sambil streaming ke
+disk), jadi upload ulang file yang sama tidak menulis copy baru dan semua
+cache turunan bisa di-key dengan hash yang sama:
+- profile hasil analisis upload (tasks/upload_analysis.py)
+- columnar cache raw data (columnar_cache.ensure_columnar_cache)
+- compiled form schema (FormSchema.file_hash_for pakai nama file)
+
+Layout: key uploads/<sha256><ext> di storage.py (backend local:
+files/uploads/3f2a...c9.xlsx; backend s3: s3://<bucket>/uploads/3f2a...c9.xlsx).
+Fungsi di sini menerima/mengembalikan reference storage, bukan path lokal.
+
+File content-addressed dipakai bersama oleh beberapa upload/job, jadi TIDAK
+dihapus saat job selesai (delete_input() melewatinya); file lama dibersihkan
+oleh prune_uploads() (dijadwalkan tasks/janitor.py sweep).
+"""
+import os
+import time
+import uuid
+import hashlib
+from typing import Iterable, Tuple
+
+from form_schema import compute_file_hash, CONTENT_ADDRESSED_NAME as HASH_NAME
+from storage import get_storage
+
+CHUNK_SIZE = 1024 * 1024
+UPLOAD_PREFIX = 'uploads'
+
+
+def is_content_addressed(path: str) -> bool:
+    """True when path is a content-addressed upload (<sha256><ext>)"""
+    return bool(path) and bool(HASH_NAME.match(os.path.splitext(os.path.basename(path))[0]))
+
+
+def content_hash(path: str) -> str:
+    """SHA-256 of a file: taken from the name for stored uploads, hashed otherwise"""
+    if is_content_addressed(path):
+        return os.path.splitext(os.path.basename(path))[0]
+    return compute_file_hash(get_storage().fetch(path))
+
+
+def save_stream(stream, extension: str) -> Tuple[str, str, bool]:
+    """
+    Stream an upload to disk while hashing it, then store it under its hash
+
+    Args:
+        stream: Readable binary stream (FileStorage.stream)
+        extension: File extension incl. dot ('.xlsx')
+
+    Returns:
+        tuple: (ref, sha256, reused) - reused=True when the content was already stored
+    """
+    storage = get_storage()
+    digest = hashlib.sha256()
+    tmp_path = storage.local_path(f'{UPLOAD_PREFIX}/.upload_{uuid.uuid4().hex}.tmp')
+
+    try:
+        with open(tmp_path, 'wb') as f:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+                f.write(chunk)
+
+        file_hash = digest.hexdigest()
+        key = f'{UPLOAD_PREFIX}/{file_hash}{extension.lower()}'
+        ref = storage.ref(key)
+
+        if storage.exists(ref):
+            os.remove(tmp_path)
+            storage.touch(ref)  # keep it away from prune_uploads()
+            return ref, file_hash, True
+
+        path = storage.local_path(key)
+        os.replace(tmp_path, path)
+        # Runs on the web host: no local copy kept there (workers fetch their own)
+        return storage.publish(path, keep_local=False), file_hash, False
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def delete_input(path: str) -> bool:
+    """
+    Delete a job file (storage ref) unless it is a shared content-addressed upload
+
+    Returns:
+        bool: True when the file was removed
+    """
+    if not path or is_content_addressed(path):
+        return False
+    return get_storage().delete(path)
+
+
+def prune_uploads(max_age_seconds: int, keep: Iterable[str] = ()) -> Tuple[int, int]:
+    """
+    Remove content-addressed uploads not written or re-uploaded for max_age_seconds
+
+    Args:
+        max_age_seconds: Minimum age of a removed upload
+        keep: Refs still needed (inputs of queued/running jobs)
+
+    Returns:
+        tuple: (files removed, bytes reclaimed)
+    """
+    storage = get_storage()
+    cutoff = time.time() - max_age_seconds
+    keep = set(keep)
+    stale = [ref for ref, modified, _ in storage.iter_objects(UPLOAD_PREFIX)
+             if is_content_addressed(ref) and modified < cutoff and ref not in keep]
+    return storage.delete_many(stale)
+
+
+__all__ = ['save_stream', 'content_hash', 'is_content_addressed', 'delete_input', 'prune_uploads']
@@ -0,0 +1,83 @@
+"""
+Worker Boot Timing Report
+M-Code Pro - Where does Celery worker start-up time go?
+
+Runs each start-up stage in a fresh interpreter with `python -X importtime`
+and sums import time per top-level package:
+- worker boot:  what `celery -A celery_app worker` imports before any task
+- shared app:   app.get_app() (Flask app + models, no blueprints/create_all)
+- first task:   modules a classification task imports lazily on first use
+
+Usage:
+    python worker_boot_report.py
+    python worker_boot_report.py --top 25
+"""
+
+import os
+import sys
+import argparse
+import subprocess
+from collections import defaultdict
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+STAGES = [
+    ('worker boot', 'import celery_app'),
+    ('shared app', 'import celery_app; from app import get_app; get_app()'),
+    ('first task', 'import celery_app; from app import get_app; get_app(); '
+                   'import excel_classifier, semi_open_processor, openai_classifier, columnar_cache'),
+]
+
+
+def measure(code: str):
+    """
+    Run code with -X importtime
+
+    Returns:
+        (total_seconds, {package: self_seconds}, error or None)
+    """
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=BASE_DIR, capture_output=True, text=True
+    )
+
+    per_package = defaultdict(float)
+    total_us = 0
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        self_us, cumulative_us, name = int(self_us), int(cumulative_us), name[1:]
+        per_package[name.strip().split('.')[0]] += self_us / 1e6
+        if not name.startswith(' '):
+            total_us += cumulative_us  # top-level imports only (cumulative)
+
+    error = None
+    if proc.returncode != 0:
+        error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f'exit code {proc.returncode}'
+    return total_us / 1e6, dict(per_package), error
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Worker start-up import timing')
+    parser.add_argument('--top', type=int, default=15, help='Packages to show per stage')
+    args = parser.parse_args()
+
+    previous = {}
+    for stage, code in STAGES:
+        total, per_package, error = measure(code)
+        print(f"\n{'=' * 60}\n{stage.upper()}: {total:.2f}s imports\n{'=' * 60}")
+        if error:
+            print(f"   [FAILED] {error}")
+            continue
+
+        # Only what this stage adds on top of the previous one
+        added = {pkg: secs - previous.get(pkg, 0.0) for pkg, secs in per_package.items()}
+        for pkg, secs in sorted(added.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+            if secs >= 0.001:
+                print(f"   {pkg:<30} {secs * 1000:8.0f} ms")
+        previous = per_package
+
+
+if __name__ == '__main__':
+    main()